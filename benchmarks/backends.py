@@ -0,0 +1,109 @@
+"""Comparison of the process and thread backends of a sphere pipeline.
+
+Runs a mock reader and a probe stage, that measures the delay between the
+timestamp of every sample and its arrival, with both backends, and reports startup
+time, end-to-end latency and CPU time:
+
+    python benchmarks/backends.py --rate 1000 --duration 5
+
+CPU time includes the main process and its children, so it is comparable between
+the backends.
+"""
+import argparse
+import resource
+import time
+
+import numpy as np
+import pandas as pd
+
+from sisyphy.hardware_readers import MockSphereReaderProcess
+from sisyphy.utils.backends import make_queue, run_in
+from sisyphy.utils.custom_queue import SaturatingQueue
+from sisyphy.utils.process import TerminableProcess, WakeableEvent, stop_processes
+from sisyphy.utils.timebase import monotonic_ns
+
+
+class LatencyProbe(TerminableProcess):
+    """Stage receiving samples, and recording how long after their timestamp."""
+
+    def __init__(self, *args, data_queue=None, result_queue=None, **kwargs):
+        super().__init__(*args, wake_sources=[data_queue], **kwargs)
+        self.data_queue = data_queue
+        self.result_queue = result_queue
+        self.started_event = WakeableEvent()
+
+    def before_loop(self) -> None:
+        self._latencies_ns = []
+        self.started_event.set()
+
+    def loop(self) -> None:
+        now = monotonic_ns()
+        self._latencies_ns += [now - sample.t_ns for sample in self.data_queue.get_all()]
+
+    def after_loop(self) -> None:
+        self.result_queue.put(np.array(self._latencies_ns))
+
+
+def _cpu_s():
+    return sum(
+        usage.ru_utime + usage.ru_stime
+        for usage in (
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+        )
+    )
+
+
+def run_pipeline(backend, rate_hz, duration_s):
+    kill_event = WakeableEvent()
+    data_queue = make_queue(backend)
+    result_queue = SaturatingQueue()
+    reader = run_in(
+        MockSphereReaderProcess(
+            kill_event, data_queue=data_queue, sample_rate_hz=rate_hz
+        ),
+        backend,
+    )
+    probe = run_in(
+        LatencyProbe(kill_event, data_queue=data_queue, result_queue=result_queue),
+        backend,
+    )
+
+    cpu_start_s = _cpu_s()
+    t_start_ns = monotonic_ns()
+    reader.start()
+    probe.start()
+    probe.started_event.wait()
+    startup_s = (monotonic_ns() - t_start_ns) * 1e-9
+    time.sleep(duration_s)
+    report = stop_processes([reader, probe], kill_event)
+    latencies_us = result_queue.get(timeout=5) / 1e3
+    cpu_s = _cpu_s() - cpu_start_s
+
+    latencies_us = latencies_us[len(latencies_us) // 10 :]  # skip startup
+    return dict(
+        backend=backend,
+        startup_s=startup_s,
+        n_samples=len(latencies_us),
+        latency_median_us=np.median(latencies_us),
+        latency_p99_us=np.percentile(latencies_us, 99),
+        cpu_percent=100 * cpu_s / (duration_s + report.stop_time_s),
+        clean_stop=report.clean,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rate", type=float, default=1000.0, help="sampling rate (Hz)")
+    parser.add_argument("--duration", type=float, default=5.0, help="duration (s)")
+    args = parser.parse_args(argv)
+
+    results = [
+        run_pipeline(backend, args.rate, args.duration)
+        for backend in ["process", "thread"]
+    ]
+    print(pd.DataFrame(results).set_index("backend").round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Cost of a log call of the ConcurrenceLogger.
+
+Logs queue events, synchronization events and messages in a loop, and reports the
+time per call (best of several repeats), and the time per entry of writing them to
+the files afterwards (which the background thread of the logger usually does):
+
+    python benchmarks/logger_overhead.py --calls 200000
+"""
+
+import argparse
+import tempfile
+import time
+from enum import Enum
+
+from sisyphy.process_logger import ConcurrenceLogger
+
+
+class _Events(Enum):
+    START = 1
+
+
+def time_calls(logger, log_call, args, n_calls, n_repeats=5):
+    """Best times per call of `log_call(*args)` and per entry of the following flush
+    over `n_repeats` loops, in us.
+    """
+    best_call, best_flush = float("inf"), float("inf")
+    for _ in range(n_repeats):
+        t0 = time.perf_counter()
+        for _ in range(n_calls):
+            log_call(*args)
+        t1 = time.perf_counter()
+        logger.flush()
+        t2 = time.perf_counter()
+        best_call = min(best_call, (t1 - t0) / n_calls)
+        best_flush = min(best_flush, (t2 - t1) / n_calls)
+    return best_call * 1e6, best_flush * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--calls", type=int, default=200000, help="calls per loop")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Entries are only written by the explicit flushes:
+        logger = ConcurrenceLogger(
+            "benchmark",
+            directory=directory,
+            buffer_records=args.calls + 1,
+            flush_interval_s=3600.0,
+        )
+        calls = dict(
+            log_queue=(logger.log_queue, ("data", True)),
+            log_event=(logger.log_event, (_Events.START, True, True)),
+            log_message=(logger.log_message, ("message",)),
+        )
+        for name, (log_call, call_args) in calls.items():
+            call_us, flush_us = time_calls(
+                logger, log_call, call_args, args.calls, args.repeats
+            )
+            print(f"{name:12s} {call_us:.3f} us per call, {flush_us:.3f} us per write")
+        logger.close()
+
+
+if __name__ == "__main__":
+    main()
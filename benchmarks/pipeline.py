@@ -0,0 +1,506 @@
+"""Throughput and latency of sphere pipelines, over different transports.
+
+Runs every combination of a reader (mock or replay), a transport between the
+reader and the consumer, and a consumer (a probe, that only receives the samples,
+or a recorder, that also writes them to a CSV file as a FileDataStreamer does), at
+each sampling rate, and reports:
+
+- throughput: samples received by the consumer per second;
+- latency: percentiles (p50, p99, p999) of the delay between the timestamp of a
+  sample in the reader and its arrival in the consumer;
+- CPU time of the reader and of the consumer loops, as a fraction of the duration;
+- drops: samples lost on the way (output queue full, or overwritten in shared
+  memory before they were read).
+
+Transports:
+
+- queue: SaturatingQueue (pickled items, feeder thread, drops when full);
+- pipe: one-way multiprocessing Pipe (pickled items, the reader blocks when full);
+- shared: ColumnarRingBuffer in shared memory, polled by the consumer every
+  `--poll-interval` s;
+- arrayqueue: arrayqueues.ArrayQueue (rows of a numpy array in shared memory, with
+  their indices in a queue), if arrayqueues is installed.
+
+Results are saved as JSON, and can be compared with those of an earlier run, to
+catch regressions:
+
+    python benchmarks/pipeline.py --duration 5 --output results.json
+    python benchmarks/pipeline.py --duration 5 --compare results.json
+
+The comparison exits with status 1 if any configuration has a lower throughput,
+higher p99 latency or more drops than the baseline, beyond `--tolerance`.
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from multiprocessing import Pipe, RawValue
+from pathlib import Path
+from queue import Empty, Full
+
+import numpy as np
+import pandas as pd
+
+from reader_jitter import write_replay_data
+from sisyphy.hardware_readers import MockSphereReaderProcess, ReplaySphereReaderProcess
+from sisyphy.utils.custom_queue import SaturatingQueue, _StreamMixin
+from sisyphy.utils.metrics import MetricsRegistry
+from sisyphy.utils.process import TerminableProcess, WakeableEvent, stop_processes
+from sisyphy.utils.ring_buffer import ColumnarRingBuffer
+from sisyphy.utils.timebase import monotonic_ns
+
+try:
+    from arrayqueues import ArrayQueue
+except ImportError:
+    ArrayQueue = None
+
+COLUMNS = ["x0", "y0", "x1", "y1"]
+# Metrics compared with the baseline, and whether higher values are better:
+COMPARED = dict(throughput_hz=True, latency_p99_us=False, drop_fraction=False)
+# Increases below these are not regressions, whatever the relative change:
+_NOISE = dict(latency_p99_us=50.0, drop_fraction=0.001)
+
+
+def _as_arrays(items):
+    """Times and (n_columns, n) values of a list of samples."""
+    return (
+        np.array([s.t_ns for s in items], dtype=np.int64),
+        np.array([[getattr(s, c) for s in items] for c in COLUMNS], dtype=np.float64),
+    )
+
+
+# Transports. The reader writes to them as to its data queue (put, end_stream,
+# close, join_thread); the consumer reads with receive(), and waits on
+# `wake_source` (or polls, if None).
+
+
+class QueueTransport:
+    name = "queue"
+
+    def __init__(self, maxsize: int = 10000):
+        self.queue = SaturatingQueue(maxsize=maxsize)
+        self.wake_source = self.queue
+        self.n_lost = 0
+
+    def put(self, item, **kwargs) -> bool:
+        return self.queue.put(item)
+
+    def end_stream(self, sender: str = "") -> bool:
+        return self.queue.end_stream(sender=sender)
+
+    def close(self) -> None:
+        self.queue.close()
+
+    def join_thread(self) -> None:
+        self.queue.join_thread()
+
+    def receive(self):
+        """Times and values of the new samples, and whether the stream ended."""
+        return (*_as_arrays(self.queue.get_all()), self.queue.stream_ended)
+
+
+class PipeTransport(_StreamMixin):
+    name = "pipe"
+
+    def __init__(self):
+        self._receiver, self._sender = Pipe(duplex=False)
+        self.wake_source = self._receiver
+        self.n_lost = 0
+
+    def put(self, item, **kwargs) -> bool:
+        self._sender.send(item)
+        return True
+
+    def _put_blocking(self, item, timeout: float = None) -> None:
+        self._sender.send(item)
+
+    def get(self, block: bool = True, timeout: float = None):
+        if not self._receiver.poll(timeout if block else 0):
+            raise Empty
+        return self._receiver.recv()
+
+    def close(self) -> None:
+        self._sender.close()
+
+    def join_thread(self) -> None:
+        pass
+
+    def receive(self):
+        return (*_as_arrays(self.get_all()), self.stream_ended)
+
+
+class SharedRingTransport:
+    name = "shared"
+
+    def __init__(self, capacity: int = 2 ** 16):
+        self.buffer = ColumnarRingBuffer(COLUMNS, capacity=capacity)
+        self._ended = RawValue("b", 0)
+        self.wake_source = None
+        self.n_lost = 0
+        self._next = 0  # absolute index of the next sample to read
+
+    def put(self, item, **kwargs) -> bool:
+        self.buffer.append(item.t_ns, [getattr(item, c) for c in COLUMNS])
+        return True  # old samples are overwritten, see n_lost
+
+    def end_stream(self, sender: str = "") -> bool:
+        self._ended.value = 1
+        return True
+
+    def close(self) -> None:
+        pass
+
+    def join_thread(self) -> None:
+        pass
+
+    def receive(self):
+        ended = bool(self._ended.value)  # before reading, so that nothing is missed
+        first = max(self._next, self.buffer.n_written - self.buffer.capacity)
+        self.n_lost += first - self._next
+        times, values = self.buffer.read_from(first)
+        self._next = first + len(times)
+        return times, values, ended
+
+
+class ArrayQueueTransport:
+    name = "arrayqueue"
+
+    def __init__(self, max_mbytes: float = 10):
+        self.queue = ArrayQueue(max_mbytes=max_mbytes)
+        self.wake_source = self.queue.queue  # queue of the indices of the rows
+        self.n_lost = 0
+
+    def put(self, item, **kwargs) -> bool:
+        row = np.array([item.t_ns] + [getattr(item, c) for c in COLUMNS], np.float64)
+        try:
+            self.queue.put(row)
+        except Full:
+            return False
+        return True
+
+    def end_stream(self, sender: str = "") -> bool:
+        self.queue.put(np.full(len(COLUMNS) + 1, np.nan))  # end of stream sentinel
+        return True
+
+    def close(self) -> None:
+        pass
+
+    def join_thread(self) -> None:
+        pass
+
+    def receive(self):
+        rows, ended = [], False
+        while not ended:
+            try:
+                row = self.queue.get(block=False)
+            except Empty:
+                break
+            ended = np.isnan(row[0])
+            if not ended:
+                rows.append(row)
+        rows = np.array(rows).reshape(-1, len(COLUMNS) + 1)
+        return rows[:, 0].astype(np.int64), rows[:, 1:].T, ended
+
+
+def _arrayqueues_error():
+    """Why ArrayQueueTransport cannot be used here, None if it can."""
+    if ArrayQueue is None:
+        return "arrayqueues is not installed"
+    try:  # e.g. arrayqueues 1.4 does not work with numpy 2
+        queue = ArrayQueue(max_mbytes=0.001)
+        queue.put(np.zeros(len(COLUMNS) + 1))
+        queue.get(timeout=1)
+    except Exception as e:
+        return f"arrayqueues does not work here ({e!r})"
+    return None
+
+
+TRANSPORTS = dict(
+    queue=QueueTransport,
+    pipe=PipeTransport,
+    shared=SharedRingTransport,
+    arrayqueue=ArrayQueueTransport,
+)
+
+
+class Consumer(TerminableProcess):
+    """Stage receiving samples from a transport, and recording how long after their
+    timestamp they arrive; with `record_to`, samples are also written to a CSV file.
+    """
+
+    def __init__(
+        self,
+        *args,
+        transport=None,
+        result_queue=None,
+        record_to=None,
+        poll_interval_s: float = 0.0005,
+        drain_timeout_s: float = 2.0,
+        **kwargs,
+    ):
+        if transport.wake_source is not None:
+            kwargs.update(wake_sources=[transport.wake_source])
+        else:
+            kwargs.update(rate_hz=1 / poll_interval_s)
+        super().__init__(*args, **kwargs)
+        self.transport = transport
+        self.result_queue = result_queue
+        self.record_to = record_to
+        self.drain_timeout_s = drain_timeout_s
+        self.started_event = WakeableEvent()
+
+    def before_loop(self) -> None:
+        self._latencies_ns = []
+        self._ended = False
+        self._outfile, self._writer = None, None
+        if self.record_to is not None:
+            self._outfile = open(self.record_to, "w", newline="")
+            self._writer = csv.writer(self._outfile)
+            self._writer.writerow(["t_ns"] + COLUMNS)
+        self.started_event.set()
+
+    def _receive(self) -> None:
+        times, values, self._ended = self.transport.receive()
+        if len(times) > 0:
+            self._latencies_ns.append(monotonic_ns() - times)
+            if self._writer is not None:
+                self._writer.writerows(zip(times, *values))
+            self.monitor.count(len(times))
+
+    def loop(self) -> None:
+        self._receive()
+        if self._ended:
+            self.request_stop()
+
+    def after_loop(self) -> None:
+        deadline_ns = monotonic_ns() + int(self.drain_timeout_s * 1e9)
+        while not self._ended and monotonic_ns() < deadline_ns:
+            self._receive()
+            time.sleep(0.001)
+        if self._outfile is not None:
+            self._outfile.close()
+        self.result_queue.put(
+            dict(
+                latencies_ns=np.concatenate(self._latencies_ns + [np.zeros(0, int)]),
+                n_lost=self.transport.n_lost,
+            )
+        )
+
+
+def _percentile(values, q):
+    return np.percentile(values, q) if len(values) > 0 else np.nan
+
+
+def run_pipeline(
+    make_reader,
+    transport_name,
+    consumer_name,
+    rate_hz,
+    duration_s,
+    tmp_dir,
+    poll_interval_s=0.0005,
+):
+    """Run a reader and a consumer for `duration_s`, and return their statistics."""
+    kill_event = WakeableEvent()
+    transport = TRANSPORTS[transport_name]()
+    result_queue = SaturatingQueue()
+    registry = MetricsRegistry(["reader", "consumer"])
+    reader = make_reader(
+        kill_event,
+        data_queue=transport,
+        metrics=registry.stage("reader"),
+    )
+    consumer = Consumer(
+        kill_event,
+        transport=transport,
+        result_queue=result_queue,
+        record_to=(
+            Path(tmp_dir) / "recorded.csv" if consumer_name == "recorder" else None
+        ),
+        poll_interval_s=poll_interval_s,
+        metrics=registry.stage("consumer"),
+    )
+
+    consumer.start()
+    consumer.started_event.wait(timeout=10)
+    reader.start()
+    time.sleep(duration_s)
+    kill_event.set()
+    # Get the results before joining: the consumer exits only once they are flushed.
+    result = result_queue.get(timeout=10)
+    report = stop_processes([reader, consumer], kill_event, timeout_s=10)
+    metrics = registry.snapshot()
+
+    latencies_us = result["latencies_ns"] / 1e3
+    n_received = len(latencies_us)
+    latencies_us = latencies_us[n_received // 10 :]  # skip startup
+    n_produced = metrics["reader"]["samples_total"]
+    n_dropped = metrics["reader"]["drops_total"] + result["n_lost"]
+    return dict(
+        transport=transport_name,
+        consumer=consumer_name,
+        rate_hz=rate_hz,
+        n_produced=int(n_produced),
+        n_received=n_received,
+        throughput_hz=n_received / duration_s,
+        latency_p50_us=_percentile(latencies_us, 50),
+        latency_p99_us=_percentile(latencies_us, 99),
+        latency_p999_us=_percentile(latencies_us, 99.9),
+        reader_cpu_percent=100 * metrics["reader"]["cpu_seconds_total"] / duration_s,
+        consumer_cpu_percent=100
+        * metrics["consumer"]["cpu_seconds_total"]
+        / duration_s,
+        drops=int(n_dropped),
+        drop_fraction=n_dropped / max(n_produced, 1),
+        clean_stop=report.clean,
+    )
+
+
+def run_benchmarks(
+    readers, transports, consumers, rates_hz, duration_s, poll_interval_s=0.0005
+):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rate_hz in rates_hz:
+            replay_file = Path(tmp_dir) / f"replay_{rate_hz:g}.csv"
+            write_replay_data(replay_file, rate_hz)
+            make_readers = dict(
+                mock=lambda *a, **kw: MockSphereReaderProcess(
+                    *a, sample_rate_hz=rate_hz, **kw
+                ),
+                replay=lambda *a, **kw: ReplaySphereReaderProcess(
+                    *a, filename=replay_file, **kw
+                ),
+            )
+            for reader_name in readers:
+                for transport_name in transports:
+                    for consumer_name in consumers:
+                        print(
+                            f"{reader_name} -> {transport_name} -> {consumer_name}"
+                            f" at {rate_hz:g} Hz"
+                        )
+                        result = run_pipeline(
+                            make_readers[reader_name],
+                            transport_name,
+                            consumer_name,
+                            rate_hz,
+                            duration_s,
+                            tmp_dir,
+                            poll_interval_s,
+                        )
+                        results.append(dict(reader=reader_name, **result))
+    return results
+
+
+def _key(result):
+    return tuple(result[k] for k in ["reader", "transport", "consumer", "rate_hz"])
+
+
+def compare(results, baseline_results, tolerance: float = 0.25):
+    """Regressions from the baseline: configurations of both runs for which a compared
+    metric is worse by more than `tolerance` (relative), as a list of dictionaries.
+    """
+    baseline = {_key(r): r for r in baseline_results}
+    regressions = []
+    for result in results:
+        previous = baseline.get(_key(result))
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            new, old = result[metric], previous[metric]
+            if higher_is_better:
+                worse = new < old * (1 - tolerance)
+            else:
+                # Small absolute changes of small values (e.g. 0 drops) are noise:
+                worse = new > old * (1 + tolerance) and new - old > _NOISE[metric]
+            if worse:
+                regressions.append(
+                    dict(
+                        zip(
+                            ["reader", "transport", "consumer", "rate_hz"], _key(result)
+                        ),
+                        metric=metric,
+                        baseline=old,
+                        value=new,
+                    )
+                )
+    return regressions
+
+
+def _meta(args):
+    return dict(
+        date=datetime.now().isoformat(timespec="seconds"),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        processor=platform.processor(),
+        cpu_count=os.cpu_count(),
+        duration_s=args.duration,
+        poll_interval_s=args.poll_interval,
+    )
+
+
+def _jsonable(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--readers", nargs="+", default=["mock", "replay"])
+    parser.add_argument("--transports", nargs="+", default=list(TRANSPORTS))
+    parser.add_argument("--consumers", nargs="+", default=["probe", "recorder"])
+    parser.add_argument(
+        "--rates", type=float, nargs="+", default=[100.0, 1000.0, 10000.0]
+    )
+    parser.add_argument("--duration", type=float, default=5.0, help="per run, s")
+    parser.add_argument(
+        "--poll-interval", type=float, default=0.0005, help="for shared memory, s"
+    )
+    parser.add_argument("--output", type=Path, help="JSON file for the results")
+    parser.add_argument("--compare", type=Path, help="JSON results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    transports = args.transports
+    if "arrayqueue" in transports and _arrayqueues_error() is not None:
+        print(f"{_arrayqueues_error()}, skipping the arrayqueue transport.")
+        transports = [t for t in transports if t != "arrayqueue"]
+
+    results = run_benchmarks(
+        args.readers,
+        transports,
+        args.consumers,
+        args.rates,
+        args.duration,
+        args.poll_interval,
+    )
+    results = [{k: _jsonable(v) for k, v in r.items()} for r in results]
+    print(
+        pd.DataFrame(results)
+        .set_index(["reader", "transport", "consumer", "rate_hz"])
+        .round(1)
+        .to_string()
+    )
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(dict(meta=_meta(args), results=results), f, indent=2)
+        print(f"Saved results to {args.output}.")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        print(f"Compared with {args.compare} ({baseline['meta']['date']}):")
+        if len(regressions) > 0:
+            print(pd.DataFrame(regressions).to_string(index=False))
+            sys.exit(1)
+        print("no regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Timing jitter of the sphere readers, with and without process tuning.
+
+Runs the mock and the replay readers at a fixed rate, optionally while other
+processes load the CPUs, and reports the deviations of the intervals between
+samples from the nominal period:
+
+    python benchmarks/reader_jitter.py --rate 1000 --duration 5 --load 4 --cpus 1
+
+Real-time scheduling and memory locking usually require root privileges (or the
+CAP_SYS_NICE / CAP_IPC_LOCK capabilities); settings that cannot be applied are
+reported by the readers at startup.
+"""
+import argparse
+import tempfile
+import time
+from multiprocessing import Event, Process
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sisyphy.hardware_readers import MockSphereReaderProcess, ReplaySphereReaderProcess
+from sisyphy.utils.realtime import ProcessTuning
+
+
+def _busy_loop(kill_event):
+    while not kill_event.is_set():
+        sum(range(1000))
+
+
+def write_replay_data(filename, rate_hz, n_samples=10000):
+    """Sphere data at `rate_hz`, in the format saved by a FileDataStreamer."""
+    rng = np.random.default_rng(0)
+    pd.DataFrame(
+        dict(
+            t_ns=np.arange(n_samples, dtype=np.int64) * int(1e9 / rate_hz),
+            **{c: rng.integers(-127, 127, n_samples) for c in ["x0", "y0", "x1", "y1"]},
+        )
+    ).to_csv(filename, index=False)
+
+
+def measure_jitter(reader, rate_hz, duration_s):
+    """Start a reader, collect its samples for `duration_s`, and return statistics of
+    the deviations of the intervals between samples from the nominal period (in us).
+    """
+    reader.start()
+    time.sleep(duration_s)
+    reader.kill_event.set()
+    samples, _ = reader.data_queue.get_until_end(timeout=5)
+    reader.join()
+
+    t_ns = np.array([s.t_ns for s in samples])
+    t_ns = t_ns[len(t_ns) // 10 :]  # skip startup
+    deviations_us = np.abs(np.diff(t_ns) - 1e9 / rate_hz) / 1e3
+    return dict(
+        n_samples=len(t_ns),
+        std_us=np.std(deviations_us),
+        p99_us=np.percentile(deviations_us, 99),
+        max_us=np.max(deviations_us),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rate", type=float, default=1000.0, help="sample rate, Hz")
+    parser.add_argument("--duration", type=float, default=5.0, help="per run, s")
+    parser.add_argument("--load", type=int, default=0, help="CPU-loading processes")
+    parser.add_argument("--cpus", type=int, nargs="*", default=None, help="reader cores")
+    parser.add_argument("--nice", type=int, default=-10)
+    parser.add_argument("--realtime-priority", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    tuning = ProcessTuning(
+        cpus=args.cpus,
+        nice=args.nice,
+        realtime_priority=args.realtime_priority,
+        lock_memory=True,
+        gc_mode="freeze",
+    )
+
+    load_kill_event = Event()
+    load = [Process(target=_busy_loop, args=(load_kill_event,)) for _ in range(args.load)]
+    for p in load:
+        p.start()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        replay_file = Path(tmp_dir) / "replay_data.csv"
+        write_replay_data(replay_file, args.rate)
+        readers = dict(
+            mock=lambda t: MockSphereReaderProcess(sample_rate_hz=args.rate, tuning=t),
+            replay=lambda t: ReplaySphereReaderProcess(filename=replay_file, tuning=t),
+        )
+        for reader_name, make_reader in readers.items():
+            for tuning_name, reader_tuning in [("default", None), ("tuned", tuning)]:
+                stats = measure_jitter(make_reader(reader_tuning), args.rate, args.duration)
+                results.append(dict(reader=reader_name, tuning=tuning_name, **stats))
+
+    load_kill_event.set()
+    for p in load:
+        p.join()
+
+    print(pd.DataFrame(results).set_index(["reader", "tuning"]).round(1))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,16 @@ with open("requirements.txt") as f:
 with open("requirements-dev.txt") as f:
     requirements_dev = f.read().splitlines()
 
+# Optional dependencies, by subsystem (all the subpackages are imported lazily):
+extras = dict(
+    hardware=["libusb1", "nidaqmx"],
+    stream=["pyzmq"],
+    gui=["pyqtgraph", "PyQt5", "qdarkstyle"],
+    plot=["matplotlib"],
+    realtime=["psutil"],
+)
+extras["all"] = sorted(set(sum(extras.values(), [])))
+
 with open("README.md") as f:
     long_description = f.read()
 
@@ -17,7 +27,7 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     python_requires=">=3.8",
-    extras_require=dict(dev=requirements_dev),
+    extras_require=dict(dev=requirements_dev, **extras),
     packages=find_namespace_packages(exclude=("docs", "tests*")),
     include_package_data=True,
     url="https://github.com/iurillilab/sisyphy",
@@ -1,12 +1,26 @@
 # Author: Luigi Petrucco @ iurilli lab
 # Contact: luigi [dot] petrucco [at] iit [dot] it
 
-"""Minimal code to acquire speed from a spherical treadmill."""
+"""Minimal code to acquire speed from a spherical treadmill.
+
+Subpackages and their (optional) dependencies are only imported when their
+attributes are first used, so that `import sisyphy` is fast and clients that only
+read recordings do not need the acquisition dependencies.
+"""
+from typing import TYPE_CHECKING
+
+from sisyphy.utils.lazy import lazy_attributes
 
 __all__ = ["SphereDataStreamer", "MouseSphereDataStreamer", "MockDataStreamer"]
 
-from sisyphy.core import (
-    MockDataStreamer,
-    MouseSphereDataStreamer,
-    SphereDataStreamer,
-)
+_LAZY_ATTRIBUTES = {name: "sisyphy.core" for name in __all__}
+
+if TYPE_CHECKING:
+    from sisyphy.core import (
+        MockDataStreamer,
+        MouseSphereDataStreamer,
+        SphereDataStreamer,
+    )
+
+
+__getattr__, __dir__ = lazy_attributes(globals(), _LAZY_ATTRIBUTES)
@@ -1,42 +1,55 @@
 """
-Simple examples demonstrating the use of GLMeshItem.
-"""
+3D view of the sphere, rotating with the velocities read from the mice.
+
+Data are read from a bounded queue and integrated in an OrientationIntegrator on a
+timer at display rate, independently of the sample rate; no history is kept, so
+memory stays flat during long sessions:
 
-import os
-from datetime import datetime
-from multiprocessing import Process, freeze_support
+    python -m sisyphy.app.gui.sphere_viewer [path/to/*_data.csv]
+
+Without arguments the sphere is read from the mice, otherwise a recording is
+replayed.
+"""
+import sys
 
 import numpy as np
 import pyqtgraph as pg
 import pyqtgraph.opengl as gl
-from pyqtgraph.Qt import QtGui
-
-from sisyphy import MockDataStreamer
-
-app = pg.mkQApp("GLMeshItem Example")
-
-
-class CustomGLViewWidget(gl.GLViewWidget):
-    def __init__(self, *args, kill_event, **kwargs):
-        super().__init__(*args, **kwargs)
+from pyqtgraph.Qt import QtCore
+
+from sisyphy.app.orientation import OrientationIntegrator
+
+
+class SphereViewer(gl.GLViewWidget):
+    def __init__(
+        self, data_queue, kill_event=None, integrator=None, fps: float = 60.0, **kwargs
+    ):
+        """
+        Parameters
+        ----------
+        data_queue : SaturatingQueue
+            Queue of samples with pitch, roll and yaw attributes.
+        kill_event : Event
+            Set when the window is closed.
+        integrator : OrientationIntegrator
+            Integrator of the orientation (with the default gain if None).
+        fps : float
+            Rate of the updates of the view.
+
+        """
+        super().__init__(**kwargs)
+        self.data_queue = data_queue
         self.kill_event = kill_event
+        if integrator is None:
+            integrator = OrientationIntegrator()
+        self.integrator = integrator
 
-    def closeEvent(self, ev):
-        super().closeEvent(ev)
-        self.kill_event.set()
-        print("set")
-
-
-class PLT:
-    def __init__(self, kill_event):
-        w = CustomGLViewWidget(kill_event=kill_event)
-        w.show()
-        w.setWindowTitle("pyqtgraph example: GLMeshItem")
-        w.setCameraPosition(distance=4)
+        self.setWindowTitle("Sphere orientation")
+        self.setCameraPosition(distance=4)
 
         g = gl.GLGridItem()
         g.scale(2, 2, 1)
-        w.addItem(g)
+        self.addItem(g)
 
         md = gl.MeshData.sphere(rows=20, cols=20)
         colors = np.ones((md.faceCount(), 4), dtype=float)
@@ -48,54 +61,42 @@ class PLT:
         ).T
         colors[::2, 0] = 0
         md.setFaceColors(colors)
-        self.m3 = gl.GLMeshItem(meshdata=md, smooth=False)
-        w.addItem(self.m3)
+        self.mesh = gl.GLMeshItem(meshdata=md, smooth=False)
+        self.addItem(self.mesh)
 
-    def update(self, pitch, roll, yaw):
-        for ax, v in zip([(1, 0, 0), (0, 1, 0), (0, 0, 1)], [pitch, roll, yaw]):
-            self.m3.rotate(v / 5, *ax)
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.update_orientation)
+        self.timer.start(int(1000 / fps))
 
-        QtGui.QApplication.processEvents()
+    def update_orientation(self) -> None:
+        """Integrate the samples received since the last frame, and redraw."""
+        self.integrator.update_from(self.data_queue.get_all())
+        # The transform is set from the integrated orientation, not accumulated:
+        angle, axis = self.integrator.as_axis_angle()
+        self.mesh.resetTransform()
+        self.mesh.rotate(angle, *axis)
 
-
-class Receiver(Process):
-    def __init__(self, data_queue, kill_evt):
-        Process.__init__(self)
-        self.data_queue = data_queue
-        self.kill_event = kill_evt
-
-    def run(self):
-        self.p = PLT(self.kill_event)
-
-        data = [[], [], []]
-        update_i = 0
-        while not self.kill_event.is_set():
-            vel_data = self.data_queue.get()
-            [
-                d.append(val)
-                for d, val in zip(data, [vel_data.pitch, vel_data.roll, vel_data.yaw])
-            ]
-            last_t = 10
-
-            if update_i % last_t == 0:
-                self.p.update(
-                    pitch=np.mean(data[0][-last_t:]),
-                    roll=np.mean(data[1][-last_t:]),
-                    yaw=np.mean(data[2][-last_t:]),
-                )
-            update_i += 1
+    def closeEvent(self, ev):
+        self.timer.stop()
+        super().closeEvent(ev)
+        if self.kill_event is not None:
+            self.kill_event.set()
 
 
 if __name__ == "__main__":
-    from multiprocessing import Event
-    from time import sleep
-
-    print("MAIN PID: ", os.getpid())
-
-    freeze_support()
-    kill_evt = Event()
-
-    data_streamer = MockDataStreamer(kill_event=kill_evt)
-    receiv = Receiver(data_queue=data_streamer.output_queue, kill_evt=kill_evt)
-    data_streamer.start()
-    receiv.start()
\ No newline at end of file
+    from sisyphy.hardware_readers import (
+        CalibratedSphereReaderProcess,
+        ReplaySphereReaderProcess,
+    )
+
+    app = pg.mkQApp("Sphere viewer")
+    if len(sys.argv) > 1:
+        reader = ReplaySphereReaderProcess(filename=sys.argv[1])
+    else:
+        reader = CalibratedSphereReaderProcess()
+    viewer = SphereViewer(reader.data_queue, kill_event=reader.kill_event)
+    viewer.show()
+    reader.start()
+    pg.exec()
+    reader.kill_event.set()
+    reader.join()
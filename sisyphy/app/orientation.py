@@ -0,0 +1,92 @@
+"""Orientation of the sphere, integrated from its angular velocities.
+
+The orientation is kept as a unit quaternion (w, x, y, z). Every batch of pitch,
+roll and yaw velocities (rotations around x, y and z of the fixed frame) is summed
+into a single rotation vector and composed with the current orientation, which is
+then renormalized, so that rounding errors do not accumulate over long sessions.
+Summing the rotations of a batch is exact for rotations around a fixed axis, and a
+good approximation for the small rotations of the samples in a display frame.
+"""
+from typing import Iterable, Tuple
+
+import numpy as np
+
+
+def quaternion_multiply(q1: np.ndarray, q2: np.ndarray) -> np.ndarray:
+    """Hamilton product q1 * q2 (rotation q2 followed by q1)."""
+    w1, x1, y1, z1 = q1
+    w2, x2, y2, z2 = q2
+    return np.array(
+        [
+            w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+            w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+            w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+            w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2,
+        ]
+    )
+
+
+def quaternion_from_rotvec(rotvec: np.ndarray) -> np.ndarray:
+    """Unit quaternion of a rotation vector (axis times angle, in radians)."""
+    angle = np.linalg.norm(rotvec)
+    if angle < 1e-12:
+        return np.array([1.0, *(0.5 * np.asarray(rotvec))])  # first order
+    return np.array([np.cos(angle / 2), *(np.sin(angle / 2) * rotvec / angle)])
+
+
+class OrientationIntegrator:
+    """Integrate pitch, roll and yaw velocities into an orientation quaternion."""
+
+    def __init__(self, gain: float = np.deg2rad(0.02)):
+        """
+        Parameters
+        ----------
+        gain : float
+            Rotation (in radians) for a unit of pitch, roll or yaw in a sample.
+
+        """
+        self.gain = gain
+        self.reset()
+
+    def reset(self) -> None:
+        self.quaternion = np.array([1.0, 0.0, 0.0, 0.0])
+        self.n_samples = 0
+
+    def update(self, pitch, roll, yaw) -> None:
+        """Integrate a batch of velocities (scalars or arrays)."""
+        rotvec = self.gain * np.array([np.sum(pitch), np.sum(roll), np.sum(yaw)])
+        q = quaternion_multiply(quaternion_from_rotvec(rotvec), self.quaternion)
+        self.quaternion = q / np.linalg.norm(q)
+        self.n_samples += np.size(pitch)
+
+    def update_from(self, samples: Iterable) -> None:
+        """Integrate a batch of objects with pitch, roll and yaw attributes (e.g.
+        EstimatedVelSphereData).
+        """
+        samples = list(samples)
+        if len(samples) == 0:
+            return
+        self.update(
+            [s.pitch for s in samples],
+            [s.roll for s in samples],
+            [s.yaw for s in samples],
+        )
+
+    def as_axis_angle(self) -> Tuple[float, np.ndarray]:
+        """Rotation angle (in degrees) and unit axis of the orientation."""
+        w, xyz = self.quaternion[0], self.quaternion[1:]
+        sin_half = np.linalg.norm(xyz)
+        if sin_half < 1e-12:
+            return 0.0, np.array([1.0, 0.0, 0.0])
+        return np.rad2deg(2 * np.arctan2(sin_half, w)), xyz / sin_half
+
+    def as_matrix(self) -> np.ndarray:
+        """3x3 rotation matrix of the orientation."""
+        w, x, y, z = self.quaternion
+        return np.array(
+            [
+                [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+                [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+                [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+            ]
+        )
@@ -4,6 +4,8 @@ from pathlib import Path
 
 import pandas as pd
 
+from sisyphy.utils.timebase import AnchorRecorder
+
 
 class ReceivingProcess(Process):
     def __init__(
@@ -21,7 +23,9 @@ class ReceivingProcess(Process):
     def run(self) -> None:
         mouse = []
         p_tstamp = []
+        clock_anchors = AnchorRecorder()
         while not self.kill_event.is_set():
+            clock_anchors.maybe_record()
             m = self.mouse_queue.get_all()
             mouse.extend(m)
 
@@ -29,6 +33,8 @@ class ReceivingProcess(Process):
 
         pd.DataFrame(mouse).to_csv(self.root / (self.timestamp + "_mouse.txt"))
         pd.DataFrame(p_tstamp).to_csv(self.root / (self.timestamp + "_timestamps.txt"))
+        clock_anchors.record()
+        clock_anchors.save(self.root / (self.timestamp + "_clock_anchors.csv"))
 
 
 if __name__ == "__main__":
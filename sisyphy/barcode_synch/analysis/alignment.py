@@ -0,0 +1,207 @@
+"""Alignment of two clocks (e.g. sisyphy monotonic timestamps and ephys sample indexes)
+from the barcodes recorded by both.
+
+Barcodes found on both sides are matched by value, and a continuous piecewise-linear
+model of one clock as a function of the other is fitted to the matched pairs with
+iterative outlier rejection. This accounts for offset and for (slowly varying) drift
+between the clocks. The fitted `ClockModel` converts full recordings in both
+directions in chunked, vectorized form.
+"""
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+MAD_TO_STD = 1.4826  # ratio between std and median absolute deviation for gaussian noise
+
+
+def match_barcodes(
+    codes_a: np.ndarray, times_a: np.ndarray, codes_b: np.ndarray, times_b: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pair the times of the barcodes found in both recordings.
+
+    Barcodes appearing more than once on either side are ambiguous and are discarded.
+
+    Returns
+    -------
+    tuple
+        Matched times from a, matched times from b and their barcode values,
+        sorted by time in a.
+
+    """
+    codes_a, codes_b = np.asarray(codes_a), np.asarray(codes_b)
+
+    def _unique_only(codes):
+        values, counts = np.unique(codes, return_counts=True)
+        return np.isin(codes, values[counts == 1])
+
+    keep_a, keep_b = _unique_only(codes_a), _unique_only(codes_b)
+    codes_a, times_a = codes_a[keep_a], np.asarray(times_a)[keep_a]
+    codes_b, times_b = codes_b[keep_b], np.asarray(times_b)[keep_b]
+
+    shared, idx_a, idx_b = np.intersect1d(codes_a, codes_b, return_indices=True)
+    order = np.argsort(times_a[idx_a], kind="stable")
+    return times_a[idx_a][order], times_b[idx_b][order], shared[order]
+
+
+def _interp_extrap(x, xp, fp):
+    """np.interp with linear extrapolation using the first and last segments."""
+    y = np.interp(x, xp, fp)
+    before, after = x < xp[0], x > xp[-1]
+    y[before] = fp[0] + (x[before] - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0])
+    y[after] = fp[-1] + (x[after] - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+    return y
+
+
+@dataclass
+class ClockModel:
+    """Continuous piecewise-linear mapping from clock x to clock y.
+
+    Knots are stored relative to the x0 and y0 origins, so that large absolute
+    values (e.g. ns timestamps) do not lose precision in float arithmetic.
+    """
+
+    x0: float
+    y0: float
+    knots_x: np.ndarray
+    knots_y: np.ndarray
+    residual_std: float  # std of the residuals of the inlier pairs, in y units
+    residual_max: float  # maximum absolute residual of the inlier pairs, in y units
+    n_pairs: int
+    n_outliers: int
+
+    def _convert(self, values, from_origin, to_origin, xp, fp, chunk_size):
+        values = np.asarray(values)
+        scalar = values.ndim == 0
+        values = np.atleast_1d(values)
+        out = np.empty(values.shape, dtype=np.float64)
+        flat_in, flat_out = values.reshape(-1), out.reshape(-1)
+        for start in range(0, len(flat_in), chunk_size):
+            chunk = flat_in[start : start + chunk_size]
+            if np.issubdtype(chunk.dtype, np.integer) and isinstance(from_origin, int):
+                # Subtract origin before casting to float to keep precision of int64 inputs:
+                rel = (chunk - np.int64(from_origin)).astype(np.float64)
+            else:
+                rel = chunk.astype(np.float64) - from_origin
+            flat_out[start : start + chunk_size] = _interp_extrap(rel, xp, fp) + to_origin
+        return out[0] if scalar else out
+
+    def forward(self, x, chunk_size: int = 1_000_000):
+        """Convert values from clock x to clock y."""
+        return self._convert(x, self.x0, self.y0, self.knots_x, self.knots_y, chunk_size)
+
+    def inverse(self, y, chunk_size: int = 1_000_000):
+        """Convert values from clock y to clock x."""
+        return self._convert(y, self.y0, self.x0, self.knots_y, self.knots_x, chunk_size)
+
+    @property
+    def slopes(self) -> np.ndarray:
+        """dy/dx of each linear segment."""
+        return np.diff(self.knots_y) / np.diff(self.knots_x)
+
+    def to_dict(self) -> dict:
+        return dict(
+            x0=self.x0,
+            y0=self.y0,
+            knots_x=self.knots_x.tolist(),
+            knots_y=self.knots_y.tolist(),
+            residual_std=self.residual_std,
+            residual_max=self.residual_max,
+            n_pairs=self.n_pairs,
+            n_outliers=self.n_outliers,
+        )
+
+    @classmethod
+    def from_dict(cls, model_dict: dict) -> "ClockModel":
+        model_dict = dict(model_dict)
+        for key in ["knots_x", "knots_y"]:
+            model_dict[key] = np.asarray(model_dict[key], dtype=np.float64)
+        return cls(**model_dict)
+
+
+def _hat_basis(x, knots):
+    """Design matrix of the linear interpolation (hat) basis functions on knots."""
+    segment = np.clip(np.searchsorted(knots, x, side="right") - 1, 0, len(knots) - 2)
+    w = (x - knots[segment]) / (knots[segment + 1] - knots[segment])
+    basis = np.zeros((len(x), len(knots)))
+    rows = np.arange(len(x))
+    basis[rows, segment] = 1 - w
+    basis[rows, segment + 1] = w
+    return basis
+
+
+def fit_clock_model(
+    x: np.ndarray,
+    y: np.ndarray,
+    pairs_per_segment: int = 200,
+    outlier_thr: float = 5.0,
+    max_iter: int = 10,
+) -> ClockModel:
+    """Fit a robust piecewise-linear model y = f(x) to matched clock readings.
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        Matched readings of the two clocks (e.g. from `match_barcodes`).
+    pairs_per_segment : int
+        Approximate number of pairs per linear segment. With barcodes every 5 s,
+        the default gives segments of ~17 min. Fewer pairs than this give a
+        single linear fit.
+    outlier_thr : float
+        Pairs with residuals further than outlier_thr robust standard deviations
+        (from the median absolute deviation) are excluded from the fit.
+    max_iter : int
+        Maximum number of fit / outlier rejection iterations.
+
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    if len(x) < 2:
+        raise ValueError("At least two matched pairs are needed to fit a clock model.")
+    order = np.argsort(x, kind="stable")
+    x, y = x[order], y[order]
+
+    x0, y0 = x[0], y[0]
+    x_rel = (x - x0).astype(np.float64)
+    y_rel = (y - y0).astype(np.float64)
+
+    n_segments = max(1, len(x) // pairs_per_segment)
+    knots = np.linspace(x_rel[0], x_rel[-1], n_segments + 1)
+    basis = _hat_basis(x_rel, knots)
+
+    inliers = np.ones(len(x), dtype=bool)
+    for _ in range(max_iter):
+        knot_values, *_ = np.linalg.lstsq(basis[inliers], y_rel[inliers], rcond=None)
+        residuals = y_rel - basis @ knot_values
+        scale = MAD_TO_STD * np.median(np.abs(residuals[inliers] - np.median(residuals[inliers])))
+        # Avoid rejecting everything on (numerically) perfect data:
+        scale = max(scale, np.finfo(np.float64).eps * max(np.abs(y_rel).max(), 1.0))
+        new_inliers = np.abs(residuals - np.median(residuals[inliers])) <= outlier_thr * scale
+        if np.array_equal(new_inliers, inliers) or new_inliers.sum() < 2:
+            break
+        inliers = new_inliers
+
+    if np.any(np.diff(knot_values) <= 0):
+        raise ValueError("Fitted clock model is not monotonic; check barcode matching.")
+
+    return ClockModel(
+        x0=x0.item(),
+        y0=y0.item(),
+        knots_x=knots,
+        knots_y=knot_values,
+        residual_std=float(residuals[inliers].std()),
+        residual_max=float(np.abs(residuals[inliers]).max()),
+        n_pairs=len(x),
+        n_outliers=int((~inliers).sum()),
+    )
+
+
+def align_barcodes(
+    codes_a: np.ndarray,
+    times_a: np.ndarray,
+    codes_b: np.ndarray,
+    times_b: np.ndarray,
+    **fit_kwargs,
+) -> ClockModel:
+    """Match barcodes from two recordings and fit the model from clock a to clock b."""
+    matched_a, matched_b, _ = match_barcodes(codes_a, times_a, codes_b, times_b)
+    return fit_clock_model(matched_a, matched_b, **fit_kwargs)
@@ -0,0 +1,217 @@
+"""On-disk cache for expensive analysis results (digital edges, decoded barcodes, ...).
+
+Results are stored as pickles, keyed on the function name and on its arguments, where
+files given as `Path` objects (and objects with a `cache_identity()` method, such as
+`RhdFile` and `RhdSession`) are represented by their identity: path, size and
+modification time (or content hash). Editing or replacing an input file thus
+invalidates its results. Strings are always plain values, even if a file with that
+name exists (e.g. a channel name, or "."), so pass input files as `Path`.
+The store is limited in size, evicting the least recently used results first.
+
+    @cached(ignore=("chunk_size",))
+    def slow_analysis(filename, threshold, chunk_size=1000):
+        ...
+
+The cache directory and size limit default to ~/.cache/sisyphy and 2 GB, and can be
+changed with the SISYPHY_CACHE_DIR and SISYPHY_CACHE_MAX_GB environment variables.
+Setting SISYPHY_CACHE_DIR to an empty string disables caching.
+"""
+import dataclasses
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+from pathlib import Path
+from typing import Callable, Sequence, Union
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "sisyphy"
+DEFAULT_MAX_GB = 2.0
+
+
+def file_identity(path: Union[str, Path], content_hash: bool = False) -> tuple:
+    """Identity of a file (path, size and mtime, or content hash) or of the files of
+    a directory.
+    """
+    path = Path(path).resolve()
+    if path.is_dir():
+        return (str(path),) + tuple(
+            file_identity(f, content_hash) for f in sorted(path.iterdir()) if f.is_file()
+        )
+    stat = path.stat()
+    if content_hash:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2 ** 20), b""):
+                digest.update(block)
+        return str(path), stat.st_size, digest.hexdigest()
+    return str(path), stat.st_size, stat.st_mtime_ns
+
+
+def _normalize(obj, content_hash):
+    """Hashable, deterministic representation of a function argument."""
+    if hasattr(obj, "cache_identity"):
+        return type(obj).__name__, obj.cache_identity()
+    if isinstance(obj, Path) and obj.exists():
+        return file_identity(obj, content_hash)
+    if isinstance(obj, (list, tuple)):
+        return type(obj).__name__, tuple(_normalize(o, content_hash) for o in obj)
+    if isinstance(obj, dict):
+        return tuple((k, _normalize(v, content_hash)) for k, v in sorted(obj.items()))
+    if dataclasses.is_dataclass(obj):
+        return type(obj).__name__, _normalize(dataclasses.asdict(obj), content_hash)
+    if isinstance(obj, np.ndarray):
+        return obj.dtype.str, obj.shape, hashlib.sha256(np.ascontiguousarray(obj)).hexdigest()
+    return obj
+
+
+class DiskCache:
+    """Directory of pickled results with a size limit and least recently used eviction."""
+
+    def __init__(
+        self,
+        directory: Union[str, Path] = DEFAULT_CACHE_DIR,
+        max_bytes: int = int(DEFAULT_MAX_GB * 1e9),
+        content_hash: bool = False,
+    ):
+        """
+        Parameters
+        ----------
+        directory : str or Path
+            Where results are stored.
+        max_bytes : int
+            Maximum total size of the stored results.
+        content_hash : bool
+            If True, input files are identified by the hash of their content instead
+            of size and modification time (slower, but robust to copies and touches).
+
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+
+    def key(self, name: str, arguments: dict) -> str:
+        normalized = _normalize(arguments, self.content_hash)
+        digest = hashlib.sha256(pickle.dumps((name, normalized), protocol=4)).hexdigest()
+        return f"{name}-{digest[:32]}"
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pkl"
+
+    def get(self, key: str):
+        """Return (True, value) if key is stored, otherwise (False, None)."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return False, None
+        os.utime(path)  # mark as recently used
+        return True, value
+
+    def put(self, key: str, value) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)  # atomic, in case of concurrent writers
+        self.evict()
+
+    def entries(self) -> list:
+        """Stored files, from the least to the most recently used."""
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*.pkl"), key=lambda p: p.stat().st_mtime_ns)
+
+    @property
+    def size(self) -> int:
+        return sum(p.stat().st_size for p in self.entries())
+
+    def evict(self) -> None:
+        """Remove least recently used results until the size limit is respected."""
+        entries = self.entries()
+        sizes = [p.stat().st_size for p in entries]
+        total = sum(sizes)
+        for path, size in zip(entries, sizes):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def invalidate(self, name: str = None, key: str = None) -> int:
+        """Remove a single result, all results of function `name`, or everything.
+        Returns the number of removed results.
+        """
+        if key is not None:
+            paths = [self._path(key)]
+        elif name is not None:
+            paths = list(self.directory.glob(f"{name}-*.pkl"))
+        else:
+            paths = self.entries()
+        n_removed = 0
+        for path in paths:
+            if path.exists():
+                path.unlink()
+                n_removed += 1
+        return n_removed
+
+
+def default_cache():
+    """Cache configured from the environment (None if caching is disabled)."""
+    directory = os.environ.get("SISYPHY_CACHE_DIR", str(DEFAULT_CACHE_DIR))
+    if directory == "":
+        return None
+    max_gb = float(os.environ.get("SISYPHY_CACHE_MAX_GB", DEFAULT_MAX_GB))
+    return DiskCache(directory, max_bytes=int(max_gb * 1e9))
+
+
+def cached(cache: DiskCache = None, ignore: Sequence[str] = ()) -> Callable:
+    """Decorator caching the results of a function in a DiskCache.
+
+    Parameters
+    ----------
+    cache : DiskCache
+        Cache to use; if None, `default_cache()` is used at every call.
+    ignore : list of str
+        Arguments that do not affect the result (e.g. chunk sizes), left out of the key.
+
+    The decorated function gets `invalidate(*args, **kwargs)` to remove the result of
+    a call, and `uncached` to call the original function.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        name = func.__qualname__.replace(".", "_")
+
+        def _key(cache_obj, args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+            return cache_obj.key(name, arguments)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_obj = cache if cache is not None else default_cache()
+            if cache_obj is None:
+                return func(*args, **kwargs)
+            key = _key(cache_obj, args, kwargs)
+            found, value = cache_obj.get(key)
+            if found:
+                return value
+            value = func(*args, **kwargs)
+            cache_obj.put(key, value)
+            return value
+
+        def invalidate(*args, **kwargs):
+            cache_obj = cache if cache is not None else default_cache()
+            if cache_obj is not None:
+                cache_obj.invalidate(key=_key(cache_obj, args, kwargs))
+
+        wrapper.invalidate = invalidate
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
@@ -0,0 +1,109 @@
+"""Extraction of the transitions of digital inputs directly from the packed 16-bit words
+in which Intan stores them, without unpacking every channel to a boolean array.
+
+Consecutive words are XORed, so that only the samples where at least one input
+changed are looked at, and their changed bits are expanded into events. Events are
+returned as structured arrays with `EDGE_DTYPE`, sorted by sample and channel:
+
+    events = rhd_edges(RhdSession("path/to/intan/folder"))
+    idx, rising = channel_edges(events, channel=1)
+"""
+from typing import Iterable, Iterator, Tuple, Union
+
+import numpy as np
+
+from sisyphy.barcode_synch.analysis.cache import cached
+
+N_DIGITAL_CHANNELS = 16
+EDGE_DTYPE = np.dtype([("sample_index", np.int64), ("channel", np.uint8), ("rising", bool)])
+
+
+def word_edges(
+    words: np.ndarray, previous_word: int = None, offset: int = 0
+) -> np.ndarray:
+    """Find all the transitions of the digital channels packed in `words`.
+
+    Parameters
+    ----------
+    words : np.ndarray
+        1D array of uint16 words, one per sample, with channel i in bit i.
+    previous_word : int
+        Word of the sample preceding `words` (e.g. the last one of the previous
+        chunk). If None, the first word is taken as the initial state, so no event
+        is reported at its sample.
+    offset : int
+        Index of the first sample of `words`, added to the event sample indexes.
+
+    Returns
+    -------
+    np.ndarray
+        Events with EDGE_DTYPE; sample_index is the first sample at the new level.
+
+    """
+    words = np.asarray(words, dtype=np.uint16)
+    if len(words) == 0:
+        return np.empty(0, dtype=EDGE_DTYPE)
+    previous = words[0] if previous_word is None else np.uint16(previous_word)
+
+    changed = np.empty_like(words)
+    changed[0] = words[0] ^ previous
+    np.bitwise_xor(words[1:], words[:-1], out=changed[1:])
+    changed_idx = np.flatnonzero(changed)
+
+    # Expand only the words where something changed:
+    bit_masks = (1 << np.arange(N_DIGITAL_CHANNELS)).astype(np.uint16)
+    changed_bits = (changed[changed_idx, None] & bit_masks) != 0
+    rows, channels = np.nonzero(changed_bits)
+
+    events = np.empty(len(rows), dtype=EDGE_DTYPE)
+    sample_idx = changed_idx[rows]
+    events["sample_index"] = sample_idx + offset
+    events["channel"] = channels
+    events["rising"] = (words[sample_idx] & bit_masks[channels]) != 0
+    return events
+
+
+def iter_edges(
+    chunks: Iterable[Tuple[int, np.ndarray]], previous_word: int = None
+) -> Iterator[np.ndarray]:
+    """Stream events over (first sample index, words) chunks, such as those of
+    `RhdFile.iter_chunks("board_dig_in_raw")`. Transitions between consecutive
+    chunks are detected as well.
+    """
+    for start, words in chunks:
+        if len(words) == 0:
+            continue
+        yield word_edges(words, previous_word=previous_word, offset=start)
+        previous_word = words[-1]
+
+
+@cached(ignore=("chunk_size",))
+def rhd_edges(
+    rhd, name: str = "board_dig_in_raw", chunk_size: int = 2 ** 22
+) -> np.ndarray:
+    """All the events of the digital inputs (or outputs, with name="board_dig_out_raw")
+    of a RhdFile or RhdSession, read in chunks of `chunk_size` samples.
+    """
+    events = list(iter_edges(rhd.iter_chunks(name, chunk_size=chunk_size)))
+    if len(events) == 0:
+        return np.empty(0, dtype=EDGE_DTYPE)
+    return np.concatenate(events)
+
+
+def channel_edges(events: np.ndarray, channel: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sample indexes and rising flags of the events of a single channel (bit number),
+    in the format of `BarcodeStreamDecoder.process_edges`.
+    """
+    selected = events[events["channel"] == channel]
+    return selected["sample_index"], selected["rising"]
+
+
+def channel_states(
+    events: np.ndarray, channel: int, sample_indexes: Union[np.ndarray, int], initial: bool = False
+) -> np.ndarray:
+    """Level of a channel at the given sample indexes, reconstructed from its events."""
+    idx, rising = channel_edges(events, channel)
+    if len(idx) == 0:
+        return np.full(np.shape(sample_indexes), initial)
+    last_event = np.searchsorted(idx, sample_indexes, side="right") - 1
+    return np.where(last_event >= 0, rising[np.maximum(last_event, 0)], initial)
@@ -6,281 +6,265 @@ https://gitlab.com/OptogeneticsandNeuralEngineeringCore/daqsyncro/-/raw/main/DAQ
   See bit.ly/onecore for more information, including a more detailed write up.
   extraction_barcodes.py
 ################################################################################
-  This code takes a Numpy (.npy) data file from a DAQ system that used the
+  This code takes data from a DAQ system that used the
   "arduino-barcodes(-trigger).ino" Arduino script while recording data,
-  extracts the index values when barcodes were initiated, calculates the
-  value of these barcodes, and outputs a Numpy file that contains a 2D array of
-  each index and its corresponding barcode value. This code should be run for
-  each DAQ's Numpy file that were attached to the Arduino barcode generator
-  during the same session so that "alignment_barcodes.py" can be run on them.
+  extracts the index values when barcodes were initiated, and calculates the
+  value of these barcodes. The original script has been turned into the
+  `extract_barcodes` function, which decodes all barcodes at once, and a command
+  line interface that processes many Numpy (.npy) files in parallel, saving for each
+  one a 2D array with the index and the value of each barcode:
+
+    python -m sisyphy.barcode_synch.analysis.extraction_barcodes file1.npy file2.npy --fs 30000
+
+  Run with --help for the full list of options.
 ################################################################################
-  USER INPUTS EXPLAINED:
+  INPUTS EXPLAINED:
     = raw_data_format = (bool) Set to "True" if the data being inputted has not
                         been filtered to just event timestamps (like in LJ data);
                         set to "False" if otherwise (like NP data from OpenEphys)
-    = signals_column = (int) The column where the sorted signal timestamps or the
-                       raw barcode data appears (base 0, 1st column = 0).
-    = expected_sample_rate = (int) The DAQ's sample rate, in Hz, when this data
-                             was collected. For example, NP runs at 30000 Hz.
-    = global_tolerance = (float) The fraction (in %/100) of tolerance allowed
-                         for duration measurements (ex: ind_bar_duration).
-    = barcodes_name = (str) The name of the outputted file(s) that will be saved
-                      to your chosen directory.
-    = save_npy = (bool) Set to "True" if you want the output saved as a .npy file.
-    = save_csv = (bool) Set to "True" if you want the output saved as a .csv file.
-
-    (The user inputs below are based on your Arduino barcode generator settings)
-    = nbits = (int) the number of bits (bars) that are in each barcode (not
-              including wrappers).
-    = inter_barcode_interval = (int) The duration of time (in milliseconds)
-                               between each barcode's start.
-    = ind_wrap_duration = (int) The duration of time (in milliseconds) of the
-                          ON wrapper portion (default = 10 ms) in the barcodes.
-    = ind_bar_duration = (int) The duration of time (in milliseconds) of each
-                         bar (bit) in the barcode.
+    = fs = (int) The DAQ's sample rate, in Hz, when this data
+           was collected. For example, NP runs at 30000 Hz.
+
+    (The BarcodeSpec parameters below are based on your Arduino barcode generator settings)
+    = n_bits = (int) the number of bits (bars) that are in each barcode (not
+               including wrappers).
+    = inter_barcode_interval_s = (float) The duration of time between each barcode's start.
+    = wrapper_width_s = (float) The duration of time of the ON wrapper portion
+                        (default = 10 ms) in the barcodes.
+    = bit_width_s = (float) The duration of time of each bar (bit) in the barcode.
+    = tolerance = (float) The fraction (in %/100) of tolerance allowed
+                  for duration measurements (ex: bit_width_s).
 ################################################################################
   References
 
 """
-
-import sys
-from datetime import datetime
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from tkinter.filedialog import askdirectory, askopenfilename
+from typing import Tuple
 
 import numpy as np
-from scipy.signal import find_peaks
 
-# Inputs from user
-################################################################################
-############################ USER INPUT SECTION ################################
-################################################################################
+from sisyphy.barcode_synch.bcode_dataclasses import BarcodeSpec
+
+
+def _first_in_window(times, thresholds, window_end, fallback):
+    """For each threshold, value of the first element of `times` >= threshold,
+    or `fallback` if it is the last one (or there's none) before `window_end`.
+    """
+    first = np.searchsorted(times, thresholds, side="left")
+    window_stop = np.searchsorted(times, window_end, side="left")
+    valid = (window_stop - first) > 1  # don't include the ending wrapper
+    values = times[np.minimum(first, len(times) - 1)] if len(times) > 0 else fallback
+    return np.where(valid, values, fallback)
+
+
+def extract_barcodes(
+    edges_or_signal: np.ndarray,
+    fs: float,
+    spec: BarcodeSpec = None,
+    raw_data_format: bool = False,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find all barcodes in a recording, and decode their values.
+
+    Parameters
+    ----------
+    edges_or_signal : np.ndarray
+        Either the sorted sample indexes of all the transitions of the barcode
+        signal, or the raw (digital) barcode signal if `raw_data_format` is True.
+    fs : float
+        Sampling rate of the recording, in Hz.
+    spec : BarcodeSpec
+        Timing parameters of the barcodes.
+    raw_data_format : bool
+        Whether the input is the raw signal instead of the transition indexes.
+
+    Returns
+    -------
+    tuple
+        Sample index of the start of each barcode (10 ms before the first 10 ms ON
+        value), and barcode values.
+
+    """
+    spec = spec if spec is not None else BarcodeSpec()
+
+    # All durations in ms as in the original script:
+    ind_wrap_duration = spec.wrapper_width_s * 1000
+    ind_bar_duration = spec.bit_width_s * 1000
+    inter_barcode_interval = spec.inter_barcode_interval_s * 1000
+    wrap_duration = 3 * ind_wrap_duration  # Off-On-Off
+    total_barcode_duration = spec.n_bits * ind_bar_duration + 2 * wrap_duration
+    global_tolerance = spec.tolerance
+    min_wrap_duration = ind_wrap_duration - ind_wrap_duration * global_tolerance
+    max_wrap_duration = ind_wrap_duration + ind_wrap_duration * global_tolerance
+    bar_tolerance = ind_bar_duration * global_tolerance
+    sample_conversion = 1000 / fs  # Convert sampling rate to msec
 
-# NP events come in as indexed values, with 1 to indicate when a TTL pulse changed
-# on to off (directionality). Other DAQ files (like LJ) come in 'raw' digital format,
-# with 0 to indicate TTL off state, and 1 to indicate on state.
-raw_data_format = False  # Set raw_data_format to True for LJ-like data, False for NP.
-signals_column = 0  # Column in which sorted timestamps or raw barcode data
-# appears (Base zero; 1st column = 0)
-expected_sample_rate = 8000  # In Hz. Generally set to 2k Hz for the LabJack or
-# 30k Hz for the Neuropixel. Choose based on your DAQ's sample rate.
-global_tolerance = 0.20  # The fraction (percentage) of tolerance allowed for
-# duration measurements.
-# (Ex: If global_tolerance = 0.2 and ind_wrap_duration = 10, then any signal
-# change between 8-12 ms long will be considered a barcode wrapper.)
-
-# Output Variables
-barcodes_name = "NeuroPixBarcodesTest"  # Name of your output file
-save_npy = True  # Save the barcodes data in .npy format (needed for alignment)
-save_csv = False  # Save barcodes data in .csv format
-
-# General variables; make sure these align with the timing format of
-# your Arduino-generated barcodes.
-nbits = 32
-inter_barcode_interval = 5000  # In milliseconds
-ind_wrap_duration = 10  # In milliseconds
-ind_bar_duration = 30  # In milliseconds
+    if raw_data_format:
+        # Extract the indices of all events when TTL pulse changed value:
+        indexed_times = np.flatnonzero(
+            np.abs(np.diff(np.asarray(edges_or_signal, dtype=float))) > 0.9
+        )
+    else:
+        indexed_times = np.asarray(edges_or_signal)
 
-################################################################################
-############################ END OF USER INPUT #################################
-################################################################################
+    # Find time difference between index values (ms), and extract barcode wrappers.
+    events_time_diff = np.diff(indexed_times) * sample_conversion
+    wrapper_array = indexed_times[:-1][
+        (min_wrap_duration < events_time_diff) & (events_time_diff < max_wrap_duration)
+    ]
 
-###########################################################
-### Set Global Variables/Tolerances Based on User Input ###
-###########################################################
-
-wrap_duration = 3 * ind_wrap_duration  # Off-On-Off
-total_barcode_duration = nbits * ind_bar_duration + 2 * wrap_duration
-
-# Tolerance conversions
-min_wrap_duration = ind_wrap_duration - ind_wrap_duration * global_tolerance
-max_wrap_duration = ind_wrap_duration + ind_wrap_duration * global_tolerance
-min_bar_duration = ind_bar_duration - ind_bar_duration * global_tolerance
-max_bar_duration = ind_bar_duration + ind_bar_duration * global_tolerance
-sample_conversion = 1000 / expected_sample_rate  # Convert sampling rate to msec
-
-##########################################################
-### Select Data Input File / Barcodes Output Directory ###
-##########################################################
-try:
-    signals_file = Path(
-        askopenfilename(
-            title="Select Your Input Data File",
-        )
-    )  # shows dialog box and return the path
-except:
-    print("No File Chosen")
-    sys.exit()
-
-if save_npy or save_csv:
-    try:
-        barcodes_dir = Path(
-            askdirectory(
-                title="Select Barcodes Output Folder",
-            )
-        )  # Output dir
-    except:
-        print("No Output Directory Chosen")
-        sys.exit()
-else:
-    print(
-        "No outputs selected, extracted barcodes will not be saved. What are you trying to do?"
+    # Delete the "second" of two consecutive wrappers (it's an OFF wrapper going
+    # into an ON bar):
+    false_wrappers = np.flatnonzero(np.diff(wrapper_array) * sample_conversion < max_wrap_duration)
+    wrapper_array = np.delete(wrapper_array, false_wrappers + 1)
+
+    # Find the barcode "start" wrappers:
+    wrapper_time_diff = np.diff(wrapper_array) * sample_conversion
+    wrapper_start_times = wrapper_array[:-1][wrapper_time_diff < total_barcode_duration]
+    if len(wrapper_start_times) == 0:
+        return np.empty(0), np.empty(0, dtype=np.int64)
+
+    # Actual barcode start is 10 ms before first 10 ms ON value.
+    signals_barcode_start_times = wrapper_start_times - ind_wrap_duration / sample_conversion
+
+    # Starting from the first wrapper, alternate events are on and off times:
+    first_idx = np.flatnonzero(indexed_times == wrapper_start_times[0])[-1]
+    on_times = indexed_times[first_idx::2] * sample_conversion
+    off_times = indexed_times[first_idx + 1 :: 2] * sample_conversion
+    start_times = wrapper_start_times * sample_conversion
+
+    # Jump ahead to start of barcode, from the end of the start wrapper:
+    first_off = np.searchsorted(off_times, start_times, side="right")
+    window_ends = start_times + total_barcode_duration
+    complete = (first_off < len(off_times)) & (
+        off_times[np.minimum(first_off, len(off_times) - 1)] < window_ends
+    )
+    start_times, window_ends = start_times[complete], window_ends[complete]
+    signals_barcode_start_times = signals_barcode_start_times[complete]
+    curr_times = off_times[first_off[complete]] + ind_wrap_duration
+
+    # Expected time of every bit of every barcode, shape (n_barcodes, n_bits),
+    # accumulated as in the original loop:
+    bit_times = np.cumsum(
+        np.concatenate(
+            [curr_times[:, None], np.full((len(curr_times), spec.n_bits - 1), ind_bar_duration)],
+            axis=1,
+        ),
+        axis=1,
+    )
+    fallback = (start_times + inter_barcode_interval)[:, None]
+    window_ends = window_ends[:, None]
+
+    min_bar_times, max_bar_times = bit_times - bar_tolerance, bit_times + bar_tolerance
+    next_on = _first_in_window(on_times, min_bar_times, window_ends, fallback)
+    next_off = _first_in_window(off_times, min_bar_times, window_ends, fallback)
+    on_hit = (min_bar_times <= next_on) & (next_on <= max_bar_times)
+    off_hit = (min_bar_times <= next_off) & (next_off <= max_bar_times)
+
+    # A bit is 1 if it starts with an ON transition, 0 if it starts with an OFF one,
+    # and keeps the previous value if no transition happens (multiple ON bars):
+    transitions = np.where(on_hit, 1, np.where(off_hit, 0, -1))
+    last_transition = np.where(transitions >= 0, np.arange(spec.n_bits), -1)
+    last_transition = np.maximum.accumulate(last_transition, axis=1)
+    bits = np.where(
+        last_transition >= 0,
+        np.take_along_axis(transitions, np.maximum(last_transition, 0), axis=1),
+        0,
     )
 
-##############################################
-### Signals Data Extraction & Manipulation ###
-##############################################
-try:
+    codes = bits.astype(np.int64) @ (2 ** np.arange(spec.n_bits, dtype=np.int64))
+    return signals_barcode_start_times, codes
+
+
+def process_file(
+    signals_file: Path,
+    output_dir: Path,
+    fs: float,
+    spec: BarcodeSpec,
+    raw_data_format: bool = False,
+    signals_column: int = 0,
+    save_npy: bool = True,
+    save_csv: bool = False,
+) -> int:
+    """Extract barcodes from a .npy file and save them as a (2, n_barcodes) array with
+    barcode start indexes stacked above their values. Returns the number of barcodes.
+    """
+    signals_file = Path(signals_file)
     signals_numpy_data = np.load(signals_file)
-    signals_located = True
-except:
-    signals_numpy_data = ""
-    print("Signals .npy file not located; please check your filepath")
-    signals_located = False
-
-# Check whether signals_numpy_data exists; if not, end script with sys.exit().
-if signals_located:
-    # LJ = If data is in raw format and has not been sorted by "peaks"
-    if raw_data_format:
+    if raw_data_format and signals_numpy_data.ndim > 1:
+        signals_numpy_data = signals_numpy_data[:, signals_column]
 
-        # Extract the signals_column from the raw data
-        barcode_column = signals_numpy_data[:, signals_column]
-        barcode_array = barcode_column.transpose()
-        # Extract the indices of all events when TTL pulse changed value.
-        event_index, _ = find_peaks(np.abs(np.diff(barcode_array)), height=0.9)
-        # Convert the event_index to indexed_times to align with later code.
-        indexed_times = event_index  # Just take the index values of the raw data
+    start_times, barcodes = extract_barcodes(
+        signals_numpy_data, fs, spec=spec, raw_data_format=raw_data_format
+    )
+    signals_time_and_bars_array = np.vstack((start_times, barcodes))
+
+    output_file = Path(output_dir) / (signals_file.stem + "_barcodes")
+    if save_npy:
+        np.save(output_file.with_suffix(".npy"), signals_time_and_bars_array)
+    if save_csv:
+        np.savetxt(
+            output_file.with_suffix(".csv"),
+            signals_time_and_bars_array,
+            delimiter=",",
+            fmt="%s",
+        )
+    return len(barcodes)
 
-    # NP = Collect the pre-extracted indices from the signals_column.
-    else:
-        indexed_times = signals_numpy_data
 
-    # Find time difference between index values (ms), and extract barcode wrappers.
-    events_time_diff = np.diff(indexed_times) * sample_conversion  # convert to ms
-    wrapper_array = indexed_times[
-        np.where(
-            np.logical_and(
-                min_wrap_duration < events_time_diff,
-                events_time_diff < max_wrap_duration,
-            )
-        )[0]
-    ]
+def _process_file_kwargs(kwargs):
+    return process_file(**kwargs)
 
-    # Isolate the wrapper_array to wrappers with ON values, to avoid any
-    # "OFF wrappers" created by first binary value.
-    false_wrapper_check = np.diff(wrapper_array) * sample_conversion  # Convert to ms
-    # Locate indices where two wrappers are next to each other.
-    false_wrappers = np.where(false_wrapper_check < max_wrap_duration)[0]
-    # Delete the "second" wrapper (it's an OFF wrapper going into an ON bar)
-    wrapper_array = np.delete(wrapper_array, false_wrappers + 1)
 
-    # Find the barcode "start" wrappers, set these to wrapper_start_times, then
-    # save the "real" barcode start times to signals_barcode_start_times, which
-    # will be combined with barcode values for the output .npy file.
-    wrapper_time_diff = np.diff(wrapper_array) * sample_conversion  # convert to ms
-    barcode_index = np.where(wrapper_time_diff < total_barcode_duration)[0]
-    wrapper_start_times = wrapper_array[barcode_index]
-    signals_barcode_start_times = (
-        wrapper_start_times - ind_wrap_duration / sample_conversion
+def main(argv=None):
+    default = BarcodeSpec()
+    parser = argparse.ArgumentParser(
+        description="Extract Arduino barcodes from DAQ .npy files."
     )
-    # Actual barcode start is 10 ms before first 10 ms ON value.
+    parser.add_argument("files", nargs="+", type=Path, help="input .npy files")
+    parser.add_argument("--fs", type=float, required=True, help="DAQ sample rate (Hz)")
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="input is the raw barcode signal (LJ-like) instead of event indexes (NP-like)",
+    )
+    parser.add_argument("--column", type=int, default=0, help="column of raw signal")
+    parser.add_argument("--output-dir", type=Path, default=None, help="defaults to input dir")
+    parser.add_argument("--csv", action="store_true", help="also save .csv output")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    parser.add_argument("--n-bits", type=int, default=default.n_bits)
+    parser.add_argument("--bit-width-s", type=float, default=default.bit_width_s)
+    parser.add_argument("--wrapper-width-s", type=float, default=default.wrapper_width_s)
+    parser.add_argument(
+        "--interval-s", type=float, default=default.inter_barcode_interval_s
+    )
+    parser.add_argument("--tolerance", type=float, default=default.tolerance)
+    args = parser.parse_args(argv)
+
+    spec = BarcodeSpec(
+        n_bits=args.n_bits,
+        bit_width_s=args.bit_width_s,
+        wrapper_width_s=args.wrapper_width_s,
+        inter_barcode_interval_s=args.interval_s,
+        tolerance=args.tolerance,
+    )
+    jobs = [
+        dict(
+            signals_file=f,
+            output_dir=args.output_dir if args.output_dir is not None else f.parent,
+            fs=args.fs,
+            spec=spec,
+            raw_data_format=args.raw,
+            signals_column=args.column,
+            save_csv=args.csv,
+        )
+        for f in args.files
+    ]
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for f, n_barcodes in zip(args.files, executor.map(_process_file_kwargs, jobs)):
+            print(f"{f}: {n_barcodes} barcodes")
+
 
-    # Using the wrapper_start_times, collect the rest of the indexed_times events
-    # into on_times and off_times for barcode value extraction.
-    on_times = []
-    off_times = []
-    for idx, ts in enumerate(indexed_times):  # Go through indexed_times
-        # Find where ts = first wrapper start time
-        if ts == wrapper_start_times[0]:
-            # All on_times include current ts and every second value after ts.
-            on_times = indexed_times[idx::2]
-            off_times = indexed_times[idx + 1 :: 2]  # Everything else is off_times
-
-    # Convert wrapper_start_times, on_times, and off_times to ms
-    wrapper_start_times = wrapper_start_times * sample_conversion
-    on_times = on_times * sample_conversion
-    off_times = off_times * sample_conversion
-
-    signals_barcodes = []
-    for start_time in wrapper_start_times:
-        oncode = on_times[
-            np.where(
-                np.logical_and(
-                    on_times > start_time,
-                    on_times < start_time + total_barcode_duration,
-                )
-            )[0]
-        ]
-        offcode = off_times[
-            np.where(
-                np.logical_and(
-                    off_times > start_time,
-                    off_times < start_time + total_barcode_duration,
-                )
-            )[0]
-        ]
-        curr_time = offcode[0] + ind_wrap_duration  # Jumps ahead to start of barcode
-        bits = np.zeros((nbits,))
-        interbit_ON = False  # Changes to "True" during multiple ON bars
-
-        for bit in range(0, nbits):
-            next_on = np.where(
-                oncode >= (curr_time - ind_bar_duration * global_tolerance)
-            )[0]
-            next_off = np.where(
-                offcode >= (curr_time - ind_bar_duration * global_tolerance)
-            )[0]
-
-            if next_on.size > 1:  # Don't include the ending wrapper
-                next_on = oncode[next_on[0]]
-            else:
-                next_on = start_time + inter_barcode_interval
-
-            if next_off.size > 1:  # Don't include the ending wrapper
-                next_off = offcode[next_off[0]]
-            else:
-                next_off = start_time + inter_barcode_interval
-
-            # Recalculate min/max bar duration around curr_time
-            min_bar_duration = curr_time - ind_bar_duration * global_tolerance
-            max_bar_duration = curr_time + ind_bar_duration * global_tolerance
-
-            if min_bar_duration <= next_on <= max_bar_duration:
-                bits[bit] = 1
-                interbit_ON = True
-            elif min_bar_duration <= next_off <= max_bar_duration:
-                interbit_ON = False
-            elif interbit_ON == True:
-                bits[bit] = 1
-
-            curr_time += ind_bar_duration
-
-        barcode = 0
-
-        for bit in range(0, nbits):  # least sig left
-            barcode += bits[bit] * pow(2, bit)
-
-        signals_barcodes.append(barcode)
-
-else:  # If signals_located = False
-    sys.exit("Data not found. Program has stopped.")
-
-################################################################
-### Print out final output and save to chosen file format(s) ###
-################################################################
-
-# Create merged array with timestamps stacked above their barcode values
-signals_time_and_bars_array = np.vstack(
-    (signals_barcode_start_times, np.array(signals_barcodes))
-)
-print("Final Ouput: ", signals_time_and_bars_array)
-
-time_now = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-
-if save_npy:
-    output_file = barcodes_dir / (barcodes_name + time_now)
-    np.save(output_file, signals_time_and_bars_array)
-
-if save_csv:
-    output_file = barcodes_dir / (barcodes_name + time_now + ".csv")
-    np.savetxt(output_file, signals_time_and_bars_array, delimiter=",", fmt="%s")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""End-to-end alignment of a sisyphy session with an Intan recording.
+
+The stages are chained as generators, so that no more than one chunk of raw data is
+held in memory at any time, whatever the duration of the recording:
+
+    RHD chunks -> digital edges -> decoded barcodes -> matching + clock fit
+
+The result is a small artifact (a .json with the clock model and a summary, and a
+.npz with the barcodes found on both sides). From the command line:
+
+    python -m sisyphy.barcode_synch.analysis.pipeline path/to/intan/folder \
+        path/to/20230101_12.00.00_timestamps.txt --channel 1
+
+Run with --help for the full list of options.
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from sisyphy.barcode_synch.analysis.alignment import ClockModel, align_barcodes
+from sisyphy.barcode_synch.analysis.cache import cached
+from sisyphy.barcode_synch.analysis.digital_edges import channel_edges, word_edges
+from sisyphy.barcode_synch.analysis.rhd_session import RhdSession
+from sisyphy.barcode_synch.barcode_reading import BarcodeStreamDecoder
+from sisyphy.barcode_synch.bcode_dataclasses import BarcodeSpec
+
+DEFAULT_CHUNK_SIZE = 2 ** 20  # samples, 2 MB of digital words
+
+
+def iter_channel_edges(
+    chunks: Iterable[Tuple[int, np.ndarray]], channel: int
+) -> Iterator[Tuple[np.ndarray, np.ndarray, int]]:
+    """Stage turning (first sample index, digital words) chunks into the
+    (edge indexes, rising, samples read so far) of a single channel.
+    """
+    previous_word = None
+    for start, words in chunks:
+        if len(words) == 0:
+            continue
+        events = word_edges(words, previous_word=previous_word, offset=start)
+        previous_word = words[-1]
+        edge_idx, rising = channel_edges(events, channel)
+        yield edge_idx, rising, start + len(words)
+
+
+def iter_barcodes(
+    channel_edges_stream: Iterable[Tuple[np.ndarray, np.ndarray, int]],
+    decoder: BarcodeStreamDecoder,
+) -> Iterator[Tuple[int, int]]:
+    """Stage decoding (sample index, code) barcodes from a stream of edges."""
+    for edge_idx, rising, n_samples in channel_edges_stream:
+        yield from decoder.process_edges(edge_idx, rising, n_samples)
+
+
+@cached(ignore=("chunk_size",))
+def decode_rhd_barcodes(
+    session: RhdSession,
+    channel: int,
+    spec: BarcodeSpec = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode all the barcodes on a digital input of an Intan session.
+
+    Parameters
+    ----------
+    session : RhdSession
+        Session to read.
+    channel : int
+        Digital input (bit number) with the barcodes.
+    spec : BarcodeSpec
+        Timing parameters of the barcodes.
+    chunk_size : int
+        Number of samples read at once.
+
+    Results are cached on disk (see `sisyphy.barcode_synch.analysis.cache`), so that
+    re-running the alignment of an unchanged session does not read the files again.
+
+    Returns
+    -------
+    tuple
+        Session sample index of the first high sample of each barcode, and codes.
+
+    """
+    decoder = BarcodeStreamDecoder(session.sample_rate, spec=spec)
+    chunks = session.iter_chunks("board_dig_in_raw", chunk_size=chunk_size)
+    barcodes = list(iter_barcodes(iter_channel_edges(chunks, channel), decoder))
+    if len(barcodes) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    sample_idx, codes = np.array(barcodes, dtype=np.int64).T
+    return sample_idx, codes
+
+
+def load_sisyphy_timestamps(filename: Union[str, Path]) -> Tuple[np.ndarray, np.ndarray]:
+    """Monotonic ns times and codes of the barcodes from a sisyphy *_timestamps.txt file."""
+    timestamps_df = pd.read_csv(filename, usecols=["t_ns_code", "code"])
+    return timestamps_df["t_ns_code"].values, timestamps_df["code"].values
+
+
+def run_alignment(
+    rhd_path: Union[str, Path],
+    timestamps_file: Union[str, Path],
+    channel: int,
+    output_dir: Union[str, Path] = None,
+    spec: BarcodeSpec = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    **fit_kwargs,
+) -> ClockModel:
+    """Fit the model from sisyphy monotonic ns to Intan session sample indexes, and
+    save it in `output_dir` as alignment.json (together with alignment_barcodes.npz).
+
+    Parameters
+    ----------
+    rhd_path : str or Path
+        Directory with the .rhd files of the session.
+    timestamps_file : str or Path
+        File with the timestamps saved by sisyphy during the session.
+    channel : int
+        Digital input of the Intan board with the barcodes.
+    output_dir : str or Path
+        Where to save the artifact; defaults to `rhd_path`.
+    spec : BarcodeSpec
+        Timing parameters of the barcodes.
+    chunk_size : int
+        Number of samples read at once from the .rhd files.
+    fit_kwargs :
+        Passed to `fit_clock_model`.
+
+    """
+    rhd_path = Path(rhd_path)
+    output_dir = Path(output_dir) if output_dir is not None else rhd_path
+    spec = spec if spec is not None else BarcodeSpec()
+
+    session = RhdSession(rhd_path)
+    rhd_idx, rhd_codes = decode_rhd_barcodes(session, channel, spec=spec, chunk_size=chunk_size)
+    sis_t_ns, sis_codes = load_sisyphy_timestamps(timestamps_file)
+    model = align_barcodes(sis_codes, sis_t_ns, rhd_codes, rhd_idx, **fit_kwargs)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    np.savez(
+        output_dir / "alignment_barcodes.npz",
+        rhd_sample_index=rhd_idx,
+        rhd_code=rhd_codes,
+        sisyphy_t_ns=sis_t_ns,
+        sisyphy_code=sis_codes,
+    )
+    summary = dict(
+        rhd_path=str(rhd_path),
+        timestamps_file=str(timestamps_file),
+        channel=channel,
+        sample_rate=session.sample_rate,
+        n_samples=session.n_samples,
+        n_rhd_barcodes=len(rhd_codes),
+        n_sisyphy_barcodes=len(sis_codes),
+        discontinuities=[d.sample_index for d in session.discontinuities],
+        barcode_spec=spec.__dict__,
+        model=model.to_dict(),
+    )
+    with open(output_dir / "alignment.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    return model
+
+
+def load_alignment(filename: Union[str, Path]) -> ClockModel:
+    """Clock model from an alignment.json file."""
+    with open(filename) as f:
+        return ClockModel.from_dict(json.load(f)["model"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Align a sisyphy session to an Intan recording using barcodes."
+    )
+    parser.add_argument("rhd_path", type=Path, help="directory with the .rhd files")
+    parser.add_argument("timestamps_file", type=Path, help="sisyphy *_timestamps.txt file")
+    parser.add_argument("--channel", type=int, required=True, help="digital input with barcodes")
+    parser.add_argument("--output-dir", type=Path, default=None, help="defaults to rhd_path")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    default = BarcodeSpec()
+    parser.add_argument("--n-bits", type=int, default=default.n_bits)
+    parser.add_argument("--bit-width-s", type=float, default=default.bit_width_s)
+    parser.add_argument("--wrapper-width-s", type=float, default=default.wrapper_width_s)
+    args = parser.parse_args(argv)
+
+    spec = BarcodeSpec(
+        n_bits=args.n_bits,
+        bit_width_s=args.bit_width_s,
+        wrapper_width_s=args.wrapper_width_s,
+        duration_thr_s=1.5 * args.wrapper_width_s,
+    )
+
+    model = run_alignment(
+        args.rhd_path,
+        args.timestamps_file,
+        args.channel,
+        output_dir=args.output_dir,
+        spec=spec,
+        chunk_size=args.chunk_size,
+    )
+    print(
+        f"Matched {model.n_pairs} barcodes ({model.n_outliers} outliers), residual jitter "
+        f"{model.residual_std:.2f} samples (max {model.residual_max:.2f})."
+    )
+
+
+if __name__ == "__main__":
+    main()
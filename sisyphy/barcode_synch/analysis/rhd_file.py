@@ -0,0 +1,241 @@
+"""Lazy, channel- and time-selective access to Intan .rhd files.
+
+`RhdFile` parses the header once and memory-maps the data blocks, so that indexing
+only reads from disk the blocks spanning the requested samples, and only copies the
+requested channels:
+
+    rhd = RhdFile("recording.rhd")
+    dig = rhd["board_dig_in", 0:30000]  # (n_dig_in_channels, 30000) bool
+    amp = rhd.amplifier[[0, 5], 1000:2000]  # (2, 1000) uV
+    for start, words in rhd.iter_chunks("board_dig_in_raw"):
+        ...
+
+Memory usage is proportional to the requested data, whatever the file size.
+"""
+from pathlib import Path
+from typing import Iterator, Tuple, Union
+
+import numpy as np
+
+from sisyphy.barcode_synch.analysis.cache import file_identity
+from sisyphy.barcode_synch.analysis.rhd_reading import (
+    read_data_blocks,
+    scale_signal,
+    unpack_digital,
+)
+
+# Signals with one value per block; the others have one value per sample, except
+# aux inputs that are sampled every 4 samples:
+_PER_BLOCK_SIGNALS = ["supply_voltage", "temp_sensor"]
+_DIGITAL_SIGNALS = ["board_dig_in", "board_dig_out"]
+_SINGLE_TRACE_SIGNALS = ["timestamps", "board_dig_in_raw", "board_dig_out_raw"]
+_SCALED_SIGNALS = [
+    "timestamps",
+    "amplifier",
+    "aux_input",
+    "supply_voltage",
+    "temp_sensor",
+    "board_adc",
+]
+
+
+class RhdSignal:
+    """View on one signal of a `RhdFile`, indexed as [samples] or [channels, samples].
+    Signals without channels (timestamps and raw digital words) take only samples.
+    """
+
+    def __init__(self, rhd_file: "RhdFile", name: str):
+        self.rhd_file = rhd_file
+        self.name = name
+        self.field = name[: -len("_raw")] if name.endswith("_raw") else name
+        if self.field not in rhd_file.blocks.dtype.names or (
+            name != self.field and self.field not in _DIGITAL_SIGNALS
+        ):
+            raise KeyError(f"No {name} data in {rhd_file.filename}.")
+
+    @property
+    def samples_per_block(self) -> int:
+        n_per_block = self.rhd_file.header["num_samples_per_data_block"]
+        if self.field in _PER_BLOCK_SIGNALS:
+            return 1
+        if self.field == "aux_input":
+            return n_per_block // 4
+        return n_per_block
+
+    @property
+    def n_samples(self) -> int:
+        return len(self.rhd_file.blocks) * self.samples_per_block
+
+    @property
+    def n_channels(self) -> int:
+        if self.name in _SINGLE_TRACE_SIGNALS:
+            return 0
+        if self.field in _DIGITAL_SIGNALS:
+            return len(self.rhd_file.header[self.field + "_channels"])
+        return self.rhd_file.blocks.dtype[self.field].shape[0]
+
+    @property
+    def shape(self) -> tuple:
+        if self.n_channels == 0:
+            return (self.n_samples,)
+        return self.n_channels, self.n_samples
+
+    def __len__(self) -> int:
+        return self.n_samples
+
+    def _read_raw(self, channels, start: int, stop: int) -> np.ndarray:
+        """Raw values of samples [start, stop), reading only the blocks that contain them."""
+        k = self.samples_per_block
+        first_block, last_block = start // k, -(-stop // k)
+        values = self.rhd_file.blocks[self.field][first_block:last_block]
+        offset = first_block * k
+
+        if self.field in _PER_BLOCK_SIGNALS:  # (n_blocks, n_channels)
+            values = values[:, channels].T
+        elif values.ndim == 3:  # (n_blocks, n_channels, k)
+            values = np.moveaxis(values[:, channels, :], 0, -2)
+            values = values.reshape(values.shape[:-2] + (-1,))
+        else:  # (n_blocks, k)
+            values = values.reshape(-1)
+        return values[..., start - offset : stop - offset]
+
+    def __getitem__(self, key) -> np.ndarray:
+        if self.n_channels == 0:
+            channels, samples = None, key
+        elif isinstance(key, tuple):
+            channels, samples = key
+        else:
+            channels, samples = slice(None), key
+
+        if isinstance(samples, (int, np.integer)):
+            samples = slice(samples, samples + 1 if samples != -1 else None)
+            squeeze = True
+        else:
+            squeeze = False
+        start, stop, step = samples.indices(self.n_samples)
+        if step < 0:
+            raise IndexError("Negative steps are not supported.")
+        stop = max(start, stop)
+
+        if self.field in _DIGITAL_SIGNALS and self.name == self.field:
+            # Read the packed words once and unpack only the selected channels:
+            all_channels = self.rhd_file.header[self.field + "_channels"]
+            words = self._read_raw(None, start, stop)[..., ::step]
+            if isinstance(channels, (int, np.integer)):
+                values = unpack_digital(words, [all_channels[channels]])[0]
+            else:
+                selected = np.arange(len(all_channels))[channels]
+                values = unpack_digital(words, [all_channels[i] for i in selected])
+            return values[..., 0] if squeeze else values
+
+        values = self._read_raw(channels, start, stop)[..., ::step]
+        if self.rhd_file.scale and self.name in _SCALED_SIGNALS:
+            values = scale_signal(self.field, values, self.rhd_file.header)
+        else:
+            values = np.array(values)  # copy out of the memory map
+
+        return values[..., 0] if squeeze else values
+
+    def iter_chunks(
+        self, chunk_size: int = 2 ** 20, channels=slice(None)
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """Iterate over (first sample index, values) chunks of `chunk_size` samples."""
+        for start in range(0, self.n_samples, chunk_size):
+            samples = slice(start, start + chunk_size)
+            key = samples if self.n_channels == 0 else (channels, samples)
+            yield start, self[key]
+
+
+class RhdFile:
+    """Lazy reader of a .rhd file.
+
+    Signals are accessible as attributes (`rhd.amplifier`, `rhd.board_dig_in`, ...)
+    returning `RhdSignal` objects, or by indexing with the signal name and the
+    sample (and optionally channel) selection: `rhd["board_dig_in", t0:t1]`.
+    Raw digital words are available as `board_dig_in_raw` and `board_dig_out_raw`.
+    """
+
+    def __init__(self, filename: Union[str, Path], scale: bool = True, header: dict = None):
+        """
+        Parameters
+        ----------
+        filename : str or Path
+            File to read.
+        scale : bool
+            If True, analog signals are converted to physical units and timestamps
+            to seconds; otherwise raw integers are returned.
+        header : dict
+            Header of the file, if already parsed by another RhdFile.
+
+        """
+        self.filename = Path(filename)
+        self.scale = scale
+        self._header = header
+        self._blocks = None
+
+    def _open(self):
+        self._header, self._blocks = read_data_blocks(self.filename, header=self._header)
+
+    @property
+    def header(self) -> dict:
+        if self._header is None:
+            self._open()
+        return self._header
+
+    @property
+    def blocks(self) -> np.ndarray:
+        if self._blocks is None:
+            self._open()
+        return self._blocks
+
+    @property
+    def sample_rate(self) -> float:
+        return self.header["sample_rate"]
+
+    @property
+    def n_samples(self) -> int:
+        return len(self.blocks) * self.header["num_samples_per_data_block"]
+
+    def __len__(self) -> int:
+        return self.n_samples
+
+    def __getattr__(self, name) -> RhdSignal:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return RhdSignal(self, name)
+        except (KeyError, ValueError):
+            raise AttributeError(f"{type(self).__name__} has no signal {name}.")
+
+    def __getitem__(self, key) -> np.ndarray:
+        if isinstance(key, str):
+            return RhdSignal(self, key)[:]
+        name, *selection = key
+        signal = RhdSignal(self, name)
+        return signal[tuple(selection) if len(selection) > 1 else selection[0]]
+
+    def iter_chunks(
+        self, name: str, chunk_size: int = 2 ** 20, channels=slice(None)
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """Iterate over (first sample index, values) chunks of a signal."""
+        return RhdSignal(self, name).iter_chunks(chunk_size=chunk_size, channels=channels)
+
+    def cache_identity(self) -> tuple:
+        """Identity of the file for the analysis cache."""
+        return file_identity(self.filename), self.scale
+
+    def close(self) -> None:
+        """Release the memory map of the file (the header stays cached)."""
+        self._blocks = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}({str(self.filename)!r}, {self.n_samples} samples "
+            f"at {self.sample_rate:g} Hz)"
+        )
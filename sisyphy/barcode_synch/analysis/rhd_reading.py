@@ -1,13 +1,13 @@
 """Code adapted from https://github.com/Intan-Technologies/load-rhd-notebook-python/blob/main/importrhdutilities.py.
+
+Instead of reading the file block by block, the data section is memory-mapped as an
+array of data blocks with a structured dtype built from the header (see
+`read_data_blocks`), so that each signal can be extracted with a single strided copy.
 """
 
-import math
 import os
 import struct
-import sys
-import time
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 
@@ -28,20 +28,8 @@ def read_qstring(fid):
 
         raise Exception("Length too long.")
 
-    # convert length from bytes to 16-bit Unicode words
-    length = int(length / 2)
-
-    data = []
-    for i in range(0, length):
-        (c,) = struct.unpack("<H", fid.read(2))
-        data.append(c)
-
-    if sys.version_info >= (3, 0):
-        a = "".join([chr(c) for c in data])
-    else:
-        a = "".join([unichr(c) for c in data])
-
-    return a
+    # Strings are stored as 16-bit Unicode words:
+    return fid.read(length).decode("utf-16-le")
 
 
 # Define read_header function
@@ -311,131 +299,131 @@ def get_bytes_per_data_block(header):
     return bytes_per_block
 
 
-# Define read_one_data_block function
-def read_one_data_block(data, header, indices, fid):
-    """Reads one 60 or 128 sample data block from fid into data, at the location indicated by indices."""
+# Signals in the order in which they are stored in each data block:
+BLOCK_FIELDS = [
+    "timestamps",
+    "amplifier",
+    "aux_input",
+    "supply_voltage",
+    "temp_sensor",
+    "board_adc",
+    "board_dig_in",
+    "board_dig_out",
+]
+
 
+def _signed_timestamps(header):
     # In version 1.2, we moved from saving timestamps as unsigned
     # integers to signed integers to accommodate negative (adjusted)
-    # timestamps for pretrigger data['
-    if (header["version"]["major"] == 1 and header["version"]["minor"] >= 2) or (
+    # timestamps for pretrigger data
+    return (header["version"]["major"] == 1 and header["version"]["minor"] >= 2) or (
         header["version"]["major"] > 1
-    ):
-        data["t_amplifier"][
-            indices["amplifier"] : (
-                indices["amplifier"] + header["num_samples_per_data_block"]
-            )
-        ] = np.array(
-            struct.unpack(
-                "<" + "i" * header["num_samples_per_data_block"],
-                fid.read(4 * header["num_samples_per_data_block"]),
-            )
-        )
-    else:
-        data["t_amplifier"][
-            indices["amplifier"] : (
-                indices["amplifier"] + header["num_samples_per_data_block"]
-            )
-        ] = np.array(
-            struct.unpack(
-                "<" + "I" * header["num_samples_per_data_block"],
-                fid.read(4 * header["num_samples_per_data_block"]),
-            )
-        )
+    )
 
-    if header["num_amplifier_channels"] > 0:
-        tmp = np.fromfile(
-            fid,
-            dtype="uint16",
-            count=header["num_samples_per_data_block"]
-            * header["num_amplifier_channels"],
-        )
-        data["amplifier_data"][
-            range(header["num_amplifier_channels"]),
-            (indices["amplifier"]) : (
-                indices["amplifier"] + header["num_samples_per_data_block"]
-            ),
-        ] = tmp.reshape(
-            header["num_amplifier_channels"], header["num_samples_per_data_block"]
-        )
 
-    if header["num_aux_input_channels"] > 0:
-        tmp = np.fromfile(
-            fid,
-            dtype="uint16",
-            count=int(
-                (header["num_samples_per_data_block"] / 4)
-                * header["num_aux_input_channels"]
-            ),
-        )
-        data["aux_input_data"][
-            range(header["num_aux_input_channels"]),
-            indices["aux_input"] : int(
-                indices["aux_input"] + (header["num_samples_per_data_block"] / 4)
-            ),
-        ] = tmp.reshape(
-            header["num_aux_input_channels"],
-            int(header["num_samples_per_data_block"] / 4),
-        )
+def data_block_dtype(header):
+    """Numpy structured dtype of one 60 or 128 sample data block.
+    Fields of signals with no channels in the file are omitted.
+    """
+    n_samples = header["num_samples_per_data_block"]
+    fields = [
+        ("timestamps", "<i4" if _signed_timestamps(header) else "<u4", (n_samples,))
+    ]
+    shapes = dict(
+        amplifier=(header["num_amplifier_channels"], n_samples),
+        # Auxiliary inputs are sampled 4x slower than amplifiers
+        aux_input=(header["num_aux_input_channels"], n_samples // 4),
+        # Supply voltage and temp sensor are sampled once per block
+        supply_voltage=(header["num_supply_voltage_channels"],),
+        temp_sensor=(header["num_temp_sensor_channels"],),
+        board_adc=(header["num_board_adc_channels"], n_samples),
+        # All digital channels are packed in a single 16-bit word per sample
+        board_dig_in=(n_samples,) if header["num_board_dig_in_channels"] > 0 else (0,),
+        board_dig_out=(n_samples,) if header["num_board_dig_out_channels"] > 0 else (0,),
+    )
+    for name in BLOCK_FIELDS[1:]:
+        if shapes[name][0] > 0:
+            fields.append((name, "<u2", shapes[name]))
 
-    if header["num_supply_voltage_channels"] > 0:
-        tmp = np.fromfile(
-            fid, dtype="uint16", count=1 * header["num_supply_voltage_channels"]
-        )
-        data["supply_voltage_data"][
-            range(header["num_supply_voltage_channels"]),
-            indices["supply_voltage"] : (indices["supply_voltage"] + 1),
-        ] = tmp.reshape(header["num_supply_voltage_channels"], 1)
+    dtype = np.dtype(fields)
+    assert dtype.itemsize == get_bytes_per_data_block(header)
+    return dtype
 
-    if header["num_temp_sensor_channels"] > 0:
-        tmp = np.fromfile(
-            fid, dtype="uint16", count=1 * header["num_temp_sensor_channels"]
-        )
-        data["temp_sensor_data"][
-            range(header["num_temp_sensor_channels"]),
-            indices["supply_voltage"] : (indices["supply_voltage"] + 1),
-        ] = tmp.reshape(header["num_temp_sensor_channels"], 1)
 
-    if header["num_board_adc_channels"] > 0:
-        tmp = np.fromfile(
-            fid,
-            dtype="uint16",
-            count=(header["num_samples_per_data_block"])
-            * header["num_board_adc_channels"],
-        )
-        data["board_adc_data"][
-            range(header["num_board_adc_channels"]),
-            indices["board_adc"] : (
-                indices["board_adc"] + header["num_samples_per_data_block"]
-            ),
-        ] = tmp.reshape(
-            header["num_board_adc_channels"], header["num_samples_per_data_block"]
-        )
+def read_data_blocks(filename, mode="r", header=None):
+    """Read the header of a file and memory-map its data section. A header already
+    returned by this function can be passed to skip parsing it again.
 
-    if header["num_board_dig_in_channels"] > 0:
-        data["board_dig_in_raw"][
-            indices["board_dig_in"] : (
-                indices["board_dig_in"] + header["num_samples_per_data_block"]
-            )
-        ] = np.array(
-            struct.unpack(
-                "<" + "H" * header["num_samples_per_data_block"],
-                fid.read(2 * header["num_samples_per_data_block"]),
-            )
-        )
+    Returns
+    -------
+    tuple
+        The header dict and a (n_blocks,) memmap array of data blocks with
+        `data_block_dtype(header)`. `blocks["amplifier"]` is for example a
+        (n_blocks, n_channels, n_samples_per_block) strided view of the file data.
 
-    if header["num_board_dig_out_channels"] > 0:
-        data["board_dig_out_raw"][
-            indices["board_dig_out"] : (
-                indices["board_dig_out"] + header["num_samples_per_data_block"]
-            )
-        ] = np.array(
-            struct.unpack(
-                "<" + "H" * header["num_samples_per_data_block"],
-                fid.read(2 * header["num_samples_per_data_block"]),
-            )
+    """
+    if header is None:
+        with open(filename, "rb") as fid:
+            header = read_header(fid)
+            header["data_offset"] = fid.tell()
+    data_offset = header["data_offset"]
+
+    dtype = data_block_dtype(header)
+    bytes_remaining = os.path.getsize(filename) - data_offset
+    if bytes_remaining % dtype.itemsize != 0:
+        raise Exception(
+            "Something is wrong with file size : should have a whole number of data blocks"
         )
 
+    num_data_blocks = bytes_remaining // dtype.itemsize
+    header["num_data_blocks"] = num_data_blocks
+    if num_data_blocks == 0:  # empty files cannot be memory-mapped
+        return header, np.zeros(0, dtype=dtype)
+    blocks = np.memmap(
+        filename, dtype=dtype, mode=mode, offset=data_offset, shape=(num_data_blocks,)
+    )
+    return header, blocks
+
+
+def blocks_to_signal(blocks, field):
+    """Concatenate the samples of one signal across data blocks. Signals with channels
+    are returned as (n_channels, n_samples) arrays, the others as (n_samples,).
+    Only the requested signal is copied in memory, in its raw dtype.
+    """
+    values = blocks[field]
+    if field in ["supply_voltage", "temp_sensor"]:  # one sample per block
+        return np.ascontiguousarray(values.T)
+    if values.ndim == 3:  # (n_blocks, n_channels, n_samples_per_block)
+        return values.transpose(1, 0, 2).reshape(values.shape[1], -1)
+    return values.reshape(-1)
+
+
+def unpack_digital(raw_words, channels):
+    """Boolean (n_channels, n_samples) array of digital channels packed in 16-bit words."""
+    masks = np.array([1 << ch["native_order"] for ch in channels], dtype=np.uint16)
+    return (np.asarray(raw_words)[None, :] & masks[:, None]) != 0
+
+
+def scale_signal(field, raw, header):
+    """Convert raw values of a signal to physical units, as float64."""
+    if field == "amplifier":
+        return 0.195 * (raw.astype(np.int32) - 32768)  # units = microvolts
+    if field == "aux_input":
+        return 37.4e-6 * raw  # units = volts
+    if field == "supply_voltage":
+        return 74.8e-6 * raw  # units = volts
+    if field == "board_adc":
+        if header["eval_board_mode"] == 1:
+            return 152.59e-6 * (raw.astype(np.int32) - 32768)  # units = volts
+        if header["eval_board_mode"] == 13:
+            return 312.5e-6 * (raw.astype(np.int32) - 32768)  # units = volts
+        return 50.354e-6 * raw  # units = volts
+    if field == "temp_sensor":
+        return 0.01 * raw  # units = deg C
+    if field == "timestamps":
+        return raw / header["sample_rate"]  # units = seconds
+    raise ValueError(f"No scaling defined for {field}.")
+
 
 # Define data_to_result function
 def data_to_result(header, data, data_present):
@@ -482,6 +470,9 @@ def data_to_result(header, data, data_present):
         if data_present:
             result["supply_voltage_data"] = data["supply_voltage_data"]
 
+    if header["num_temp_sensor_channels"] > 0 and data_present:
+        result["temp_sensor_data"] = data["temp_sensor_data"]
+
     if header["num_board_adc_channels"] > 0:
         result["board_adc_channels"] = header["board_adc_channels"]
         if data_present:
@@ -491,11 +482,13 @@ def data_to_result(header, data, data_present):
         result["board_dig_in_channels"] = header["board_dig_in_channels"]
         if data_present:
             result["board_dig_in_data"] = data["board_dig_in_data"]
+            result["board_dig_in_raw"] = data["board_dig_in_raw"]
 
     if header["num_board_dig_out_channels"] > 0:
         result["board_dig_out_channels"] = header["board_dig_out_channels"]
         if data_present:
             result["board_dig_out_data"] = data["board_dig_out_data"]
+            result["board_dig_out_raw"] = data["board_dig_out_raw"]
 
     return result
 
@@ -509,6 +502,8 @@ def plot_channel(channel_name, result):
 
     # Plot this channel
     if channel_found:
+        import matplotlib.pyplot as plt  # optional, only needed for plotting
+
         fig, ax = plt.subplots()
         ax.set_title(channel_name)
         ax.set_xlabel("Time (s)")
@@ -557,227 +552,56 @@ def plot_channel(channel_name, result):
         raise Exception("Plotting not possible; channel ", channel_name, " not found")
 
 
-# Define load_file function
-def load_file(filename):
-    # Start timing
-    tic = time.time()
-
-    # Open file
-    fid = open(filename, "rb")
-    filesize = os.path.getsize(filename)
-
-    # Read file header
-    header = read_header(fid)
-
-    # # Output a summary of recorded data
-    # print('Found {} amplifier channel{}.'.format(header['num_amplifier_channels'], plural(header['num_amplifier_channels'])))
-    # print('Found {} auxiliary input channel{}.'.format(header['num_aux_input_channels'], plural(header['num_aux_input_channels'])))
-    # print('Found {} supply voltage channel{}.'.format(header['num_supply_voltage_channels'], plural(header['num_supply_voltage_channels'])))
-    # print('Found {} board ADC channel{}.'.format(header['num_board_adc_channels'], plural(header['num_board_adc_channels'])))
-    # print('Found {} board digital input channel{}.'.format(header['num_board_dig_in_channels'], plural(header['num_board_dig_in_channels'])))
-    # print('Found {} board digital output channel{}.'.format(header['num_board_dig_out_channels'], plural(header['num_board_dig_out_channels'])))
-    # print('Found {} temperature sensors channel{}.'.format(header['num_temp_sensor_channels'], plural(header['num_temp_sensor_channels'])))
-    # print('')
-
-    # Determine how many samples the data file contains
-    bytes_per_block = get_bytes_per_data_block(header)
-
-    # Calculate how many data blocks are present
-    data_present = False
-    bytes_remaining = filesize - fid.tell()
-    if bytes_remaining > 0:
-        data_present = True
-
-    if bytes_remaining % bytes_per_block != 0:
-        raise Exception(
-            "Something is wrong with file size : should have a whole number of data blocks"
-        )
-
-    num_data_blocks = int(bytes_remaining / bytes_per_block)
-
-    # Calculate how many samples of each signal type are present
-    num_amplifier_samples = header["num_samples_per_data_block"] * num_data_blocks
-    num_aux_input_samples = int(
-        (header["num_samples_per_data_block"] / 4) * num_data_blocks
-    )
-    num_supply_voltage_samples = 1 * num_data_blocks
-    num_board_adc_samples = header["num_samples_per_data_block"] * num_data_blocks
-    num_board_dig_in_samples = header["num_samples_per_data_block"] * num_data_blocks
-    num_board_dig_out_samples = header["num_samples_per_data_block"] * num_data_blocks
-
-    # Calculate how much time has been recorded
-    record_time = num_amplifier_samples / header["sample_rate"]
-
-    # Output a summary of contents of header file
-    # if data_present:
-    #     print('File contains {:0.3f} seconds of data.  Amplifiers were sampled at {:0.2f} kS/s.'.format(record_time, header['sample_rate'] / 1000))
-    # else:
-    #     print('Header file contains no data.  Amplifiers were sampled at {:0.2f} kS/s.'.format(header['sample_rate'] / 1000))
-
-    if data_present:
-        # Pre-allocate memory for data
-        # print('')
-        # print('Allocating memory for data...')
-
-        data = {}
-        if (header["version"]["major"] == 1 and header["version"]["minor"] >= 2) or (
-            header["version"]["major"] > 1
-        ):
-            data["t_amplifier"] = np.zeros(num_amplifier_samples, dtype=np.int)
-        else:
-            data["t_amplifier"] = np.zeros(num_amplifier_samples, dtype=np.uint)
-
-        data["amplifier_data"] = np.zeros(
-            [header["num_amplifier_channels"], num_amplifier_samples], dtype=np.uint
-        )
-        data["aux_input_data"] = np.zeros(
-            [header["num_aux_input_channels"], num_aux_input_samples], dtype=np.uint
-        )
-        data["supply_voltage_data"] = np.zeros(
-            [header["num_supply_voltage_channels"], num_supply_voltage_samples],
-            dtype=np.uint,
-        )
-        data["temp_sensor_data"] = np.zeros(
-            [header["num_temp_sensor_channels"], num_supply_voltage_samples],
-            dtype=np.uint,
-        )
-        data["board_adc_data"] = np.zeros(
-            [header["num_board_adc_channels"], num_board_adc_samples], dtype=np.uint
-        )
+def _read_signal(blocks, field, header, scale):
+    """Copy of a signal from the data blocks, scaled if `scale`."""
+    raw = blocks_to_signal(blocks, field)
+    return scale_signal(field, raw, header) if scale else raw
 
-        # by default, this script interprets digital events (digital inputs and outputs) as booleans
-        # if unsigned int values are preferred(0 for False, 1 for True), replace the 'dtype=np.bool' argument with 'dtype=np.uint' as shown
-        # the commented line below illustrates this for digital input data; the same can be done for digital out
 
-        # data['board_dig_in_data'] = np.zeros([header['num_board_dig_in_channels'], num_board_dig_in_samples], dtype=np.uint)
-        data["board_dig_in_data"] = np.zeros(
-            [header["num_board_dig_in_channels"], num_board_dig_in_samples],
-            dtype=np.bool,
-        )
-        data["board_dig_in_raw"] = np.zeros(num_board_dig_in_samples, dtype=np.uint)
+# Define load_file function
+def load_file(filename, scale=True):
+    """Load all data from a .rhd file.
+
+    Parameters
+    ----------
+    filename : str or Path
+        File to read.
+    scale : bool
+        If True, signals are converted to physical units and times to seconds;
+        otherwise raw uint16 values and integer timestamps are returned.
+
+    Returns
+    -------
+    dict
+        Channel information and data of all signals in the file, or None if the
+        file contains no data.
 
-        data["board_dig_out_data"] = np.zeros(
-            [header["num_board_dig_out_channels"], num_board_dig_out_samples],
-            dtype=np.bool,
-        )
-        data["board_dig_out_raw"] = np.zeros(num_board_dig_out_samples, dtype=np.uint)
-
-        # Read sampled data from file.
-        # print('Reading data from file...')
-
-        # Initialize indices used in looping
-        indices = {}
-        indices["amplifier"] = 0
-        indices["aux_input"] = 0
-        indices["supply_voltage"] = 0
-        indices["board_adc"] = 0
-        indices["board_dig_in"] = 0
-        indices["board_dig_out"] = 0
-
-        # print_increment = 10
-        # percent_done = print_increment
-        for i in range(num_data_blocks):
-            read_one_data_block(data, header, indices, fid)
-
-            # Increment indices
-            indices["amplifier"] += header["num_samples_per_data_block"]
-            indices["aux_input"] += int(header["num_samples_per_data_block"] / 4)
-            indices["supply_voltage"] += 1
-            indices["board_adc"] += header["num_samples_per_data_block"]
-            indices["board_dig_in"] += header["num_samples_per_data_block"]
-            indices["board_dig_out"] += header["num_samples_per_data_block"]
-
-            fraction_done = 100 * (1.0 * i / num_data_blocks)
-        #     if fraction_done >= percent_done:
-        #         print('{}% done...'.format(percent_done))
-        #         percent_done = percent_done + print_increment
-        #
-        # print('100% done...')
-
-        # Make sure we have read exactly the right amount of data
-        bytes_remaining = filesize - fid.tell()
-        if bytes_remaining != 0:
-            raise Exception("Error: End of file not reached.")
-
-    fid.close()
-
-    if data_present:
-        # print('Parsing data...')
-
-        # Extract digital input channels to separate variables
-        for i in range(header["num_board_dig_in_channels"]):
-            data["board_dig_in_data"][i, :] = np.not_equal(
-                np.bitwise_and(
-                    data["board_dig_in_raw"],
-                    (1 << header["board_dig_in_channels"][i]["native_order"]),
-                ),
-                0,
-            )
+    """
+    header, blocks = read_data_blocks(filename)
+    if len(blocks) == 0:
+        return None
 
-        # Extract digital output channels to separate variables
-        for i in range(header["num_board_dig_out_channels"]):
-            data["board_dig_out_data"][i, :] = np.not_equal(
-                np.bitwise_and(
-                    data["board_dig_out_raw"],
-                    (1 << header["board_dig_out_channels"][i]["native_order"]),
-                ),
-                0,
+    data = {}
+    data["t_amplifier"] = _read_signal(blocks, "timestamps", header, scale)
+    for field in ["amplifier", "aux_input", "supply_voltage", "temp_sensor", "board_adc"]:
+        if field in blocks.dtype.names:
+            data[field + "_data"] = _read_signal(blocks, field, header, scale)
+
+    for field in ["board_dig_in", "board_dig_out"]:
+        if field in blocks.dtype.names:
+            data[field + "_raw"] = blocks_to_signal(blocks, field)
+            data[field + "_data"] = unpack_digital(
+                data[field + "_raw"], header[field + "_channels"]
             )
 
-        # Scale voltage levels appropriately
-        data["amplifier_data"] = np.multiply(
-            0.195, (data["amplifier_data"].astype(np.int32) - 32768)
-        )  # units = microvolts
-        data["aux_input_data"] = np.multiply(
-            37.4e-6, data["aux_input_data"]
-        )  # units = volts
-        data["supply_voltage_data"] = np.multiply(
-            74.8e-6, data["supply_voltage_data"]
-        )  # units = volts
-        if header["eval_board_mode"] == 1:
-            data["board_adc_data"] = np.multiply(
-                152.59e-6, (data["board_adc_data"].astype(np.int32) - 32768)
-            )  # units = volts
-        elif header["eval_board_mode"] == 13:
-            data["board_adc_data"] = np.multiply(
-                312.5e-6, (data["board_adc_data"].astype(np.int32) - 32768)
-            )  # units = volts
-        else:
-            data["board_adc_data"] = np.multiply(
-                50.354e-6, data["board_adc_data"]
-            )  # units = volts
-        data["temp_sensor_data"] = np.multiply(
-            0.01, data["temp_sensor_data"]
-        )  # units = deg C
-
-        # Check for gaps in timestamps
-        num_gaps = np.sum(
-            np.not_equal(data["t_amplifier"][1:] - data["t_amplifier"][:-1], 1)
-        )
-        # if num_gaps == 0:
-        #     print('No missing timestamps in data.')
-        # else:
-        #     print('Warning: {0} gaps in timestamp data found.  Time scale will not be uniform!'.format(num_gaps))
-
-        # Scale time steps (units = seconds)
-        data["t_amplifier"] = data["t_amplifier"] / header["sample_rate"]
-        data["t_aux_input"] = data["t_amplifier"][range(0, len(data["t_amplifier"]), 4)]
-        data["t_supply_voltage"] = data["t_amplifier"][
-            range(0, len(data["t_amplifier"]), header["num_samples_per_data_block"])
-        ]
-        data["t_board_adc"] = data["t_amplifier"]
-        data["t_dig"] = data["t_amplifier"]
-        data["t_temp_sensor"] = data["t_supply_voltage"]
-
-    else:
-        return None
+    data["t_aux_input"] = data["t_amplifier"][::4]
+    data["t_supply_voltage"] = data["t_amplifier"][:: header["num_samples_per_data_block"]]
+    data["t_board_adc"] = data["t_amplifier"]
+    data["t_dig"] = data["t_amplifier"]
+    data["t_temp_sensor"] = data["t_supply_voltage"]
 
     # Move variables to result struct
-    result = data_to_result(header, data, data_present)
-
-    # print('Done!  Elapsed time: {0:0.1f} seconds'.format(time.time() - tic))
-
-    return result
+    return data_to_result(header, data, True)
 
 
 #
@@ -0,0 +1,273 @@
+"""Reading of recording sessions that Intan splits into many consecutive .rhd files.
+
+`RhdSession` checks that all the files of a session have compatible headers and
+contiguous timestamps, and loads a signal from all of them in parallel, with every
+file decoded in a worker process straight into its slice of an output in shared
+memory (or of a .npy memory map on disk, for sessions that do not fit in memory):
+
+    session = RhdSession("path/to/intan/folder")
+    dig_in = session.load("board_dig_in", channels=[1])
+    amplifier = session.load("amplifier", out_path="amplifier.npy")
+"""
+import warnings
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from sisyphy.barcode_synch.analysis.rhd_file import RhdFile
+from sisyphy.barcode_synch.analysis.rhd_reading import data_block_dtype
+
+# Header entries that must be equal in all the files of a session:
+COMPATIBILITY_KEYS = ["sample_rate", "num_samples_per_data_block", "version", "eval_board_mode"]
+# Channel lists that must have the same channels, in the same order, in all the files:
+CHANNEL_KEYS = [
+    "amplifier_channels",
+    "aux_input_channels",
+    "supply_voltage_channels",
+    "board_adc_channels",
+    "board_dig_in_channels",
+    "board_dig_out_channels",
+]
+
+
+@dataclass
+class TimestampDiscontinuity:
+    """Jump in the timestamps between the end of a file and the start of the next."""
+
+    file_index: int  # index of the file starting after the discontinuity
+    sample_index: int  # index of the first sample of that file in the session
+    expected_timestamp: int
+    timestamp: int
+
+    @property
+    def n_samples(self) -> int:
+        """Number of missing samples (gap) if positive, repeated samples (overlap) if negative."""
+        return self.timestamp - self.expected_timestamp
+
+
+# Number of samples decoded at once by each worker:
+LOAD_CHUNK_SIZE = 2 ** 18
+
+
+@dataclass
+class _SharedOutput:
+    """Output array in a shared memory block, that workers attach to by name."""
+
+    name: str
+    shape: tuple
+    dtype: str
+
+
+def _load_file_signal(filename, header, name, channels, scale, out, start):
+    """Decode a signal from a file, chunk by chunk, into its slice of the output.
+
+    `out` is an array of this process, a `_SharedOutput` or the path of a .npy file
+    to memory-map, so that nothing has to be sent back to the parent process.
+    """
+    shm = None
+    if isinstance(out, _SharedOutput):
+        shm = SharedMemory(name=out.name)
+        array = np.ndarray(out.shape, dtype=out.dtype, buffer=shm.buf)
+    elif isinstance(out, Path):
+        array = np.load(out, mmap_mode="r+")
+    else:
+        array = out
+
+    signal = getattr(RhdFile(filename, scale=scale, header=header), name)
+    for chunk_start, values in signal.iter_chunks(chunk_size=LOAD_CHUNK_SIZE, channels=channels):
+        first = start + chunk_start
+        array[..., first : first + values.shape[-1]] = values
+
+    if isinstance(array, np.memmap):
+        array.flush()
+    del array
+    if shm is not None:
+        shm.close()
+
+
+def _channel_ids(channels: List[dict]) -> List[Tuple[str, int]]:
+    return [(c["native_channel_name"], c["native_order"]) for c in channels]
+
+
+class RhdSession:
+    """Set of consecutive .rhd files read as a single recording."""
+
+    def __init__(self, files: Union[str, Path, Sequence[Union[str, Path]]], scale: bool = True):
+        """
+        Parameters
+        ----------
+        files : str, Path or list
+            Directory with the .rhd files of the session, or list of files. Files are
+            read in alphabetical order, which is the temporal order with Intan naming.
+        scale : bool
+            If True, analog signals are converted to physical units and timestamps
+            to seconds; otherwise raw integers are returned.
+
+        """
+        if isinstance(files, (str, Path)):
+            files = sorted(Path(files).glob("*.rhd"))
+        else:
+            files = sorted(Path(f) for f in files)
+        if len(files) == 0:
+            raise ValueError("No .rhd file found.")
+
+        self.scale = scale
+        self.files = [RhdFile(f, scale=scale) for f in files]
+        self._check_headers()
+        self.discontinuities = self._find_discontinuities()
+        for d in self.discontinuities:
+            kind = "gap" if d.n_samples > 0 else "overlap"
+            warnings.warn(
+                f"Timestamp {kind} of {abs(d.n_samples)} samples before {self.files[d.file_index].filename}."
+            )
+
+    def _check_headers(self):
+        reference = self.files[0].header
+        for rhd in self.files[1:]:
+            for key in COMPATIBILITY_KEYS:
+                if rhd.header[key] != reference[key]:
+                    raise ValueError(f"Different {key} in {rhd.filename} and {self.files[0].filename}.")
+            for key in CHANNEL_KEYS:
+                if _channel_ids(rhd.header[key]) != _channel_ids(reference[key]):
+                    raise ValueError(
+                        f"Different {key} (names or order) in {rhd.filename} and {self.files[0].filename}."
+                    )
+            if data_block_dtype(rhd.header) != data_block_dtype(reference):
+                raise ValueError(f"Different channels in {rhd.filename} and {self.files[0].filename}.")
+
+    def _find_discontinuities(self) -> List[TimestampDiscontinuity]:
+        discontinuities = []
+        sample_index = 0
+        previous_last = None
+        for i, rhd in enumerate(self.files):
+            if len(rhd) == 0:
+                continue
+            timestamps = rhd.blocks["timestamps"]
+            first, last = int(timestamps[0, 0]), int(timestamps[-1, -1])
+            if previous_last is not None and first != previous_last + 1:
+                discontinuities.append(
+                    TimestampDiscontinuity(
+                        file_index=i,
+                        sample_index=sample_index,
+                        expected_timestamp=previous_last + 1,
+                        timestamp=first,
+                    )
+                )
+            previous_last = last
+            sample_index += len(rhd)
+        return discontinuities
+
+    def cache_identity(self) -> tuple:
+        """Identity of the session files for the analysis cache."""
+        return tuple(rhd.cache_identity() for rhd in self.files)
+
+    @property
+    def header(self) -> dict:
+        return self.files[0].header
+
+    @property
+    def sample_rate(self) -> float:
+        return self.header["sample_rate"]
+
+    @property
+    def n_samples(self) -> int:
+        return sum(len(rhd) for rhd in self.files)
+
+    def __len__(self) -> int:
+        return self.n_samples
+
+    def file_starts(self, name: str = "amplifier") -> np.ndarray:
+        """Index of the first sample of each file in the session for the signal `name`."""
+        lengths = [len(getattr(rhd, name)) for rhd in self.files]
+        return np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+
+    def iter_chunks(
+        self, name: str, chunk_size: int = 2 ** 20, channels=slice(None)
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """Iterate over (first sample index in the session, values) chunks of a signal,
+        file after file. Chunks do not span across files.
+        """
+        for rhd, file_start in zip(self.files, self.file_starts(name)):
+            for start, values in rhd.iter_chunks(name, chunk_size=chunk_size, channels=channels):
+                yield int(file_start) + start, values
+
+    def load(
+        self,
+        name: str,
+        channels=slice(None),
+        out_path: Union[str, Path] = None,
+        n_workers: int = None,
+    ) -> np.ndarray:
+        """Load a signal from all files, concatenated along the last (time) axis.
+
+        Parameters
+        ----------
+        name : str
+            Signal to load (e.g. "amplifier", "board_dig_in", "timestamps").
+        channels : int, slice or list
+            Channels to load, for signals with channels.
+        out_path : str or Path
+            If given, the signal is written to this .npy file and returned as a
+            memory map, so that sessions larger than memory can be loaded.
+        n_workers : int
+            Number of worker processes (defaults to the number of cores);
+            with 1, files are read sequentially in this process.
+
+        Returns
+        -------
+        np.ndarray
+            Signal of the whole session, backed by the buffer the workers wrote it to
+            (shared memory, or the .npy memory map). Gaps and overlaps (see
+            `discontinuities`) are not filled or removed.
+
+        """
+        starts = self.file_starts(name)
+        first_signal = getattr(self.files[0], name)
+        sample = first_signal[0:1] if first_signal.n_channels == 0 else first_signal[channels, 0:1]
+        shape = sample.shape[:-1] + (int(starts[-1]) + len(getattr(self.files[-1], name)),)
+
+        shm = None
+        if out_path is not None:
+            out_path = Path(out_path)
+            # Create the file, then every worker writes its slice:
+            np.lib.format.open_memmap(out_path, mode="w+", dtype=sample.dtype, shape=shape).flush()
+            target = out_path
+        elif n_workers == 1:
+            out = target = np.empty(shape, dtype=sample.dtype)
+        else:
+            nbytes = max(1, int(np.prod(shape)) * sample.dtype.itemsize)
+            shm = SharedMemory(create=True, size=nbytes)
+            target = _SharedOutput(shm.name, shape, sample.dtype.str)
+
+        jobs = [
+            (rhd.filename, rhd.header, name, channels, self.scale, target, start)
+            for rhd, start in zip(self.files, starts)
+        ]
+        try:
+            if n_workers == 1:
+                for job in jobs:
+                    _load_file_signal(*job)
+            else:
+                with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                    list(executor.map(_load_file_signal, *zip(*jobs)))
+        except BaseException:
+            if shm is not None:
+                shm.close()
+            raise
+        finally:
+            if shm is not None:
+                shm.unlink()  # the block lives on while it is mapped here
+
+        if shm is not None:
+            # The signal stays in the shared block: it is unmapped only when the array
+            # (which all its views keep alive) is garbage collected.
+            out = np.ndarray(shape, dtype=sample.dtype, buffer=shm.buf)
+            weakref.finalize(out, shm.close).atexit = False
+        if out_path is not None:
+            return np.load(out_path, mmap_mode="r+")
+        return out
@@ -2,6 +2,8 @@
 """
 import numpy as np
 
+from sisyphy.barcode_synch.bcode_dataclasses import BarcodeSpec
+
 
 def find_single_barcode(barcode_array, fs_hz):
     """Find complete barcode in array of voltage reads. The barcode has to be completely
@@ -55,3 +57,179 @@ def find_single_barcode(barcode_array, fs_hz):
 
     # Convert sequence to binary number and return with index:
     return wrapper_indexes[0], sum(bit_base * bool_bits)
+
+
+class BarcodeStreamDecoder:
+    """Incremental, edge-based barcode decoder for continuously acquired chunks.
+
+    Signal transitions are kept in a buffer across chunks, so barcodes straddling
+    chunk boundaries or following each other closely are all detected, each exactly
+    once. Apart from the thresholding of the incoming samples, the work done for each
+    chunk scales with the number of transitions and not with the chunk length.
+
+    Every decoded barcode is returned as a (sample_index, code) tuple, where
+    sample_index is the absolute index (counting from the first sample ever passed to
+    the decoder) of the first high sample of the start wrapper.
+    """
+
+    def __init__(self, fs_hz: float, spec: BarcodeSpec = None, buffer_size: int = 4096):
+        """
+        Parameters
+        ----------
+        fs_hz : float
+            Sampling rate of the signal, in Hz.
+        spec : BarcodeSpec
+            Timing parameters of the barcodes (defaults to the Arduino ones).
+        buffer_size : int
+            Maximum number of pending transitions. Transitions that cannot belong to
+            a barcode are discarded, so this only matters for very noisy signals.
+
+        """
+        self.spec = spec if spec is not None else BarcodeSpec()
+        self.fs_hz = fs_hz
+
+        self._wrap_pts = int(self.spec.wrapper_width_s * fs_hz)
+        self._bit_pts = int(self.spec.bit_width_s * fs_hz)
+        self._duration_thr_pts = int(self.spec.duration_thr_s * fs_hz)
+        self._end_tolerance_pts = max(self._wrap_pts // 2, 1)
+        self._barcode_pts = 4 * self._wrap_pts + self.spec.n_bits * self._bit_pts
+        self._bit_offsets = (
+            2 * self._wrap_pts
+            + self._bit_pts // 2
+            + np.arange(self.spec.n_bits) * self._bit_pts
+        )
+        self._bit_base = 2 ** np.arange(self.spec.n_bits, dtype=np.int64)
+
+        # Pending transitions, live between self._start and self._n:
+        self._edge_idx = np.empty(buffer_size, dtype=np.int64)
+        self._edge_rising = np.empty(buffer_size, dtype=bool)
+        self._start = 0
+        self._n = 0
+
+        self.n_samples = 0  # total number of samples seen so far
+        self._level = False  # last sample level
+
+    def process(self, chunk: np.ndarray) -> list:
+        """Process a new chunk of voltage samples, and return the list of
+        (sample_index, code) for all the barcodes completed within it.
+        """
+        high = np.asarray(chunk).ravel() > self.spec.sig_thr
+        if len(high) == 0:
+            return []
+        changes = np.flatnonzero(high[1:] != high[:-1]) + 1
+        if high[0] != self._level:
+            changes = np.concatenate([[0], changes])
+
+        edge_idx = changes + self.n_samples
+        rising = high[changes]
+        self._level = bool(high[-1])
+
+        return self.process_edges(edge_idx, rising, self.n_samples + len(high))
+
+    def process_edges(
+        self, edge_idx: np.ndarray, rising: np.ndarray, n_samples: int
+    ) -> list:
+        """Process transitions coming from an external edge detector.
+
+        Parameters
+        ----------
+        edge_idx : np.ndarray
+            Absolute sample indexes of the transitions (first sample at the new level).
+        rising : np.ndarray
+            Boolean array, True for low-to-high transitions.
+        n_samples : int
+            Total number of samples acquired so far (all transitions before this
+            sample index must have been passed).
+
+        """
+        self._append_edges(np.asarray(edge_idx), np.asarray(rising))
+        self.n_samples = n_samples
+        return self._decode()
+
+    def _append_edges(self, edge_idx, rising):
+        n_new = len(edge_idx)
+        if n_new == 0:
+            return
+        capacity = len(self._edge_idx)
+        if self._n + n_new > capacity:
+            # Compact live transitions to the beginning of the buffer:
+            n_live = self._n - self._start
+            if n_live + n_new > capacity:
+                # Too many pending transitions, drop the oldest ones:
+                n_drop = n_live + n_new - capacity
+                self._start += n_drop
+                n_live -= n_drop
+            self._edge_idx[:n_live] = self._edge_idx[self._start : self._n]
+            self._edge_rising[:n_live] = self._edge_rising[self._start : self._n]
+            self._start, self._n = 0, n_live
+            if n_new > capacity:
+                edge_idx, rising = edge_idx[-capacity:], rising[-capacity:]
+                n_new = capacity
+
+        self._edge_idx[self._n : self._n + n_new] = edge_idx
+        self._edge_rising[self._n : self._n + n_new] = rising
+        self._n += n_new
+
+    def _find_wrapper(self, idx, rising, first):
+        """Return position of the first wrapper (short high pulse) starting from
+        `first` in the idx and rising arrays, or None.
+        """
+        candidates = np.flatnonzero(
+            rising[first:-1]
+            & ~rising[first + 1 :]
+            & (np.diff(idx[first:]) < self._duration_thr_pts)
+        )
+        if len(candidates) == 0:
+            return None
+        return first + candidates[0]
+
+    def _decode(self) -> list:
+        found = []
+        idx = self._edge_idx[self._start : self._n]
+        rising = self._edge_rising[self._start : self._n]
+        pos = 0
+        while True:
+            wrapper_pos = self._find_wrapper(idx, rising, pos)
+            if wrapper_pos is None:
+                # Keep a trailing rising edge, that could be the start of a wrapper:
+                pos = len(idx) - 1 if len(idx) > 0 and rising[-1] else len(idx)
+                break
+
+            barcode_start = idx[wrapper_pos]
+            # Wait until the whole barcode and the end wrapper have been acquired:
+            if (
+                self.n_samples
+                < barcode_start + self._barcode_pts + self._end_tolerance_pts
+            ):
+                pos = wrapper_pos
+                break
+
+            # Look for the end wrapper where it is expected:
+            expected_end = barcode_start + self._barcode_pts - self._wrap_pts
+            end_pos = wrapper_pos + 2
+            end_pos += np.searchsorted(
+                idx[end_pos:], expected_end - self._end_tolerance_pts
+            )
+            if (
+                end_pos + 1 < len(idx)
+                and rising[end_pos]
+                and abs(idx[end_pos] - expected_end) <= self._end_tolerance_pts
+                and not rising[end_pos + 1]
+                and idx[end_pos + 1] - idx[end_pos] < self._duration_thr_pts
+            ):
+                # Read levels at the center of each bit from the last preceding edge:
+                bit_edges = (
+                    np.searchsorted(
+                        idx[:end_pos], barcode_start + self._bit_offsets, side="right"
+                    )
+                    - 1
+                )
+                bool_bits = rising[bit_edges]
+                found.append((int(barcode_start), int(np.sum(self._bit_base * bool_bits))))
+                pos = end_pos + 2
+            else:
+                # Not a valid barcode start, move on to the next wrapper:
+                pos = wrapper_pos + 2
+
+        self._start += pos
+        return found
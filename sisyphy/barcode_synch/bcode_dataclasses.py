@@ -3,6 +3,40 @@ from dataclasses import dataclass
 
 @dataclass
 class TimeStampData:
+    # Both times are monotonic ns, see sisyphy.utils.timebase
     t_ns_buffer_stream: int
     t_ns_code: int
     code: int
+    sample_index: int  # index of the barcode start in the acquisition sample stream
+
+
+@dataclass
+class BarcodeSpec:
+    """Timing parameters of the Arduino-generated barcodes. Each barcode is made of a
+    start wrapper (off-on-off, `wrapper_width_s` each), `n_bits` bits of `bit_width_s`,
+    and an end wrapper identical to the start one.
+    """
+
+    n_bits: int = 32
+    bit_width_s: float = 0.030  # duration of each bit in s
+    wrapper_width_s: float = 0.010  # duration of the wrapper in s
+    duration_thr_s: float = 0.015  # duration in s below which one pulse is considered a wrapper
+    sig_thr: float = 2.5  # threshold on signal for ON
+    inter_barcode_interval_s: float = 5.0  # interval between barcode onsets
+    tolerance: float = 0.2  # fraction of tolerance allowed for duration measurements
+
+    @property
+    def duration_s(self) -> float:
+        """Duration from the start wrapper onset to the end wrapper offset."""
+        return 4 * self.wrapper_width_s + self.n_bits * self.bit_width_s
+
+
+@dataclass
+class ClockSyncedData:
+    """A data sample (e.g. sphere velocities) annotated with the time of the DAQ clock
+    at which it was acquired, as estimated online from the barcodes.
+    """
+
+    sample: object
+    t_daq_s: float  # estimated DAQ clock time (sample index / fs), nan if not available
+    t_daq_err_s: float  # standard error of the estimate, inf if not available
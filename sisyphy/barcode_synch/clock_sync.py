@@ -0,0 +1,241 @@
+"""Online synchronization of data samples with the DAQ clock.
+
+Every barcode decoded by `NiTimeStampProcess` pairs a reading of the monotonic clock
+of the PC (`t_ns_code`) with a reading of the DAQ clock (`sample_index / fs`).
+`SlidingClockRegression` keeps a linear fit of the DAQ clock as a function of the
+monotonic clock over the last barcodes, and `ClockSyncProcess` uses it to stamp
+every sample coming from a reader process with its estimated DAQ time while the
+experiment is running.
+"""
+from collections import deque
+from multiprocessing import Event
+from typing import Tuple
+
+import numpy as np
+
+from sisyphy.barcode_synch.bcode_dataclasses import ClockSyncedData
+from sisyphy.utils.custom_queue import SaturatingQueue
+from sisyphy.utils.process import TerminableProcess
+
+
+class SlidingClockRegression:
+    """Incremental least squares fit of y = f(x) over a sliding window of pairs,
+    where x is a monotonic timestamp in ns and y a time in s of a second clock.
+
+    Running sums are updated in O(1) for every new pair. To keep precision, the
+    regression is done on the offset y - x (that only changes with drift), relative
+    to an origin that is moved to the oldest pair every time the sums are
+    recomputed from scratch (once every `window` updates).
+    """
+
+    def __init__(self, window: int = 60):
+        """
+        Parameters
+        ----------
+        window : int
+            Number of most recent pairs used in the fit. With barcodes every 5 s,
+            the default covers the last 5 minutes.
+        """
+        self.window = window
+        self._pairs = deque()
+        self._n_updates = 0
+        self._x0_ns, self._y0_s = 0, 0.0
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self._n = 0
+        self._sx = self._sxx = self._sd = self._sxd = self._sdd = 0.0
+
+    def _accumulate(self, x_ns, y_s, sign):
+        x = (x_ns - self._x0_ns) * 1e-9
+        d = (y_s - self._y0_s) - x
+        self._n += sign
+        self._sx += sign * x
+        self._sxx += sign * x * x
+        self._sd += sign * d
+        self._sxd += sign * x * d
+        self._sdd += sign * d * d
+
+    def _recompute(self):
+        self._x0_ns, self._y0_s = self._pairs[0]
+        self._reset_sums()
+        for x_ns, y_s in self._pairs:
+            self._accumulate(x_ns, y_s, 1)
+
+    def update(self, x_ns: int, y_s: float) -> None:
+        """Add a new pair, dropping the oldest one if the window is full."""
+        x_ns, y_s = int(x_ns), float(y_s)
+        self._pairs.append((x_ns, y_s))
+        if len(self._pairs) == 1:
+            self._recompute()
+            return
+
+        self._accumulate(x_ns, y_s, 1)
+        if len(self._pairs) > self.window:
+            self._accumulate(*self._pairs.popleft(), -1)
+
+        self._n_updates += 1
+        if self._n_updates % self.window == 0:
+            self._recompute()
+
+    @property
+    def n(self) -> int:
+        return self._n
+
+    def _fit(self):
+        """Intercept and slope of the offset fit, residual variance, mean and
+        centered sum of squares of x."""
+        n = self._n
+        mean_x = self._sx / n
+        sxx_c = self._sxx - self._sx * mean_x
+        sxd_c = self._sxd - self._sx * self._sd / n
+        b = sxd_c / sxx_c if n > 1 and sxx_c > 0 else 0.0
+        a = self._sd / n - b * mean_x
+        if n > 2:
+            sse = max(self._sdd - self._sd * self._sd / n - b * sxd_c, 0.0)
+            var = sse / (n - 2)
+        else:
+            var = np.nan
+        return a, b, var, mean_x, sxx_c
+
+    @property
+    def drift_ppm(self) -> float:
+        """Drift of the y clock with respect to the x clock, in parts per million."""
+        if self._n < 2:
+            return np.nan
+        return self._fit()[1] * 1e6
+
+    @property
+    def residual_std_s(self) -> float:
+        """Standard deviation of the residuals of the fit, in s."""
+        if self._n < 3:
+            return np.nan
+        return float(np.sqrt(self._fit()[2]))
+
+    def predict(self, x_ns) -> Tuple[np.ndarray, np.ndarray]:
+        """Estimate y for monotonic timestamps `x_ns` (scalar or array).
+
+        Returns
+        -------
+        tuple
+            Estimated y, in s, and standard error of the estimate. Without pairs the
+            estimate is nan; with a single pair the clocks are assumed to run at the
+            same rate, and the error is inf (as long as it cannot be estimated).
+
+        """
+        x_ns = np.asarray(x_ns, dtype=np.int64)
+        if self._n == 0:
+            return np.full(x_ns.shape, np.nan), np.full(x_ns.shape, np.inf)
+
+        x = (x_ns - np.int64(self._x0_ns)).astype(np.float64) * 1e-9
+        a, b, var, mean_x, sxx_c = self._fit()
+        y = self._y0_s + x + a + b * x
+        if self._n > 2 and sxx_c > 0:
+            err = np.sqrt(var * (1 / self._n + (x - mean_x) ** 2 / sxx_c))
+        else:
+            err = np.full(x.shape, np.inf)
+        return y, err
+
+
+class ClockSyncProcess(TerminableProcess):
+    """Process consuming the barcode timestamps from a `NiTimeStampProcess` and the
+    samples of a reader process (anything with a monotonic `t_ns`, e.g. sphere
+    velocities), and streaming each sample as `ClockSyncedData` with its estimated
+    DAQ clock time in `data_queue`.
+    """
+
+    def __init__(
+        self,
+        *args,
+        sphere_data_queue=None,
+        tstamp_queue=None,
+        fs: int = None,
+        kill_event: Event = None,
+        window: int = 60,
+        poll_interval_s: float = 0.05,
+        **kwargs,
+    ):
+        """
+        Parameters
+        ----------
+        sphere_data_queue : SaturatingQueue
+            Queue of the samples to synchronize.
+        tstamp_queue : SaturatingQueue
+            Queue of TimeStampData from the timestamping process.
+        fs : int
+            Sampling rate of the timestamping DAQ, in Hz.
+        kill_event : Event
+            Termination event.
+        window : int
+            Number of most recent barcodes used to estimate the clock drift.
+        poll_interval_s : float
+            Maximum waiting time between checks of the kill event, if there's no new
+            sample to process.
+
+        """
+        self.sphere_data_queue = sphere_data_queue
+        self.tstamp_queue = tstamp_queue
+        self.fs = fs
+        self.window = window
+        self.data_queue = SaturatingQueue()
+
+        super(ClockSyncProcess, self).__init__(
+            kill_event,
+            *args,
+            wake_sources=[sphere_data_queue, tstamp_queue],
+            max_wait_s=poll_interval_s,
+            **kwargs,
+        )
+
+    def before_loop(self) -> None:
+        self.regression = SlidingClockRegression(window=self.window)
+
+    def loop(self) -> None:
+        for tstamp in self.tstamp_queue.get_all():
+            self.regression.update(tstamp.t_ns_code, tstamp.sample_index / self.fs)
+
+        samples = self.sphere_data_queue.get_all()
+        if len(samples) == 0:
+            return
+
+        t_daq_s, t_daq_err_s = self.regression.predict([s.t_ns for s in samples])
+        for sample, t, err in zip(samples, t_daq_s, t_daq_err_s):
+            self.data_queue.put(
+                ClockSyncedData(sample=sample, t_daq_s=float(t), t_daq_err_s=float(err))
+            )
+        self.monitor.count(len(samples))
+
+
+if __name__ == "__main__":
+    from time import sleep
+
+    from sisyphy.barcode_synch.daq_backends import SimulatedDaqBackend
+    from sisyphy.barcode_synch.timestamping_process import NiTimeStampProcess
+    from sisyphy.hardware_readers import MockSphereReaderProcess
+
+    FS = 10000
+    kill_evt = Event()
+    p_tstamp = NiTimeStampProcess(
+        kill_event=kill_evt,
+        frame_duration=0.1,
+        fs=FS,
+        backend=SimulatedDaqBackend(FS, 1000, barcode_interval_s=2.0, drift_ppm=100),
+    )
+    p_mouse = MockSphereReaderProcess(kill_event=kill_evt)
+    p_sync = ClockSyncProcess(
+        kill_event=kill_evt,
+        sphere_data_queue=p_mouse.data_queue,
+        tstamp_queue=p_tstamp.data_queue,
+        fs=FS,
+    )
+
+    for p in [p_tstamp, p_mouse, p_sync]:
+        p.start()
+    for _ in range(10):
+        sleep(2)
+        synced = p_sync.data_queue.get_all()
+        if len(synced) > 0:
+            print(f"{len(synced)} samples, last: {synced[-1]}")
+    kill_evt.set()
+    for p in [p_tstamp, p_mouse, p_sync]:
+        p.join()
@@ -0,0 +1,363 @@
+"""Acquisition backends for the barcode timestamping.
+
+A backend acquires a single analog channel continuously and calls a callback with
+every new frame of `samples_per_frame` samples. `NiDaqBackend` reads from a NI board,
+`SimulatedDaqBackend` generates Arduino-style barcodes so that the timestamping can be
+tested and benchmarked without hardware.
+"""
+import abc
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from sisyphy.barcode_synch.bcode_dataclasses import BarcodeSpec
+from sisyphy.utils.timebase import monotonic_ns
+
+
+class DaqBackend(metaclass=abc.ABCMeta):
+    """Base interface for a continuous single channel acquisition.
+
+    Public methods
+    --------------
+        start:
+            Start the acquisition, calling `callback(frame)` with a 1D array every
+            time `samples_per_frame` new samples have been acquired. The callback
+            is called from a thread owned by the backend.
+
+        stop:
+            Stop the acquisition and release the device.
+
+    """
+
+    def __init__(self, fs: int, samples_per_frame: int):
+        self.fs = fs
+        self.samples_per_frame = samples_per_frame
+
+    @abc.abstractmethod
+    def start(self, callback: Callable[[np.ndarray], None]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def stop(self) -> None:
+        pass
+
+
+class NiDaqBackend(DaqBackend):
+    """Acquisition from an analog input of a NI board through nidaqmx.
+    Code adapted from https://github.com/mjablons1/nidaqmx-continuous-analog-io.
+    """
+
+    def __init__(
+        self,
+        fs: int,
+        samples_per_frame: int,
+        device_name: str,
+        device_channel: str,
+        frames_per_buffer: int = 10,
+    ):
+        """
+        Parameters
+        ----------
+        fs : int
+            Sampling rate of the board, in Hz.
+        samples_per_frame : int
+            Number of samples after which the callback is called.
+        device_name : str
+            name of NI device.
+        device_channel : str
+            channel of NI device.
+        frames_per_buffer : int
+            Number of reading frames in the board buffer. Not sure about the effects. 10 works with NI USB6008.
+        """
+        # for some reason should be integer dividend of 10000
+        if (10000 / samples_per_frame) % 1 != 0:
+            raise ValueError(
+                "NI imposes that duration x framerate should be an integer dividend of 10000."
+            )
+        super().__init__(fs, samples_per_frame)
+        self.device_name = device_name
+        self.device_channel = device_channel
+        self.frames_per_buffer = frames_per_buffer
+        self._task = None
+
+    def start(self, callback: Callable[[np.ndarray], None]) -> None:
+        import nidaqmx as ni
+        from nidaqmx import stream_readers
+
+        read_buffer = np.zeros((1, self.samples_per_frame), dtype=float)
+
+        def _reading_task_callback(
+            task_idx, event_type, num_samples, callback_data=None
+        ):
+            """This callback is called every time a defined amount of samples has been acquired.
+            This function must follow prototype defined in nidaqxm documentation.
+            Args:
+                ...
+                num_samples (int): Number of samples that were read into the read buffer.
+                ...
+            """
+            reader.read_many_sample(
+                read_buffer, num_samples, timeout=ni.constants.WAIT_INFINITELY
+            )
+            callback(read_buffer[0, :num_samples])
+
+            # The callback function must return 0 to prevent raising TypeError exception.
+            return 0
+
+        self._task = ni.Task()
+        # We do not make this configurable as we assume a digital signal for this barcoding:
+        ai_args = {
+            "min_val": 0,
+            "max_val": 5,
+            "terminal_config": ni.constants.TerminalConfiguration.RSE,
+        }
+
+        self._task.ai_channels.add_ai_voltage_chan(
+            self.device_name + self.device_channel, **ai_args
+        )
+        self._task.timing.cfg_samp_clk_timing(
+            rate=self.fs, sample_mode=ni.constants.AcquisitionType.CONTINUOUS
+        )
+
+        self._task.input_buf_size = self.samples_per_frame * self.frames_per_buffer
+
+        reader = stream_readers.AnalogMultiChannelReader(self._task.in_stream)
+
+        self._task.register_every_n_samples_acquired_into_buffer_event(
+            self.samples_per_frame, _reading_task_callback
+        )
+        self._task.start()  # arms ai
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.stop()
+            self._task.close()
+            self._task = None
+
+
+def barcode_waveform(
+    t_s: np.ndarray,
+    onsets_s: np.ndarray,
+    codes: np.ndarray,
+    spec: BarcodeSpec,
+    v_high: float = 5.0,
+) -> np.ndarray:
+    """Voltage of an Arduino barcode generator at times `t_s`.
+
+    Parameters
+    ----------
+    t_s : np.ndarray
+        Times at which to compute the signal, in the generator clock (s).
+    onsets_s : np.ndarray
+        Sorted times of the start wrapper onset of each barcode (s).
+    codes : np.ndarray
+        Value of each barcode.
+    spec : BarcodeSpec
+        Timing of the barcodes.
+    v_high : float
+        Voltage of the high level.
+
+    """
+    wrap, bit = spec.wrapper_width_s, spec.bit_width_s
+    barcode_i = np.searchsorted(onsets_s, t_s, side="right") - 1
+    valid = barcode_i >= 0
+    dt = t_s - onsets_s[np.maximum(barcode_i, 0)]
+
+    bits_end = 2 * wrap + spec.n_bits * bit
+    high = (dt < wrap) | ((dt >= bits_end + wrap) & (dt < bits_end + 2 * wrap))
+
+    in_bits = (dt >= 2 * wrap) & (dt < bits_end)
+    bit_i = np.clip(((dt - 2 * wrap) // bit).astype(np.int64), 0, spec.n_bits - 1)
+    bit_values = (np.asarray(codes, dtype=np.int64)[np.maximum(barcode_i, 0)] >> bit_i) & 1
+    high |= in_bits & (bit_values == 1)
+
+    return (high & valid) * v_high
+
+
+class SimulatedDaqBackend(DaqBackend):
+    """Simulated acquisition of the signal of an Arduino barcode generator.
+
+    Barcodes carry consecutive values starting from `first_code`, as with the
+    Arduino barcode script. The generator clock can drift with respect to the
+    acquisition clock, barcode onsets can jitter and gaussian noise is added to
+    the signal. Onset sample and code of all generated barcodes are kept in
+    `generated_barcodes` to compare with the detected ones.
+    """
+
+    def __init__(
+        self,
+        fs: int,
+        samples_per_frame: int,
+        spec: BarcodeSpec = None,
+        barcode_interval_s: float = 5.0,
+        first_onset_s: float = 0.1,
+        first_code: int = 0,
+        noise_std: float = 0.05,
+        jitter_s: float = 0.0,
+        drift_ppm: float = 0.0,
+        realtime: bool = True,
+        seed: Optional[int] = None,
+    ):
+        """
+        Parameters
+        ----------
+        fs : int
+            Sampling rate, in Hz.
+        samples_per_frame : int
+            Number of samples after which the callback is called.
+        spec : BarcodeSpec
+            Timing parameters of the barcodes.
+        barcode_interval_s : float
+            Interval between barcode onsets, in the generator clock.
+        first_onset_s : float
+            Onset of the first barcode, in the generator clock.
+        first_code : int
+            Value of the first barcode.
+        noise_std : float
+            Standard deviation of the gaussian noise added to the signal, in V.
+        jitter_s : float
+            Standard deviation of the jitter of barcode onsets.
+        drift_ppm : float
+            Drift of the generator clock with respect to the acquisition one,
+            in parts per million (positive if the generator runs faster).
+        realtime : bool
+            If True, frames are delivered at the pace of the acquisition; otherwise
+            as fast as possible.
+        seed : int
+            Seed for the noise and jitter generator.
+
+        """
+        super().__init__(fs, samples_per_frame)
+        self.spec = spec if spec is not None else BarcodeSpec()
+        self.barcode_interval_s = barcode_interval_s
+        self.first_onset_s = first_onset_s
+        self.first_code = first_code
+        self.noise_std = noise_std
+        self.jitter_s = jitter_s
+        self.drift_ppm = drift_ppm
+        self.realtime = realtime
+        self.seed = seed
+
+        self.generated_barcodes = []  # (onset sample, code) of generated barcodes
+        # Created on start, so that the backend can be pickled to a spawned process:
+        self._thread = None
+        self._stop_event = None
+
+    def frames(self):
+        """Generator of consecutive frames of the simulated signal."""
+        rng = np.random.default_rng(self.seed)
+        clock_ratio = 1 + self.drift_ppm * 1e-6
+        frame_s = self.samples_per_frame / self.fs
+
+        onsets, codes = np.empty(0), np.empty(0, dtype=np.int64)
+        n_barcodes = 0
+        frame_i = 0
+        while True:
+            first_sample = frame_i * self.samples_per_frame
+            t = (first_sample + np.arange(self.samples_per_frame)) / self.fs * clock_ratio
+
+            # Generate barcodes that might overlap this frame:
+            while len(onsets) == 0 or onsets[-1] < t[-1] + frame_s * clock_ratio:
+                onset = (
+                    self.first_onset_s
+                    + n_barcodes * self.barcode_interval_s
+                    + rng.normal(0, self.jitter_s)
+                )
+                code = self.first_code + n_barcodes
+                onsets, codes = np.r_[onsets, onset], np.r_[codes, code]
+                self.generated_barcodes.append(
+                    (int(np.ceil(onset / clock_ratio * self.fs)), code)
+                )
+                n_barcodes += 1
+
+            # Only keep barcodes that can still be in the next frames:
+            keep = onsets > t[0] - self.spec.duration_s - self.barcode_interval_s
+            onsets, codes = onsets[keep], codes[keep]
+
+            frame = barcode_waveform(t, onsets, codes, self.spec)
+            if self.noise_std > 0:
+                frame += rng.normal(0, self.noise_std, len(frame))
+            yield frame
+            frame_i += 1
+
+    def _run(self, callback):
+        t_start = monotonic_ns()
+        for frame_i, frame in enumerate(self.frames()):
+            if self._stop_event.is_set():
+                break
+            if self.realtime:
+                # Deliver the frame when its last sample would have been acquired:
+                frame_end_ns = t_start + int(
+                    (frame_i + 1) * self.samples_per_frame / self.fs * 1e9
+                )
+                wait_s = (frame_end_ns - monotonic_ns()) / 1e9
+                if wait_s > 0 and self._stop_event.wait(wait_s):
+                    break
+            callback(frame)
+
+    def start(self, callback: Callable[[np.ndarray], None]) -> None:
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+
+def benchmark_detection(
+    duration_s: float = 600.0,
+    fs: int = 10000,
+    samples_per_frame: int = 1000,
+    **backend_kwargs,
+) -> dict:
+    """Decode `duration_s` of simulated signal as fast as possible and report
+    detection throughput, CPU time and timestamp error.
+    """
+    from sisyphy.barcode_synch.barcode_reading import BarcodeStreamDecoder
+
+    backend = SimulatedDaqBackend(
+        fs, samples_per_frame, realtime=False, seed=0, **backend_kwargs
+    )
+    decoder = BarcodeStreamDecoder(fs, spec=backend.spec)
+    n_frames = int(duration_s * fs / samples_per_frame)
+
+    detected = []
+    generation_s, t_wall, t_cpu = 0.0, time.perf_counter(), time.process_time()
+    frames = backend.frames()
+    for _ in range(n_frames):
+        t_gen = time.perf_counter()
+        frame = next(frames)
+        generation_s += time.perf_counter() - t_gen
+        detected.extend(decoder.process(frame))
+    wall_s = time.perf_counter() - t_wall - generation_s
+    cpu_s = time.process_time() - t_cpu - generation_s
+
+    generated = dict((code, onset) for onset, code in backend.generated_barcodes)
+    errors_ms = np.array(
+        [(idx - generated[code]) / fs * 1000 for idx, code in detected if code in generated]
+    )
+    n_expected = sum(
+        onset + backend.spec.duration_s * fs < n_frames * samples_per_frame
+        for onset, _ in backend.generated_barcodes
+    )
+    return dict(
+        samples_per_s=n_frames * samples_per_frame / wall_s,
+        cpu_us_per_frame=cpu_s / n_frames * 1e6,
+        n_detected=len(detected),
+        n_expected=int(n_expected),
+        n_wrong_code=int(sum(code not in generated for _, code in detected)),
+        max_abs_error_ms=float(np.abs(errors_ms).max()) if len(errors_ms) else np.nan,
+    )
+
+
+if __name__ == "__main__":
+    for kwargs in [
+        dict(),
+        dict(noise_std=0.5, jitter_s=0.0005, drift_ppm=50),
+    ]:
+        print(kwargs, benchmark_detection(**kwargs))
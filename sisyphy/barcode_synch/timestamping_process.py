@@ -1,18 +1,15 @@
 """Code adapted from https://github.com/mjablons1/nidaqmx-continuous-analog-io.
 """
-import time
 from multiprocessing import Event, Process
 
-import nidaqmx as ni
 import numpy as np
-from nidaqmx import stream_readers
 
-from sisyphy.barcode_synch.barcode_reading import find_single_barcode
-from sisyphy.barcode_synch.bcode_dataclasses import TimeStampData
+from sisyphy.barcode_synch.barcode_reading import BarcodeStreamDecoder
+from sisyphy.barcode_synch.bcode_dataclasses import BarcodeSpec, TimeStampData
+from sisyphy.barcode_synch.daq_backends import DaqBackend, NiDaqBackend
 from sisyphy.utils.custom_queue import SaturatingQueue
-
-# TODO maybe in this class hardware and barcode reading logic might be separated better.
-# I will change this if it happens that I will be reading the signal with something different from an NI.
+from sisyphy.utils.realtime import ProcessTuning, format_report
+from sisyphy.utils.timebase import monotonic_ns
 
 
 class NiTimeStampProcess(Process):
@@ -21,10 +18,13 @@ class NiTimeStampProcess(Process):
         *args,
         frame_duration: float,
         fs: int,
-        frames_per_buffer: int,
-        device_name: str,
-        device_channel: str,
+        frames_per_buffer: int = 10,
+        device_name: str = None,
+        device_channel: str = None,
+        backend: DaqBackend = None,
         kill_event: Event = None,
+        barcode_spec: BarcodeSpec = None,
+        tuning: ProcessTuning = None,
         debug_mode=False,
         **kwargs,
     ) -> None:
@@ -32,7 +32,7 @@ class NiTimeStampProcess(Process):
         Parameters
         ----------
         frame_duration : float
-            Duration of a reading frame, in seconds. Should be longer than a barcode, but shorter than their period!
+            Duration of a reading frame, in seconds. Barcodes spanning multiple frames are decoded as well.
         fs : int
             Sampling rate of the board, in seconds. Recommended > 10 samples for the shorter barcode up time.
         frames_per_buffer : int
@@ -41,8 +41,15 @@ class NiTimeStampProcess(Process):
             name of NI device.
         device_channel : str
             channel of NI device.
+        backend : DaqBackend
+            acquisition backend; if None, a NiDaqBackend is created from the device arguments.
+            Use a SimulatedDaqBackend to run without hardware.
         kill_event : Event
             event to kill the process.
+        barcode_spec : BarcodeSpec
+            timing parameters of the barcodes (defaults to the Arduino ones).
+        tuning : ProcessTuning
+            CPU affinity, priority, memory locking and GC settings for the process.
         debug_mode
         kwargs
         """
@@ -50,91 +57,52 @@ class NiTimeStampProcess(Process):
         self.data_queue = SaturatingQueue()
 
         self.samples_per_frame = int(fs * frame_duration)
-        # for some reason should be integer dividend of 10000
-        if (10000 / self.samples_per_frame) % 1 != 0:
-            raise ValueError(
-                "NI imposes that duration x framerate should be an integer dividend of 10000."
+        if backend is None:
+            backend = NiDaqBackend(
+                fs,
+                self.samples_per_frame,
+                device_name=device_name,
+                device_channel=device_channel,
+                frames_per_buffer=frames_per_buffer,
             )
+        self.backend = backend
 
         self.fs = fs
-        self.frames_per_buffer = frames_per_buffer
-        self.device_name = device_name
-        self.device_channel = device_channel
+        self.barcode_spec = barcode_spec
+        self.tuning = tuning
         self.debug_mode = debug_mode
 
         # self.file = None
         super(NiTimeStampProcess, self).__init__(*args, **kwargs)
 
     def run(self):
-        def _reading_task_callback(
-            task_idx, event_type, num_samples, callback_data=None
-        ):
-            """This callback is called every time a defined amount of samples has been acquired.
-            This function must follow prototype defined in nidaqxm documentation.
-            Args:
-                ...
-                num_samples (int): Number of samples that were read into the read buffer.
-                ...
-            """
-            reader.read_many_sample(
-                read_buffer, num_samples, timeout=ni.constants.WAIT_INFINITELY
-            )
-            # # shift array:
-            past_array[: self.samples_per_frame] = past_array[self.samples_per_frame :]
-            past_array[self.samples_per_frame :] = read_buffer
-            # print(len(past_array), sum(past_array > 2.5))
-            tstamp_idx, tstamp_code = find_single_barcode(past_array, self.fs)
-
-            # if we found a complete barcode:
-            if tstamp_idx is not None:
-                # send its time...
-                now = time.time_ns()
-                barcode_frame_time_s = (len(past_array) - tstamp_idx) / self.fs
+        if self.tuning is not None:
+            print(f"{self.name} tuning: {format_report(self.tuning.apply())}")
+
+        def _frame_callback(frame):
+            """This callback is called by the backend every time a frame has been acquired."""
+            now = monotonic_ns()
+            for tstamp_idx, tstamp_code in decoder.process(frame):
+                # send time of the barcode start, counting back from the last sample:
+                barcode_frame_time_s = (decoder.n_samples - tstamp_idx) / self.fs
                 time_barcode_start_ns = now - np.int64(barcode_frame_time_s * 1e9)
                 self.data_queue.put(
                     TimeStampData(
                         t_ns_buffer_stream=now,
                         t_ns_code=time_barcode_start_ns,
                         code=tstamp_code,
+                        sample_index=tstamp_idx,
                     )
                 )
                 if self.debug_mode:
                     print(time_barcode_start_ns, tstamp_code)
-                # ...and clear the buffer to avoid double-counting
-                past_array[:] = 0
-
-            # The callback function must return 0 to prevent raising TypeError exception.
-            return 0
 
-        read_buffer = np.zeros((1, self.samples_per_frame), dtype=float)
-        past_array = np.zeros(self.samples_per_frame * 2, dtype=float)
+        decoder = BarcodeStreamDecoder(self.fs, spec=self.barcode_spec)
 
-        with ni.Task() as ai_task:
-            # We do not make this configurable as we assume a digital signal for this barcoding:
-            ai_args = {
-                "min_val": 0,
-                "max_val": 5,
-                "terminal_config": ni.constants.TerminalConfiguration.RSE,
-            }
-
-            ai_task.ai_channels.add_ai_voltage_chan(
-                self.device_name + self.device_channel, **ai_args
-            )
-            ai_task.timing.cfg_samp_clk_timing(
-                rate=self.fs, sample_mode=ni.constants.AcquisitionType.CONTINUOUS
-            )
-
-            ai_task.input_buf_size = self.samples_per_frame * self.frames_per_buffer
-
-            reader = stream_readers.AnalogMultiChannelReader(ai_task.in_stream)
-
-            ai_task.register_every_n_samples_acquired_into_buffer_event(
-                self.samples_per_frame, _reading_task_callback
-            )
-            ai_task.start()  # arms ai
-
-            # loop until killed, put here to remain always in the same NI context:
+        self.backend.start(_frame_callback)
+        try:
+            # loop until killed, put here to remain always in the same acquisition context:
             while not self.kill_event.is_set():
-                pass
-
-            ai_task.stop()
+                self.kill_event.wait(0.1)
+        finally:
+            self.backend.stop()
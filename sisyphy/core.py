@@ -1,13 +1,18 @@
 import abc
-from multiprocessing import Event
-from time import sleep
-from multiprocessing import Queue, Process
+from datetime import datetime
+from multiprocessing import Queue
+from pathlib import Path
 
 from sisyphy.hardware_readers import (
     CalibratedSphereReaderProcess,
     MockSphereReaderProcess,
 )
 from sisyphy.streamers import DataStreamer, FileDataStreamer
+from sisyphy.supervisor import Stage, Supervisor
+from sisyphy.utils.backends import check_backend, make_queue, run_in
+from sisyphy.utils.custom_queue import DequeQueue
+from sisyphy.utils.metrics import MetricsRegistry
+from sisyphy.utils.process import ShutdownReport, WakeableEvent, stop_processes
 
 
 class SphereDataStreamer(metaclass=abc.ABCMeta):
@@ -30,42 +35,125 @@ class SphereDataStreamer(metaclass=abc.ABCMeta):
         mouse_reader_process_class=None,
         data_streamer_class=None,
         data_path=None,
+        supervise: bool = False,
+        backend: str = "process",
+        metrics: MetricsRegistry = None,
     ):
-        self.kill_event = kill_event if kill_event is not None else Event()
-        self.mouse_process = mouse_reader_process_class(kill_event=self.kill_event)
-        self.streamer = data_streamer_class(
-            sphere_data_queue=self.mouse_process.data_queue,
-            kill_event=self.kill_event,
-            data_path=data_path,
-        )
-        if hasattr(self.streamer, "output_queue"):
-            self.output_queue = self.streamer.output_queue
+        """
+        Parameters
+        ----------
+        kill_event : Event
+            Termination event.
+        mouse_reader_process_class : type
+            SphereReaderProcess subclass.
+        data_streamer_class : type
+            Streamer of the data of the reader.
+        data_path : str
+            Where to save data.
+        supervise : bool
+            If True, processes are run by a Supervisor, that restarts them if they
+            crash or stall and records the gaps in the data.
+        backend : str
+            "process" to run the reader and the streamer as separate processes,
+            "thread" to run them as threads of the current process (see
+            sisyphy.utils.backends).
+        metrics : MetricsRegistry
+            Registry with "reader" and "streamer" stages where the processes publish
+            their health metrics; a new one by default.
+
+        """
+        self.kill_event = kill_event if kill_event is not None else WakeableEvent()
+        self.data_path = data_path
+        self._reader_class = mouse_reader_process_class
+        self._streamer_class = data_streamer_class
+        self.backend = check_backend(backend)
+        if metrics is None:
+            metrics = MetricsRegistry(["reader", "streamer"])
+        self.metrics = metrics
+
+        # Queues are created here, so that restarted processes can reuse them:
+        self.data_queue = make_queue(backend)
+        self.output_queue = None
+        if issubclass(data_streamer_class, DataStreamer):
+            self.output_queue = Queue() if backend == "process" else DequeQueue()
+
+        self.supervisor = None
+        if supervise:
+            self.supervisor = Supervisor(
+                [
+                    Stage("reader", self._make_reader, expects_samples=True),
+                    Stage("streamer", self._make_streamer),
+                ],
+                kill_event=self.kill_event,
+            )
         else:
-            self.output_queue = None
+            self._mouse_process = self._make_reader(self.kill_event)
+            self._streamer = self._make_streamer(self.kill_event)
+
+    def _make_reader(self, kill_event):
+        return run_in(
+            self._reader_class(
+                kill_event=kill_event,
+                data_queue=self.data_queue,
+                metrics=self.metrics.stage("reader"),
+            ),
+            self.backend,
+        )
+
+    def _make_streamer(self, kill_event):
+        kwargs = dict(output_queue=self.output_queue) if self.output_queue is not None else {}
+        return run_in(
+            self._streamer_class(
+                sphere_data_queue=self.data_queue,
+                kill_event=kill_event,
+                data_path=self.data_path,
+                metrics=self.metrics.stage("streamer"),
+                **kwargs,
+            ),
+            self.backend,
+        )
+
+    @property
+    def mouse_process(self):
+        if self.supervisor is not None:
+            return self.supervisor["reader"].process
+        return self._mouse_process
+
+    @property
+    def streamer(self):
+        if self.supervisor is not None:
+            return self.supervisor["streamer"].process
+        return self._streamer
 
     def start(self):
         print("starting processes")
-        self.mouse_process.start()
-        self.streamer.start()
-
-    def stop(self):
+        if self.supervisor is not None:
+            self.supervisor.start()
+        else:
+            self.mouse_process.start()
+            self.streamer.start()
+
+    def stop(self, timeout_s: float = 5.0) -> ShutdownReport:
+        """Stop the processes with a shutdown handshake: the reader closes its stream
+        with a sentinel, the streamer writes everything up to it and acknowledges, and
+        processes that do not exit within `timeout_s` are terminated.
+        """
         print("Stopping processes.")
-        self.kill_event.set()
-        sleep(0.5)
-        print("Set kill event.")
-        print("Joined mouse process.")
-        self.mouse_process.join()
-        if self.output_queue is not None:
-            while not self.output_queue.empty():
-                self.output_queue.get()
-            print("Emptied output queue.")
-        while not self.mouse_process.data_queue.empty():
-            self.mouse_process.data_queue.get()
-        print("Emptied data queue.")
-
-        self.streamer.join()
-
-        print("Killed processes.")
+        if self.supervisor is not None:
+            self.kill_event.set()
+            report = self.supervisor.stop(timeout_s)
+            if self.supervisor.gaps and self.data_path is not None:
+                timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                self.supervisor.save_gaps(Path(self.data_path) / f"{timestamp}_gaps.csv")
+        else:
+            report = stop_processes(
+                [self.mouse_process, self.streamer], self.kill_event, timeout_s
+            )
+        print(
+            f"Stopped processes in {report.stop_time_s:.3f} s "
+            f"({', '.join(f'{k}: {v}' for k, v in report.outcomes.items())})."
+        )
+        return report
 
 
 class MockDataStreamer(SphereDataStreamer):
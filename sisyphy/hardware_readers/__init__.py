@@ -1,5 +1,24 @@
-from sisyphy.hardware_readers.sphere_process import (
-    CalibratedSphereReaderProcess,
-    MockSphereReaderProcess,
-    RawUsbSphereReaderProcess,
-)
+"""Processes reading the sphere mice, imported on first use."""
+from typing import TYPE_CHECKING
+
+from sisyphy.utils.lazy import lazy_attributes
+
+__all__ = [
+    "CalibratedSphereReaderProcess",
+    "MockSphereReaderProcess",
+    "RawUsbSphereReaderProcess",
+    "ReplaySphereReaderProcess",
+]
+
+_LAZY_ATTRIBUTES = {name: "sisyphy.hardware_readers.sphere_process" for name in __all__}
+
+if TYPE_CHECKING:
+    from sisyphy.hardware_readers.sphere_process import (
+        CalibratedSphereReaderProcess,
+        MockSphereReaderProcess,
+        RawUsbSphereReaderProcess,
+        ReplaySphereReaderProcess,
+    )
+
+
+__getattr__, __dir__ = lazy_attributes(globals(), _LAZY_ATTRIBUTES)
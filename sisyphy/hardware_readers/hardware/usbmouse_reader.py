@@ -1,12 +1,12 @@
 import abc
+import time
 from dataclasses import dataclass
-from time import time_ns
 from typing import Tuple
 
 import numpy as np
-import usb1
 
 from sisyphy.utils.dataclasses import TimestampedDataClass
+from sisyphy.utils.timebase import monotonic_ns
 
 
 @dataclass
@@ -60,11 +60,13 @@ class MockMouse(AbstractMouse):
     """Interface to a fake mouse for testing purposes.
     Implements the _read_velocities method to give random data."""
 
-    TIMESTEP_NS = 50000000  # timestep between emitted velocities
+    TIMESTEP_NS = 50000000  # default timestep between emitted velocities
+    SPIN_NS = 500000  # busy wait for the last part of each timestep
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, timestep_ns: int = TIMESTEP_NS, **kwargs):
         super().__init__(*args, **kwargs)
-        self.starting_t = time_ns()
+        self.timestep_ns = timestep_ns
+        self.starting_t = monotonic_ns()
         self.phase_x = np.random.randn()
         self.phase_y = np.random.randn()
         self.prev_elapsed = 0
@@ -76,9 +78,14 @@ class MockMouse(AbstractMouse):
         pass
 
     def _read_velocities(self) -> Tuple[float, float]:
-        elapsed = 0
-        while elapsed - self.prev_elapsed < self.TIMESTEP_NS:
-            elapsed = time_ns() - self.starting_t
+        # Sleep until close to the next timestep, and spin only for the last part, so
+        # that the mock does not hold the CPU (and the GIL, when run in a thread):
+        elapsed = monotonic_ns() - self.starting_t
+        to_sleep_ns = self.prev_elapsed + self.timestep_ns - elapsed - self.SPIN_NS
+        if to_sleep_ns > 0:
+            time.sleep(to_sleep_ns * 1e-9)
+        while elapsed - self.prev_elapsed < self.timestep_ns:
+            elapsed = monotonic_ns() - self.starting_t
         self.prev_elapsed = elapsed
         return np.random.randint(-127, 127), np.random.randint(-127, 127)
 
@@ -105,6 +112,10 @@ class WinUsbMouse(AbstractMouse):
         super().__init__()
 
     def _initialise_mouse(self) -> None:
+        import usb1  # only needed for real mice
+
+        self._usb_timeout_error = usb1.USBErrorTimeout
+
         # Find our device:
         ctx = usb1.LibUSBContext()
         usb_devices = ctx.getDeviceList()
@@ -142,7 +153,7 @@ class WinUsbMouse(AbstractMouse):
             readout = [dat for dat in self.mouse.interruptRead(0x81, 8, TIMEOUT)]
             y = self._unsigned2signed(readout[2], readout[3])
             x = self._unsigned2signed(readout[4], readout[5])
-        except usb1.USBErrorTimeout:
+        except self._usb_timeout_error:
             pass
 
         return x, y
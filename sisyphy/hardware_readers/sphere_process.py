@@ -1,8 +1,10 @@
 import abc
+import dataclasses
+import time
 from dataclasses import dataclass
-from multiprocessing import Process
 
 import numpy as np
+import pandas as pd
 
 from sisyphy.hardware_readers.defaults import BALL_CALIBRATION
 from sisyphy.hardware_readers.hardware.usbmouse_reader import (
@@ -12,6 +14,10 @@ from sisyphy.hardware_readers.hardware.usbmouse_reader import (
 )
 from sisyphy.utils.custom_queue import SaturatingQueue
 from sisyphy.utils.dataclasses import TimestampedDataClass
+from sisyphy.utils.metrics import StageMetrics
+from sisyphy.utils.process import TerminableProcess
+from sisyphy.utils.realtime import ProcessTuning
+from sisyphy.utils.timebase import monotonic_ns
 
 
 # Note on dataclass usage:
@@ -48,21 +54,37 @@ class EstimatedVelSphereData(TimestampedDataClass):
     y1: int
 
 
-class SphereReaderProcess(Process, metaclass=abc.ABCMeta):
-    """Abstract class to interface with a sphere that is read by two mice, and its velocities are streamed."""
+class SphereReaderProcess(TerminableProcess, metaclass=abc.ABCMeta):
+    """Abstract class to interface with a sphere that is read by two mice, and its velocities are streamed.
 
-    def __init__(self, kill_event):
+    When the kill event is set, the stream in `data_queue` is closed with an
+    EndOfStream sentinel, so that consumers can read everything up to it.
+    """
+
+    def __init__(
+        self,
+        kill_event=None,
+        data_queue: SaturatingQueue = None,
+        tuning: ProcessTuning = None,
+        metrics: StageMetrics = None,
+    ):
         """
         Parameters
         ----------
         kill_event : Event object
             Event to set for termination of the streaming process.
+        data_queue : SaturatingQueue
+            Queue to stream the data to (e.g. to reattach a restarted reader to its
+            consumers); a new one by default.
+        tuning : ProcessTuning
+            CPU affinity, priority, memory locking and GC settings for the process.
+        metrics : StageMetrics
+            Where to publish the health metrics of the reader (see TerminableProcess).
 
         """
-        super().__init__()
-        self.data_queue = SaturatingQueue()
+        super().__init__(kill_event, tuning=tuning, metrics=metrics)
+        self.data_queue = data_queue if data_queue is not None else SaturatingQueue()
         self.mouse0, self.mouse1 = None, None
-        self.kill_event = kill_event
 
     @abc.abstractmethod
     def _setup_mice(self) -> None:
@@ -78,23 +100,46 @@ class SphereReaderProcess(Process, metaclass=abc.ABCMeta):
         """Defined in subclasses, changes depending on whether we're streaming raw data or processed data."""
         pass
 
-    def run(self):
+    def before_loop(self) -> None:
         self._setup_mice()
-        while not self.kill_event.is_set():
-            msg = self._get_message()
-            self.data_queue.put(msg)
 
-        # clear queue before closing:
-        d = self.data_queue.get_all()
-        print(f"Closing mice, cleared {len(d)} elements from queue")
+    def loop(self) -> None:
+        if not self.data_queue.put(self._get_message()):
+            self.monitor.drop()
+        self.monitor.count()
+
+    def after_loop(self) -> None:
+        # Close the stream and wait for the queue feeder to flush it, unless nobody is
+        # reading it anymore:
+        ended = self.data_queue.end_stream(sender=self.name)
+        self.data_queue.close()
+        if ended:
+            self.data_queue.join_thread()
+            print("Closing mice, data stream flushed.")
+        else:
+            self.data_queue.cancel_join_thread()
+            print("Closing mice, data stream not read anymore.")
 
 
 class MockSphereReaderProcess(SphereReaderProcess):
     """Subclass that simulate data stream from fake mice."""
 
+    def __init__(self, *args, sample_rate_hz: float = 20.0, **kwargs):
+        """
+        Parameters
+        ----------
+        sample_rate_hz : float
+            Rate of the simulated samples, paced by the mock mice (not to be confused
+            with `rate_hz` of TerminableProcess, the rate of periodic wake-ups).
+
+        """
+        super().__init__(*args, **kwargs)
+        self.sample_rate_hz = sample_rate_hz
+
     def _setup_mice(self) -> None:
-        self.mouse0 = MockMouse()
-        self.mouse1 = MockMouse()
+        timestep_ns = int(1e9 / self.sample_rate_hz)
+        self.mouse0 = MockMouse(timestep_ns=timestep_ns)
+        self.mouse1 = MockMouse(timestep_ns=timestep_ns)
 
     def _get_message(self):
         mice_data = self._read_mice()
@@ -107,6 +152,86 @@ class MockSphereReaderProcess(SphereReaderProcess):
         )
 
 
+class ReplaySphereReaderProcess(SphereReaderProcess):
+    """Replay the data saved by a FileDataStreamer, with their original timing (or at
+    a fixed rate), to test and benchmark pipelines with realistic data and no hardware.
+    """
+
+    def __init__(
+        self,
+        *args,
+        filename=None,
+        sample_rate_hz: float = None,
+        loop_data: bool = True,
+        spin_s: float = 0.0005,
+        **kwargs,
+    ):
+        """
+        Parameters
+        ----------
+        filename : str or Path
+            A *_data.csv file saved by a FileDataStreamer.
+        sample_rate_hz : float
+            If given, replay at this rate instead of with the original timing.
+        loop_data : bool
+            If True, start again from the beginning when the data are over;
+            otherwise, stop.
+        spin_s : float
+            Final part of the wait for every sample done actively, for precise timing.
+
+        """
+        super().__init__(*args, **kwargs)
+        self.filename = filename
+        self.sample_rate_hz = sample_rate_hz
+        self.loop_data = loop_data
+        self.spin_s = spin_s
+
+    def _setup_mice(self) -> None:
+        data = pd.read_csv(self.filename)
+        self._message_class = (
+            EstimatedVelSphereData if "pitch" in data.columns else RawVelSphereData
+        )
+        fields = [f.name for f in dataclasses.fields(self._message_class) if f.init]
+        self._values = data[fields].to_dict("records")
+        if self.sample_rate_hz is not None:
+            period_ns = int(1e9 / self.sample_rate_hz)
+            self._offsets_ns = np.arange(len(data), dtype=np.int64) * period_ns
+        else:
+            self._offsets_ns = (data["t_ns"] - data["t_ns"].iloc[0]).values
+            if len(data) < 2 and self.loop_data:
+                raise ValueError(
+                    f"Cannot loop over {self.filename}: the period of a single sample"
+                    " is unknown, give sample_rate_hz."
+                )
+            period_ns = 0
+            if len(data) > 1:
+                period_ns = int(np.median(np.diff(self._offsets_ns)))
+        self._duration_ns = self._offsets_ns[-1] + period_ns
+        self._i = 0
+        self._t_start_ns = monotonic_ns()
+
+    def loop(self) -> None:
+        if self._i == len(self._values):
+            if not self.loop_data:
+                self.request_stop()
+                return
+            self._i = 0
+            self._t_start_ns += self._duration_ns
+        super().loop()
+
+    def _get_message(self):
+        deadline_ns = self._t_start_ns + self._offsets_ns[self._i]
+        sleep_s = (deadline_ns - monotonic_ns()) * 1e-9 - self.spin_s
+        if sleep_s > 0:
+            time.sleep(sleep_s)
+        while monotonic_ns() < deadline_ns:
+            pass
+
+        message = self._message_class(**self._values[self._i])
+        self._i += 1
+        return message
+
+
 class UsbSphereReaderProcess(SphereReaderProcess, metaclass=abc.ABCMeta):
     """A - still abstract - class to read sphere velocity with WinUSB mice."""
 
@@ -0,0 +1,317 @@
+"""Merge of the logs of a `ConcurrenceLogger` session in a single timeline.
+
+Every `LoggingProcess` writes its own binary log; since all processes stamp entries
+with the same monotonic clock, the logs can be merged by time. The merge is streamed
+(k-way, one chunk of records per file in memory), so it works on logs of multi-hour
+sessions. From the merged timeline, sender and receiver entries are paired to measure
+the propagation latencies of events and queues, and the whole session can be exported
+as a Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev):
+
+    python -m sisyphy.log_merge path/to/logs --trace trace.json --latencies latencies.csv
+"""
+import argparse
+import csv
+import heapq
+import json
+from collections import deque, namedtuple
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from sisyphy.process_logger import (
+    MESSAGE_ID,
+    RECORD_DTYPE,
+    LogEventType,
+    iter_messages,
+    read_names,
+)
+
+LogEntry = namedtuple(
+    "LogEntry", ["t_ns", "process", "event_type", "name", "is_sender", "value"]
+)
+Latency = namedtuple(
+    "Latency", ["kind", "name", "sender", "receiver", "t_sent_ns", "t_received_ns"]
+)
+
+
+def log_files(directory: Union[str, Path]) -> List[Path]:
+    """Binary logs in a directory."""
+    return sorted(Path(directory).glob("*.bin"))
+
+
+def _message_reader(filename: Path) -> Callable[[int], str]:
+    """Function returning the text of a message from its index, reading the messages
+    file along with the log: indices increase in a log, so every text is read once.
+    """
+    messages = iter_messages(filename)
+    index, text = -1, ""
+
+    def message(value: int) -> str:
+        nonlocal index, text
+        while index < value:
+            text = next(messages, "")
+            index += 1
+        return text if index == value else ""
+
+    return message
+
+
+def iter_log(
+    filename: Union[str, Path], chunk_records: int = 2 ** 16
+) -> Iterator[LogEntry]:
+    """Stream the entries of a binary log, reading `chunk_records` records at a time."""
+    filename = Path(filename)
+    names, message = read_names(filename), _message_reader(filename)
+    event_types = {int(t): t.name for t in LogEventType}
+
+    with open(filename, "rb") as f:
+        while True:
+            records = np.fromfile(f, dtype=RECORD_DTYPE, count=chunk_records)
+            if len(records) == 0:
+                break
+            for t_ns, event_type, name_id, is_sender, value in records.tolist():
+                yield LogEntry(
+                    t_ns,
+                    filename.stem,
+                    event_types[event_type],
+                    message(value)
+                    if name_id == MESSAGE_ID
+                    else names.get(name_id, str(name_id)),
+                    bool(is_sender),
+                    value,
+                )
+
+
+def merge_logs(
+    filenames: Iterable[Union[str, Path]], chunk_records: int = 2 ** 16
+) -> Iterator[LogEntry]:
+    """Stream the entries of many logs, sorted by time.
+
+    Entries of each log are assumed to be sorted, which holds up to the scheduling of
+    threads logging from the same process.
+    """
+    return heapq.merge(
+        *[iter_log(f, chunk_records) for f in filenames], key=lambda entry: entry.t_ns
+    )
+
+
+class LatencyMatcher:
+    """Pair sender and receiver entries of a time-sorted stream.
+
+    - queues: every get (receiver entry) is paired with the oldest unmatched put
+      (sender entry) of the same queue, as queues are first in, first out;
+    - events: every observed transition (receiver entry) is paired with the most
+      recent set or clear (sender entry) with the same value.
+    """
+
+    def __init__(self, max_pending: int = 10 ** 5):
+        """
+        Parameters
+        ----------
+        max_pending : int
+            Maximum number of unmatched puts kept per queue; older ones are dropped,
+            so that queues without logged gets do not fill up the memory.
+
+        """
+        self.max_pending = max_pending
+        self._puts = dict()
+        self._transitions = dict()
+
+    def match(self, entry: LogEntry) -> Optional[Latency]:
+        if entry.event_type == "QUEUE":
+            puts = self._puts.setdefault(entry.name, deque(maxlen=self.max_pending))
+            if entry.is_sender:
+                puts.append((entry.process, entry.t_ns))
+            elif puts:
+                sender, t_sent = puts.popleft()
+                return Latency(
+                    "QUEUE", entry.name, sender, entry.process, t_sent, entry.t_ns
+                )
+        elif entry.event_type == "EVENT":
+            key = (entry.name, entry.value)
+            if entry.is_sender:
+                self._transitions[key] = (entry.process, entry.t_ns)
+            elif key in self._transitions:
+                sender, t_sent = self._transitions[key]
+                return Latency(
+                    "EVENT", entry.name, sender, entry.process, t_sent, entry.t_ns
+                )
+        return None
+
+
+def iter_latencies(entries: Iterable[LogEntry], **kwargs) -> Iterator[Latency]:
+    """Latencies of all the paired entries of a time-sorted stream."""
+    matcher = LatencyMatcher(**kwargs)
+    for entry in entries:
+        latency = matcher.match(entry)
+        if latency is not None:
+            yield latency
+
+
+def latency_table(latencies: Iterable[Latency]) -> pd.DataFrame:
+    """DataFrame of latencies, with an additional latency_us column."""
+    df = pd.DataFrame(list(latencies), columns=Latency._fields)
+    df["latency_us"] = (df["t_received_ns"] - df["t_sent_ns"]) / 1000
+    return df
+
+
+def latency_summary(latencies: pd.DataFrame) -> pd.DataFrame:
+    """Statistics of the latencies of each event and queue."""
+    return latencies.groupby(["kind", "name", "sender", "receiver"])[
+        "latency_us"
+    ].describe(percentiles=[0.5, 0.99])
+
+
+def write_chrome_trace(
+    entries: Iterable[LogEntry],
+    filename: Union[str, Path],
+    latencies_filename: Union[str, Path] = None,
+) -> int:
+    """Write a time-sorted stream of entries in the Chrome trace event format.
+
+    Processes are shown as separate tracks, log entries as instant events, queue
+    fillings as counters and paired entries as spans (on the receiver track) from
+    sending to receiving, joined to the sender by an arrow.
+
+    Parameters
+    ----------
+    entries : iterable of LogEntry
+        Time-sorted entries, e.g. from `merge_logs`.
+    filename : str or Path
+        Output .json file.
+    latencies_filename : str or Path
+        If given, latencies are also written to this .csv file.
+
+    Returns
+    -------
+    int
+        Number of written entries.
+
+    """
+    matcher = LatencyMatcher()
+    pids = dict()
+    queue_sizes = dict()
+    t0 = None
+    n = 0
+    latencies_file = (
+        open(latencies_filename, "w", newline="")
+        if latencies_filename is not None
+        else None
+    )
+    if latencies_file is not None:
+        latencies_writer = csv.writer(latencies_file)
+        latencies_writer.writerow(Latency._fields + ("latency_us",))
+
+    with open(filename, "w") as f:
+        f.write('{"displayTimeUnit": "ns", "traceEvents": [\n')
+        separator = ""
+
+        def write(event):
+            nonlocal separator
+            f.write(separator + json.dumps(event))
+            separator = ",\n"
+
+        for entry in entries:
+            if t0 is None:
+                t0 = entry.t_ns
+            if entry.process not in pids:
+                pids[entry.process] = len(pids)
+                write(
+                    dict(
+                        ph="M",
+                        name="process_name",
+                        pid=pids[entry.process],
+                        tid=0,
+                        args=dict(name=entry.process),
+                    )
+                )
+            pid = pids[entry.process]
+            ts = (entry.t_ns - t0) / 1000
+
+            args = dict(sender=entry.is_sender, value=entry.value)
+            write(
+                dict(
+                    ph="i",
+                    s="t",
+                    name=f"{entry.event_type} {entry.name}",
+                    ts=ts,
+                    pid=pid,
+                    tid=0,
+                    args=args,
+                )
+            )
+            if entry.event_type == "QUEUE":
+                size = queue_sizes.get(entry.name, 0) + (1 if entry.is_sender else -1)
+                queue_sizes[entry.name] = size
+                write(
+                    dict(
+                        ph="C",
+                        name=f"queue {entry.name}",
+                        ts=ts,
+                        pid=pid,
+                        args=dict(size=size),
+                    )
+                )
+
+            latency = matcher.match(entry)
+            if latency is not None:
+                ts_sent = (latency.t_sent_ns - t0) / 1000
+                span = dict(
+                    name=f"{latency.kind} {latency.name}", cat=latency.kind, id=n
+                )
+                write(
+                    dict(ph="X", ts=ts_sent, dur=ts - ts_sent, pid=pid, tid=0, **span)
+                )
+                write(dict(ph="s", ts=ts_sent, pid=pids[latency.sender], tid=0, **span))
+                write(dict(ph="f", bp="e", ts=ts, pid=pid, tid=0, **span))
+                if latencies_file is not None:
+                    latencies_writer.writerow(
+                        latency + ((latency.t_received_ns - latency.t_sent_ns) / 1000,)
+                    )
+            n += 1
+        f.write("\n]}\n")
+
+    if latencies_file is not None:
+        latencies_file.close()
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Merge the concurrence logs of a sisyphy session and measure latencies."
+    )
+    parser.add_argument("logs", type=Path, nargs="+", help="log files or directory")
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="output Chrome trace .json"
+    )
+    parser.add_argument(
+        "--latencies", type=Path, default=None, help="output latencies .csv"
+    )
+    args = parser.parse_args(argv)
+
+    filenames = []
+    for path in args.logs:
+        filenames += log_files(path) if path.is_dir() else [path]
+
+    if args.trace is not None:
+        latencies_filename = args.latencies
+        if latencies_filename is None:
+            latencies_filename = args.trace.with_name(
+                args.trace.stem + "_latencies.csv"
+            )
+        n = write_chrome_trace(merge_logs(filenames), args.trace, latencies_filename)
+        print(f"Written {n} entries from {len(filenames)} logs to {args.trace}")
+        latencies = pd.read_csv(latencies_filename)
+    else:
+        latencies = latency_table(iter_latencies(merge_logs(filenames)))
+        if args.latencies is not None:
+            latencies.to_csv(args.latencies, index=False)
+
+    if len(latencies) > 0:
+        print(latency_summary(latencies))
+
+
+if __name__ == "__main__":
+    main()
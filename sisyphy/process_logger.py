@@ -2,84 +2,354 @@
 written by Vilim Štih.
 """
 
-import time
-from enum import Enum, auto
+import json
+import os
+import struct
+import threading
+import weakref
+from collections import deque
+from enum import Enum, IntEnum
 from multiprocessing import Event, Process
 from pathlib import Path
-from typing import Optional, TextIO
+from typing import Dict, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from sisyphy.utils.timebase import monotonic_ns
+
+DEFAULT_LOG_DIR = Path.home() / ".sisyphy" / "logs"
+
+# Fixed-size binary record: monotonic ns, event type, name id, sender flag, value
+RECORD_STRUCT = struct.Struct("<qBHBq")
+# Length prefix of the texts of LOG entries, in the messages file:
+MESSAGE_LENGTH_STRUCT = struct.Struct("<I")
+# Name id of LOG entries, whose value is the index of their text instead:
+MESSAGE_ID = 2 ** 16 - 1
+RECORD_DTYPE = np.dtype(
+    [
+        ("t_ns", "<i8"),
+        ("event_type", "u1"),
+        ("name_id", "<u2"),
+        ("is_sender", "u1"),
+        ("value", "<i8"),
+    ]
+)
+assert RECORD_DTYPE.itemsize == RECORD_STRUCT.size
+
+
+class LogEventType(IntEnum):
+    LOG = 0
+    EVENT = 1
+    QUEUE = 2
+
+
+# Plain ints, faster to pack than the enum members:
+_LOG, _EVENT, _QUEUE = (int(t) for t in LogEventType)
 
 
 class ConcurrenceLogger:
-    """A utility class for logging different kinds of events, periods and messages with multiprocessing"""
+    """A utility class for logging different kinds of events, periods and messages with multiprocessing.
+
+    Entries are appended as tuples to a deque, without any lock, and a background
+    thread periodically packs them as fixed-size binary records in
+    `<directory>/<process_name>.bin`; names of events and queues are stored once, in
+    `<process_name>_ids.json`, and the texts of messages, which are usually all
+    different, are appended (length-prefixed) to `<process_name>_messages.dat`.
+    A log call costs about 0.3-0.5 us in CPython, and writing its entry about as
+    much again, in the background thread (see benchmarks/logger_overhead.py), so
+    the logger can stay enabled in time-critical loops. The thread and the files are started with the logger, and
+    started again in a process that is forked or unpickled with it (so loggers can
+    be created before starting a process); logging after `close()` restarts them,
+    appending to the same files.
+    Use `read_log` to load a log as a DataFrame.
+    """
+
+    def __init__(
+        self,
+        process_name: str,
+        directory: Union[str, Path] = None,
+        buffer_records: int = 2 ** 16,
+        flush_interval_s: float = 0.5,
+    ):
+        """
+        Parameters
+        ----------
+        process_name : str
+            Name of the logging process, used for the file names.
+        directory : str or Path
+            Where to save the logs. Defaults to the SISYPHY_LOG_DIR environment
+            variable, or ~/.sisyphy/logs.
+        buffer_records : int
+            Number of entries after which the logging thread writes them itself,
+            without waiting for the background write.
+        flush_interval_s : float
+            Interval between background writes of the entries to the file.
 
-    def __init__(self, process_name):
-        self.file: Optional[TextIO] = None
+        """
         self.process_name = process_name
-        # configuration = config.read_config()
-        self.root = Path(
-            r"C:\Users\SNeurobiology\Documents\Luigi\vr-test"
-        )  # configuration["default_paths"]["log"])
-
-    def _write_entry(self, event_type, event_id, is_sender, event_value):
-        if self.file is None:
-            self.file = open(self.root / (self.process_name + ".txt"), "w")
-        self.file.write(
-            f"{time.time_ns()},{event_type},{event_id},{'1' if is_sender else '0'},{event_value}\n"
+        if directory is None:
+            directory = os.environ.get("SISYPHY_LOG_DIR", DEFAULT_LOG_DIR)
+        self.root = Path(directory)
+        self.buffer_records = buffer_records
+        self.flush_interval_s = flush_interval_s
+
+        self._ids = dict()  # event and queue names to ids
+        self._keys = dict()  # names or Enum members, as logged, to ids
+        self._n_messages = 0
+        self._file_mode = "wb"  # append when restarted after close()
+        self._running = False
+        self._reset()
+        self._start()
+
+    @property
+    def filename(self) -> Path:
+        return self.root / (self.process_name + ".bin")
+
+    @property
+    def ids_filename(self) -> Path:
+        return self.root / (self.process_name + "_ids.json")
+
+    @property
+    def messages_filename(self) -> Path:
+        return self.root / (self.process_name + "_messages.dat")
+
+    def __getstate__(self):
+        # Entries, locks, files and thread belong to the process that logs:
+        state = self.__dict__.copy()
+        for key in [
+            "_records",
+            "_io_lock",
+            "_stop",
+            "_thread",
+            "file",
+            "messages_file",
+        ]:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+        if self._running:
+            self._running = False
+            self._start()
+
+    def _reset(self):
+        self._records = deque()  # entries waiting to be written
+        self._io_lock = threading.Lock()  # protects the files and the running state
+        self._flush_at = 0  # until started, the next entry calls _overflow
+        _loggers.add(self)
+
+    def _start(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.filename, self._file_mode)
+        self.messages_file = open(self.messages_filename, self._file_mode)
+        self._file_mode = "ab"
+        self._ids_saved = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._flush_loop, args=(self._stop,), daemon=True
         )
-        print("written")
+        self._thread.start()
+        self._running = True
+        self._flush_at = self.buffer_records
+
+    def _after_fork(self):
+        # Entries of the parent are written by the parent; the thread is not copied:
+        running = self._running
+        self._reset()
+        self._running = False
+        if running:
+            self._start()
+
+    def _flush_loop(self, stop):
+        while not stop.wait(self.flush_interval_s):
+            self.flush()
+
+    def _overflow(self):
+        # Called by a log call when there are `_flush_at` entries or more:
+        with self._io_lock:
+            if not self._running:
+                self._start()
+        if len(self._records) >= self.buffer_records:
+            self.flush()
+
+    def flush(self):
+        """Write the logged entries to the files."""
+        with self._io_lock:
+            if not self._running:
+                return
+            records, pack = self._records, RECORD_STRUCT.pack
+            chunks, messages = [], []
+            # Entries logged meanwhile wait for the next flush:
+            for _ in range(len(records)):
+                t_ns, event_type, name_id, is_sender, value = records.popleft()
+                if name_id == MESSAGE_ID:
+                    messages.append(value)
+                    value = self._n_messages
+                    self._n_messages += 1
+                chunks.append(pack(t_ns, event_type, name_id, is_sender, value))
+            self.file.write(b"".join(chunks))
+            self.file.flush()
+            for message in messages:
+                text = message.encode()
+                self.messages_file.write(MESSAGE_LENGTH_STRUCT.pack(len(text)) + text)
+            self.messages_file.flush()
+            if len(self._ids) > self._ids_saved:
+                self._save_ids()
+
+    def _save_ids(self):
+        names = {name_id: name for name, name_id in list(self._ids.items())}
+        with open(self.ids_filename, "w") as f:
+            json.dump(names, f)
+        self._ids_saved = len(names)
+
+    def _name_id(self, key: Union[Enum, str]) -> int:
+        name = key.name if isinstance(key, Enum) else key
+        name_id = self._ids.get(name)
+        if name_id is None:
+            if len(self._ids) >= MESSAGE_ID:
+                raise ValueError(
+                    f"Too many event and queue names to log {name!r}"
+                    " (use log_message for variable texts)."
+                )
+            name_id = self._ids.setdefault(name, len(self._ids))
+        self._keys[key] = name_id
+        return name_id
+
+    # The log calls are kept short: ids are resolved once per name, and an entry is
+    # a tuple appended to a deque, which is thread-safe without a lock.
 
     def log_message(self, message):
         """Logs any kind of message"""
-        self._write_entry("LOG", message, False, 0)
+        self._records.append((monotonic_ns(), _LOG, MESSAGE_ID, False, str(message)))
+        if len(self._records) >= self._flush_at:
+            self._overflow()
 
-    def log_event(self, event_name: Enum, is_sender: bool, event_value: bool):
+    def log_event(
+        self, event_name: Union[Enum, str], is_sender: bool, event_value: bool
+    ):
         """Logs multiprocessing synchronization events (multiprocessing.Event)"""
-        self._write_entry(
-            "EVENT", event_name.name, is_sender, "1" if event_value else "0"
+        name_id = self._keys.get(event_name)
+        if name_id is None:
+            name_id = self._name_id(event_name)
+        self._records.append(
+            (monotonic_ns(), _EVENT, name_id, is_sender, 1 if event_value else 0)
         )
+        if len(self._records) >= self._flush_at:
+            self._overflow()
 
-    def log_queue(self, queue_name, is_sender):
+    def log_queue(self, queue_name: Union[Enum, str], is_sender):
         """Logs queue-related events"""
-        self._write_entry("QUEUE", queue_name.name, is_sender, "1")
+        name_id = self._keys.get(queue_name)
+        if name_id is None:
+            name_id = self._name_id(queue_name)
+        self._records.append((monotonic_ns(), _QUEUE, name_id, is_sender, 1))
+        if len(self._records) >= self._flush_at:
+            self._overflow()
 
     def close(self):
-        if self.file is not None:
-            self.file.flush()
+        with self._io_lock:
+            if not self._running:
+                if not self._records:
+                    return
+                self._start()  # entries logged after a close() are appended
+            self._stop.set()
+        self._thread.join()
+        self.flush()
+        with self._io_lock:
+            if len(self._ids) > self._ids_saved:
+                self._save_ids()
             self.file.close()
+            self.messages_file.close()
+            self._running = False
+            self._flush_at = 0
 
 
-class LoggingProcess(Process):
-    """A process with an integrated concurrence logger"""
+# Loggers of this process, started again in forked children:
+_loggers = weakref.WeakSet()
 
-    def __init__(self, *args, name, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.logger = ConcurrenceLogger(name)
 
-    def close_log(self):
-        self.logger.close()
+def _after_fork():
+    for logger in list(_loggers):
+        logger._after_fork()
 
 
-class TerminableProcess(Process):
-    def __init__(self, kill_event: Event = None, *args, **kwargs):
-        self.kill_event = kill_event if kill_event is not None else Event()
-        super(TerminableProcess, self).__init__(*args, **kwargs)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
 
-    def run(self) -> None:
-        self.before_loop()
 
-        while not self.kill_event.is_set():
-            self.loop()
+def read_names(filename: Union[str, Path]) -> Dict[int, str]:
+    """Names of the events and queues of a binary log, by id."""
+    filename = Path(filename)
+    ids_filename = filename.with_name(filename.stem + "_ids.json")
+    if not ids_filename.exists():
+        return dict()
+    with open(ids_filename) as f:
+        return {int(k): v for k, v in json.load(f).items()}
 
-        self.after_loop()
 
-    def before_loop(self) -> None:
-        pass
+def iter_messages(filename: Union[str, Path]) -> Iterator[str]:
+    """Stream the texts of the LOG entries of a binary log, by increasing index."""
+    filename = Path(filename)
+    messages_filename = filename.with_name(filename.stem + "_messages.dat")
+    if not messages_filename.exists():
+        return
+    with open(messages_filename, "rb") as f:
+        while True:
+            prefix = f.read(MESSAGE_LENGTH_STRUCT.size)
+            if len(prefix) < MESSAGE_LENGTH_STRUCT.size:
+                return
+            (length,) = MESSAGE_LENGTH_STRUCT.unpack(prefix)
+            yield f.read(length).decode()
 
-    def loop(self) -> None:
-        pass
 
-    def after_loop(self) -> None:
-        pass
+def read_messages(filename: Union[str, Path]) -> List[str]:
+    """Texts of the LOG entries of a binary log, by index."""
+    return list(iter_messages(filename))
+
+
+def entry_name(name_id: int, value: int, names: Dict, messages: List) -> str:
+    """Name of an entry: its event or queue name, or the text of a message."""
+    if name_id == MESSAGE_ID:
+        return messages[value] if value < len(messages) else ""
+    return names.get(name_id, str(name_id))
+
+
+def read_log(filename: Union[str, Path]) -> pd.DataFrame:
+    """Load a binary log written by a ConcurrenceLogger as a DataFrame, with columns
+    t_ns, event_type, name, is_sender, value and process (for LOG entries, name is
+    the text of the message and value its index).
+    """
+    filename = Path(filename)
+    records = np.fromfile(filename, dtype=RECORD_DTYPE)
+    names, messages = read_names(filename), read_messages(filename)
+
+    return pd.DataFrame(
+        dict(
+            t_ns=records["t_ns"],
+            event_type=[LogEventType(t).name for t in records["event_type"]],
+            name=[
+                entry_name(i, v, names, messages)
+                for i, v in zip(records["name_id"].tolist(), records["value"].tolist())
+            ],
+            is_sender=records["is_sender"].astype(bool),
+            value=records["value"],
+            process=filename.stem,
+        )
+    )
+
+
+class LoggingProcess(Process):
+    """A process with an integrated concurrence logger"""
+
+    def __init__(self, *args, name, log_dir=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.logger = ConcurrenceLogger(name, directory=log_dir)
+
+    def close_log(self):
+        self.logger.close()
 
 
 class LoggedEvent:
@@ -116,3 +386,20 @@ class LoggedEvent:
             self.logger.log_event(self.name, False, False)
         self.was_set = res
         return res
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    # Cost of logging an entry:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        logger = ConcurrenceLogger("benchmark", directory=tmp_dir)
+        logger.log_message("start")
+        n = 200000
+        t0 = monotonic_ns()
+        for _ in range(n):
+            logger.log_queue("data", True)
+        t1 = monotonic_ns()
+        logger.close()
+        print(f"{(t1 - t0) / n:.0f} ns per entry")
+        print(read_log(logger.filename).tail())
@@ -1,3 +1,28 @@
-from sisyphy.streamers.base import DataStreamer, FileDataStreamer
-from sisyphy.streamers.tcp_streamer import TcpMouseStreamer
-from sisyphy.streamers.zmq_streamer import ZeroMQMouseStreamer
+"""Streamers of sphere data, imported on first use (so that, e.g., ZeroMQ is only
+needed by the ZeroMQ streamer).
+"""
+from typing import TYPE_CHECKING
+
+from sisyphy.utils.lazy import lazy_attributes
+
+__all__ = [
+    "DataStreamer",
+    "FileDataStreamer",
+    "TcpMouseStreamer",
+    "ZeroMQMouseStreamer",
+]
+
+_LAZY_ATTRIBUTES = dict(
+    DataStreamer="sisyphy.streamers.base",
+    FileDataStreamer="sisyphy.streamers.base",
+    TcpMouseStreamer="sisyphy.streamers.tcp_streamer",
+    ZeroMQMouseStreamer="sisyphy.streamers.zmq_streamer",
+)
+
+if TYPE_CHECKING:
+    from sisyphy.streamers.base import DataStreamer, FileDataStreamer
+    from sisyphy.streamers.tcp_streamer import TcpMouseStreamer
+    from sisyphy.streamers.zmq_streamer import ZeroMQMouseStreamer
+
+
+__getattr__, __dir__ = lazy_attributes(globals(), _LAZY_ATTRIBUTES)
@@ -3,11 +3,15 @@ import warnings
 from datetime import datetime
 from multiprocessing import Event, Process, Queue
 from pathlib import Path
-from time import time_ns
 import csv
+import time
 
 import pandas as pd
 
+from sisyphy.utils.metrics import StageMetrics
+from sisyphy.utils.process import TerminableProcess
+from sisyphy.utils.timebase import AnchorRecorder, monotonic_ns
+
 
 class DataStreamer(Process, metaclass=abc.ABCMeta):
     """General streamer of data from a SphereReaderProcess, implementing some utils
@@ -22,6 +26,8 @@ class DataStreamer(Process, metaclass=abc.ABCMeta):
         sphere_data_queue=None,
         output_queue=None,
         data_path: str = None,
+        idle_sleep_s: float = 0.001,
+        metrics: StageMetrics = None,
         **kwargs,
     ):
         """
@@ -35,6 +41,12 @@ class DataStreamer(Process, metaclass=abc.ABCMeta):
             Queue to read data from.
         output_queue : Queue
             Queue to write data to.
+        idle_sleep_s : float
+            Sleep when there are no new data, so that the loop does not keep the CPU
+            (and the GIL, with the thread backend) busy.
+        metrics : StageMetrics
+            Where to publish the health metrics of the streamer (samples fetched,
+            depth of the input queue).
 
         """
         super().__init__(*args, **kwargs)
@@ -44,11 +56,14 @@ class DataStreamer(Process, metaclass=abc.ABCMeta):
         self.output_queue = output_queue if output_queue is not None else Queue()
 
         self._time_to_avg_s = time_to_avg_s
+        self.idle_sleep_s = idle_sleep_s
         self.data_path = Path(data_path) if data_path is not None else None
+        self.metrics = metrics
 
         self._past_data_list = []
         self._past_times = []
-        self.t_start = time_ns()
+        self.t_start = monotonic_ns()
+        self.clock_anchors = AnchorRecorder()
 
     @property
     def _last_past_idx(self):
@@ -59,7 +74,7 @@ class DataStreamer(Process, metaclass=abc.ABCMeta):
         if len(self._past_times) == 0:  # avoid index problems
             return
 
-        now = time_ns()
+        now = monotonic_ns()
         i = len(self._past_times) - 1
 
         # Check we are not lagging behind with the queue reading:
@@ -76,11 +91,19 @@ class DataStreamer(Process, metaclass=abc.ABCMeta):
                 i -= 1
         return i
 
-    def fetch_data(self):
-        """Update internal data lists."""
+    def fetch_data(self) -> int:
+        """Update internal data lists, returning the number of new data."""
         retrieved_data = self._sphere_data_queue.get_all()
-        self._past_data_list.extend(retrieved_data)
-        self._past_times.extend([d.t_ns for d in retrieved_data])
+        self._add_data(retrieved_data)
+        if self.metrics is not None:
+            self.metrics.maybe_publish([self._sphere_data_queue])
+        return len(retrieved_data)
+
+    def _add_data(self, data) -> None:
+        self._past_data_list.extend(data)
+        self._past_times.extend([d.t_ns for d in data])
+        if self.metrics is not None and len(data) > 0:
+            self.metrics.count(len(data))
 
     @property
     def average_values(self):
@@ -97,35 +120,33 @@ class DataStreamer(Process, metaclass=abc.ABCMeta):
         data_df = pd.DataFrame(self._past_data_list)
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         data_df.to_csv(self.data_path / f"{timestamp}_data.csv")
+        self.clock_anchors.record()
+        self.clock_anchors.save(self.data_path / f"{timestamp}_clock_anchors.csv")
         print(f"Saved data to {self.data_path}.")
 
     def run(self) -> None:
         print("running streamer process.")
-        self.t_start = time_ns()
-        i = 0
+        self.t_start = monotonic_ns()
         while not self.kill_event.is_set():
-            self.fetch_data()
+            if self.fetch_data() == 0:
+                time.sleep(self.idle_sleep_s)
             self.execute_in_run_loop()
+            self.clock_anchors.maybe_record()
 
-            # Some printing:
-            if i % 1000 == 0:
-                avg_vals = self.average_values
-                if len(avg_vals) > 0:
-                    vals_dict = avg_vals.to_dict()
-                    data_string = "".join(
-                        [f"{key}: {val}  - " for key, val in vals_dict.items()]
-                    )
-                    #print(f"Average values: {data_string}")
-
-                    # self.output_queue.put(avg_vals)
-                    # print(self.output_queue)
-            i += 1
-
+        # Keep everything the reader put in the queue before closing the stream:
+        remaining_data, _ = self._sphere_data_queue.get_until_end(timeout=2.0)
+        self._add_data(remaining_data)
+        if self.metrics is not None:
+            self.metrics.maybe_publish([self._sphere_data_queue], force=True)
         self.save_data()
+        # Outputs left in the queue at this point are not read anymore; do not wait
+        # for them to be flushed before exiting:
+        self.output_queue.cancel_join_thread()
 
 
-class FileDataStreamer(Process):
-    """Data to file streamer of data from a SphereReaderProcess, implementing some utils
+class FileDataStreamer(TerminableProcess):
+    """Data to file streamer of data from a SphereReaderProcess, waking up only when
+    there is new data in the queue.
     """
 
     def __init__(
@@ -135,6 +156,7 @@ class FileDataStreamer(Process):
         sphere_data_queue=None,
         passover_queue=None,
         data_path: str = None,
+        drain_timeout_s: float = 2.0,
         **kwargs,
     ):
         """
@@ -144,59 +166,65 @@ class FileDataStreamer(Process):
             Termination event.
         sphere_data_queue : Queue
             Queue to read data from.
+        drain_timeout_s : float
+            After the kill event is set, maximum time to wait for the end of the
+            stream from the reader.
 
         """
-        super().__init__(*args, **kwargs)
+        super().__init__(kill_event, *args, **kwargs)
+        self.drain_timeout_s = drain_timeout_s
 
-        self.kill_event = kill_event if kill_event is not None else Event()
         self._sphere_data_queue = sphere_data_queue
         self._passover_queue = passover_queue
+        self.add_wake_source(sphere_data_queue)
 
         self.data_path = Path(data_path) if data_path is not None else None
 
-        self._past_data_list = []
-        self._past_times = []
-        self.t_start = time_ns()
-
-
-    def fetch_data(self):
-        """Update internal data lists."""
-        pass
-        # self._past_data_list.extend(retrieved_data)
-        # self._past_times.extend([d.t_ns for d in retrieved_data])
+        self.t_start = monotonic_ns()
+        self.clock_anchors = AnchorRecorder()
 
-    def run(self) -> None:
+    def before_loop(self) -> None:
         self.data_path.mkdir(parents=True, exist_ok=True)
-        # data_df = pd.DataFrame(self._past_data_list)
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = self.data_path / f"{timestamp}_data.csv"
-        # data_df.to_csv()
+        self._timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        filename = self.data_path / f"{self._timestamp}_data.csv"
         print(f"Streaming data to {filename}.")
-        file = open(filename, 'w', newline='')
-        header = None
-
-        with filename.open('w', newline='') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            self.t_start = time_ns()
-
-            while not self.kill_event.is_set():
-
-                retrieved_data = self._sphere_data_queue.get_all()
-
-                if len(retrieved_data) > 0:
-                    if self._passover_queue is not None:
-                        self._passover_queue.put(retrieved_data[0])
-
-                    if header is None:
-                        header = retrieved_data[0].__dict__.keys()
-                        writer.writerow(header)
-
-                    for data in retrieved_data:
-                        writer.writerow(data.__dict__.values())
-
-
-        # file.close()
-        print("Done streaming data.")
+        self._outfile = filename.open("w", newline="")
+        self._writer = csv.writer(self._outfile, delimiter=",")
+        self._header = None
+        self.t_start = monotonic_ns()
+
+    def loop(self) -> None:
+        self.clock_anchors.maybe_record()
+        self._write(self._sphere_data_queue.get_all())
+
+    def _write(self, retrieved_data) -> None:
+        if len(retrieved_data) > 0:
+            if self._passover_queue is not None:
+                self._passover_queue.put(retrieved_data[0])
+
+            if self._header is None:
+                self._header = retrieved_data[0].__dict__.keys()
+                self._writer.writerow(self._header)
+
+            for data in retrieved_data:
+                self._writer.writerow(data.__dict__.values())
+            self.monitor.count(len(retrieved_data))
+
+    def after_loop(self) -> None:
+        # Write everything the reader put in the queue before closing the stream:
+        remaining_data, ended = self._sphere_data_queue.get_until_end(
+            timeout=self.drain_timeout_s
+        )
+        self._write(remaining_data)
+        if not ended:
+            warnings.warn("Data stream did not end in time, some data might be lost.")
+        if hasattr(self._passover_queue, "end_stream"):
+            self._passover_queue.end_stream(sender=self.name)
+
+        self._outfile.close()
+        self.clock_anchors.record()
+        self.clock_anchors.save(self.data_path / f"{self._timestamp}_clock_anchors.csv")
+        print(f"Done streaming data ({self.loop_stats}).")
 
 
 class SocketStreamer(DataStreamer, metaclass=abc.ABCMeta):
@@ -0,0 +1,213 @@
+"""Supervision of the processes of an acquisition pipeline.
+
+A `Supervisor` owns the processes of a pipeline (e.g. a sphere reader and a
+streamer) and checks from a thread of the main process that each of them is alive,
+beating (see `TerminableProcess.monitor`) and, for the stages that should always
+produce data, counting new samples. A stage that crashed or stalled is stopped and
+rebuilt from its factory, with the same queues, so that the rest of the pipeline
+keeps running; the interruption of its data is recorded as a `Gap`.
+
+Note that a process terminated while writing to a queue can leave the queue locked;
+stages that crash with an exception (the most common failure, e.g. USB errors) exit
+cleanly and do not have this problem.
+"""
+import threading
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Sequence, Union
+
+import pandas as pd
+
+from sisyphy.utils.process import (
+    ShutdownReport,
+    TerminableProcess,
+    WakeableEvent,
+    join_or_kill,
+    stop_processes,
+)
+from sisyphy.utils.timebase import monotonic_ns
+
+
+@dataclass
+class Gap:
+    """Interruption of the data of a stage, from its last sample to its restart."""
+
+    stage: str
+    reason: str
+    t_last_sample_ns: int
+    t_restart_ns: int
+    n_samples_before: int
+
+    @property
+    def duration_s(self) -> float:
+        return (self.t_restart_ns - self.t_last_sample_ns) * 1e-9
+
+
+class Stage:
+    """A supervised stage of a pipeline, built by a factory so that it can be restarted."""
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[WakeableEvent], TerminableProcess],
+        stall_timeout_s: float = 2.0,
+        expects_samples: bool = False,
+        max_restarts: int = 5,
+    ):
+        """
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        factory : callable
+            Function building the process from its kill event; it is called again at
+            every restart, and should attach the process to the same queues.
+        stall_timeout_s : float
+            Time without heartbeats (or without samples, see `expects_samples`) after
+            which the stage is considered stalled.
+        expects_samples : bool
+            If True, the stage is also stalled when it does not count new samples
+            (e.g. readers, that always produce data).
+        max_restarts : int
+            Maximum number of restarts, to avoid restarting a broken stage forever.
+
+        """
+        self.name = name
+        self.factory = factory
+        self.stall_timeout_s = stall_timeout_s
+        self.expects_samples = expects_samples
+        self.max_restarts = max_restarts
+
+        self.n_restarts = 0
+        self.process = None
+        self.kill_event = None
+        self._t_started_ns = None
+
+    def start(self) -> None:
+        self.kill_event = WakeableEvent()
+        self.process = self.factory(self.kill_event)
+        self.process.start()
+        self._t_started_ns = monotonic_ns()
+
+    def check(self, now_ns: int) -> Union[str, None]:
+        """Reason why the stage should be restarted, or None if it is healthy."""
+        if not self.process.is_alive():
+            return f"exited with code {self.process.exitcode}"
+        monitor = getattr(self.process, "monitor", None)
+        if monitor is None:  # not a TerminableProcess, only crashes are detected
+            return None
+        timeout_ns = int(self.stall_timeout_s * 1e9)
+        if now_ns - max(monitor.heartbeat_ns, self._t_started_ns) > timeout_ns:
+            return "no heartbeat"
+        if self.expects_samples:
+            if now_ns - max(monitor.last_sample_ns, self._t_started_ns) > timeout_ns:
+                return "no samples"
+        return None
+
+    def restart(self, reason: str) -> Gap:
+        last_sample_ns, n_samples = self._t_started_ns, 0
+        monitor = getattr(self.process, "monitor", None)
+        if monitor is not None and monitor.n_samples > 0:
+            last_sample_ns, n_samples = monitor.last_sample_ns, monitor.n_samples
+
+        self.kill_event.set()
+        join_or_kill(self.process, timeout_s=min(self.stall_timeout_s, 1.0))
+        self.n_restarts += 1
+        self.start()
+        return Gap(self.name, reason, last_sample_ns, self._t_started_ns, n_samples)
+
+
+class Supervisor:
+    """Start, watch and restart the stages of a pipeline.
+
+    Every stage gets its own kill event, so that it can be restarted alone; setting
+    the `kill_event` of the supervisor (if any) sets all of them.
+    """
+
+    def __init__(
+        self, stages: Sequence[Stage], kill_event=None, check_interval_s: float = 0.2
+    ):
+        """
+        Parameters
+        ----------
+        stages : list of Stage
+            Stages of the pipeline, from the source to the sink.
+        kill_event : Event
+            Termination event of the whole pipeline.
+        check_interval_s : float
+            Interval between two checks of the stages.
+
+        """
+        self.stages = list(stages)
+        self.kill_event = kill_event
+        self.check_interval_s = check_interval_s
+        self.gaps: List[Gap] = []
+
+        self._stop_watching = threading.Event()
+        self._thread = None
+
+    def __getitem__(self, name: str) -> Stage:
+        return next(stage for stage in self.stages if stage.name == name)
+
+    def start(self) -> None:
+        for stage in self.stages:
+            stage.start()
+        self._stop_watching.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def _watch(self) -> None:
+        while not self._stop_watching.wait(self.check_interval_s):
+            if self.kill_event is not None and self.kill_event.is_set():
+                for stage in self.stages:
+                    stage.kill_event.set()
+                break
+            self.check()
+
+    def check(self) -> None:
+        """Restart the stages that crashed or stalled."""
+        for stage in self.stages:
+            if stage.n_restarts >= stage.max_restarts:
+                continue
+            reason = stage.check(monotonic_ns())
+            if reason is None or self._stop_watching.is_set():
+                continue
+            gap = stage.restart(reason)
+            self.gaps.append(gap)
+            warnings.warn(
+                f"Restarted {stage.name} ({reason}), {gap.duration_s:.3f} s of data lost."
+            )
+            if stage.n_restarts == stage.max_restarts:
+                warnings.warn(f"{stage.name} reached the maximum number of restarts.")
+
+    def status(self) -> pd.DataFrame:
+        """Health of the stages: alive, samples, time since last heartbeat and sample,
+        number of restarts.
+        """
+        now = monotonic_ns()
+        rows = []
+        for stage in self.stages:
+            row = dict(stage=stage.name, alive=stage.process.is_alive())
+            monitor = getattr(stage.process, "monitor", None)
+            if monitor is not None:
+                row["n_samples"] = monitor.n_samples
+                row["heartbeat_age_s"] = (now - monitor.heartbeat_ns) * 1e-9
+                row["sample_age_s"] = (now - monitor.last_sample_ns) * 1e-9
+            row["n_restarts"] = stage.n_restarts
+            rows.append(row)
+        return pd.DataFrame(rows).set_index("stage")
+
+    def stop(self, timeout_s: float = 5.0) -> ShutdownReport:
+        """Stop watching, and stop all the stages (see `stop_processes`)."""
+        self._stop_watching.set()
+        if self._thread is not None:
+            self._thread.join()
+        processes = [stage.process for stage in self.stages]
+        return stop_processes(processes, timeout_s=timeout_s)
+
+    def save_gaps(self, filename: Union[str, Path]) -> None:
+        pd.DataFrame(
+            [dict(gap.__dict__, duration_s=gap.duration_s) for gap in self.gaps],
+            columns=list(Gap.__dataclass_fields__) + ["duration_s"],
+        ).to_csv(filename, index=False)
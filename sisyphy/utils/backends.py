@@ -0,0 +1,94 @@
+"""Execution backends for the stages of a pipeline.
+
+With the "process" backend (the default) every stage is a separate OS process, and
+stages exchange data through multiprocessing queues, that pickle every item. With
+the "thread" backend the same stage objects are run as threads of the current
+process, and exchange data through `DequeQueue`s, that pass items by reference.
+
+Threads start in milliseconds instead of seconds (on Windows every spawned process
+imports numpy and pandas again), and do not pay for pickling; processes are isolated
+from each other and are not limited by the GIL. Stages that mostly wait for I/O
+(USB reads, queues, files) release the GIL and run well as threads; see
+benchmarks/backends.py to compare the backends on a given machine.
+"""
+import os
+import threading
+import traceback
+import warnings
+
+from sisyphy.utils.custom_queue import DequeQueue, SaturatingQueue
+
+BACKENDS = ("process", "thread")
+
+
+def check_backend(backend: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, use one of {BACKENDS}.")
+    return backend
+
+
+def make_queue(backend: str = "process", maxsize: int = 10000):
+    """Saturating queue suitable for exchanging data between stages of a backend."""
+    if check_backend(backend) == "thread":
+        return DequeQueue(maxsize=maxsize)
+    return SaturatingQueue(maxsize=maxsize)
+
+
+class StageThread:
+    """Run a `multiprocessing.Process` object in a thread of the current process.
+
+    The wrapper has the interface of the process used to control it (start, join,
+    is_alive, exitcode, ...), and forwards every other attribute to the process, so it
+    can be used in its place, e.g. by `stop_processes` or by a `Supervisor`. Threads
+    cannot be killed: `terminate()` and `kill()` only set the kill event of the stage.
+    """
+
+    def __init__(self, process):
+        object.__setattr__(self, "process", process)
+        object.__setattr__(self, "exitcode", None)
+        object.__setattr__(
+            self,
+            "_thread",
+            threading.Thread(target=self._run, name=process.name, daemon=True),
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.process, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.process, name, value)
+
+    def _run(self) -> None:
+        try:
+            self.process.run()
+            exitcode = 0
+        except Exception:
+            traceback.print_exc()
+            exitcode = 1
+        object.__setattr__(self, "exitcode", exitcode)
+
+    @property
+    def pid(self):
+        return os.getpid() if self._thread.ident is not None else None
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self, timeout: float = None) -> None:
+        self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def terminate(self) -> None:
+        warnings.warn(f"{self.name} runs in a thread and cannot be terminated.")
+        self.process.kill_event.set()
+
+    kill = terminate
+
+
+def run_in(process, backend: str = "process"):
+    """The process itself, or a StageThread running it for the thread backend."""
+    if check_backend(backend) == "thread":
+        return StageThread(process)
+    return process
@@ -1,37 +1,83 @@
-from multiprocessing import get_context
+import warnings
+from collections import deque
+from multiprocessing import Pipe, get_context
 from multiprocessing.queues import Queue
 from queue import Empty, Full
-from typing import Union
+from typing import List, Tuple, Union
 
+from sisyphy.utils.dataclasses import EndOfStream
+from sisyphy.utils.timebase import monotonic_ns
 
-class SaturatingQueue(Queue):
-    def __init__(self, *args, maxsize: int = 10000, **kwargs):
-        # if maxsize is None:
-        #     raise TypeError("You must specify a maximum size for a SaturatingQueue!")
-        super(SaturatingQueue, self).__init__(
-            *args, maxsize=maxsize, ctx=get_context(), **kwargs
-        )
+# Maximum wait for room for an EndOfStream sentinel in a full queue:
+END_STREAM_TIMEOUT_S = 1.0
 
-    def put(self, *args, verbose: bool = False, **kwargs) -> None:
-        try:
-            super().put(*args, **kwargs, block=False)
-        except Full:
-            if verbose:
-                print("Full queue!")  # TODO: replace with meaningful log
+
+class _StreamMixin:
+    """End of stream handling for queues with `get(block, timeout)`."""
 
     def get_all(self, *args, **kwargs):
+        """Get all the items in the queue without waiting. An EndOfStream sentinel is
+        not returned, but sets `stream_ended` (and items after it are left in the queue).
+        """
         all_data = []
 
         while True:
             try:
-                all_data.append(
-                    super(SaturatingQueue, self).get(*args, block=False, **kwargs)
-                )
+                item = self.get(*args, block=False, **kwargs)
             except Empty:
                 break
+            self._stream_ended = isinstance(item, EndOfStream)
+            if self._stream_ended:
+                break
+            all_data.append(item)
 
         return all_data
 
+    @property
+    def stream_ended(self) -> bool:
+        """True if the last item received from this end of the queue was an EndOfStream
+        sentinel (data after a sentinel, e.g. from a restarted producer, reopen the
+        stream).
+        """
+        return getattr(self, "_stream_ended", False)
+
+    def end_stream(
+        self, sender: str = "", timeout: float = END_STREAM_TIMEOUT_S
+    ) -> bool:
+        """Close the stream with an EndOfStream sentinel. Unlike data, the sentinel is
+        not dropped right away: if the queue is full, wait up to `timeout` s (forever
+        if None) for the consumer. Returns False, with a warning, if the sentinel
+        was dropped because nobody made room for it.
+        """
+        try:
+            self._put_blocking(EndOfStream(sender=sender), timeout)
+        except Full:
+            warnings.warn(
+                f"Queue still full after {timeout} s, end of stream from"
+                f" {sender or 'producer'} dropped (is the consumer gone?)."
+            )
+            return False
+        return True
+
+    def get_until_end(self, timeout: float = None) -> Tuple[List, bool]:
+        """Get all the items up to the EndOfStream sentinel, waiting for it at most
+        `timeout` s. Returns the items, and whether the sentinel was received.
+        """
+        all_data = self.get_all()
+        deadline_ns = None if timeout is None else monotonic_ns() + int(timeout * 1e9)
+        while not self.stream_ended:
+            remaining = None
+            if deadline_ns is not None:
+                remaining = max((deadline_ns - monotonic_ns()) * 1e-9, 0)
+            try:
+                item = self.get(block=True, timeout=remaining)
+            except Empty:
+                break
+            self._stream_ended = isinstance(item, EndOfStream)
+            if not self._stream_ended:
+                all_data.append(item)
+        return all_data, self.stream_ended
+
     def clear(self) -> None:
         """Clear queue. might hang for super long queues!"""
         try:
@@ -40,8 +86,117 @@ class SaturatingQueue(Queue):
         except Empty:
             pass
 
+
+class SaturatingQueue(_StreamMixin, Queue):
+    def __init__(self, *args, maxsize: int = 10000, **kwargs):
+        # if maxsize is None:
+        #     raise TypeError("You must specify a maximum size for a SaturatingQueue!")
+        super(SaturatingQueue, self).__init__(
+            *args, maxsize=maxsize, ctx=get_context(), **kwargs
+        )
+
+    def put(self, *args, verbose: bool = False, **kwargs) -> bool:
+        """Put an item without blocking; returns False if it was dropped because the
+        queue is full.
+        """
+        try:
+            super().put(*args, **kwargs, block=False)
+        except Full:
+            if verbose:
+                print("Full queue!")  # TODO: replace with meaningful log
+            return False
+        return True
+
+    def _put_blocking(self, item, timeout: float = None) -> None:
+        super().put(item, block=True, timeout=timeout)
+
     def tear_down(self) -> None:
         """Clear queue and join thread for good measure."""
         self.clear()
         self.close()
         self.join_thread()
+
+
+class DequeQueue(_StreamMixin):
+    """Queue with the interface of a SaturatingQueue, for stages running as threads of
+    the same process: items are passed by reference (no pickling) through a deque,
+    whose appends and pops are atomic, so no lock is needed with one producer and one
+    consumer.
+
+    A waiting consumer is woken through a pipe, which is only written when the
+    consumer is actually waiting, so puts are cheap. The pipe also makes the queue
+    usable as a wake source of a TerminableProcess.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._deque = deque()
+        self._reader, self._writer = Pipe(duplex=False)
+        self._waiting = False
+
+    def __getstate__(self):
+        raise TypeError("A DequeQueue can only be shared by threads of the same process.")
+
+    def put(self, item, verbose: bool = False, **kwargs) -> bool:
+        if len(self._deque) >= self.maxsize:
+            if verbose:
+                print("Full queue!")
+            return False
+        self._put_blocking(item)
+        return True
+
+    def _put_blocking(self, item, timeout: float = None) -> None:
+        self._deque.append(item)
+        if self._waiting:
+            self._waiting = False
+            self._writer.send_bytes(b"")
+
+    def arm(self) -> bool:
+        """Prepare to wait on `_reader`; returns True if there is data already."""
+        self._waiting = True
+        if self._deque:
+            self._waiting = False
+            return True
+        return False
+
+    def disarm(self) -> None:
+        """Stop waiting, and discard the wake-ups."""
+        self._waiting = False
+        while self._reader.poll():
+            self._reader.recv_bytes()
+
+    def get(self, block: bool = True, timeout: float = None):
+        deadline_ns = None if timeout is None else monotonic_ns() + int(timeout * 1e9)
+        while True:
+            try:
+                return self._deque.popleft()
+            except IndexError:
+                pass
+            if not block:
+                raise Empty
+            remaining = None
+            if deadline_ns is not None:
+                remaining = (deadline_ns - monotonic_ns()) * 1e-9
+                if remaining <= 0:
+                    raise Empty
+            if not self.arm():
+                self._reader.poll(remaining)
+                self.disarm()
+
+    def qsize(self) -> int:
+        return len(self._deque)
+
+    def empty(self) -> bool:
+        return len(self._deque) == 0
+
+    def close(self) -> None:
+        pass
+
+    def join_thread(self) -> None:
+        pass
+
+    def cancel_join_thread(self) -> None:
+        pass
+
+    def tear_down(self) -> None:
+        self.clear()
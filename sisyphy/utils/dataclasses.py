@@ -1,7 +1,18 @@
-import time
 from dataclasses import dataclass, field
 
+from sisyphy.utils.timebase import monotonic_ns
+
 
 @dataclass
 class TimestampedDataClass:
-    t_ns: int = field(default_factory=time.time_ns, init=False)
+    # Monotonic timestamp, see sisyphy.utils.timebase for conversion to wall-clock time
+    t_ns: int = field(default_factory=monotonic_ns, init=False)
+
+
+@dataclass
+class EndOfStream(TimestampedDataClass):
+    """Sentinel closing a stream of data in a queue: everything put in the queue
+    before it comes out first.
+    """
+
+    sender: str = ""
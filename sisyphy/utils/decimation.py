@@ -0,0 +1,167 @@
+"""Min/max level-of-detail decimation of a ring buffer, for live plots.
+
+A `MinMaxPyramid` keeps, next to a `ColumnarRingBuffer` of raw samples, a stack of
+levels in which every bin has the minimum and the maximum of `factor` bins of the
+level below (level 1 summarizes `factor` raw samples, level 2 `factor ** 2`, ...).
+Levels are updated incrementally as batches are written, and are ring buffers in
+shared memory as well, so that a plot in another process can read them directly.
+
+A window is read from the coarsest level that still gives enough points for the
+requested resolution, plus the most recent bins of the finer levels (and the
+most recent raw samples) that are not complete yet at that level. Every bin is
+drawn as a vertical segment from its minimum to its maximum: at most a few points
+per pixel are drawn, whatever the length of the window or the sample rate, and
+spikes stay visible.
+"""
+from typing import Iterable, Tuple
+
+import numpy as np
+
+from sisyphy.utils.ring_buffer import ColumnarRingBuffer
+
+
+class MinMaxPyramid:
+    """Incremental min/max decimation levels of a ColumnarRingBuffer."""
+
+    def __init__(
+        self, buffer: ColumnarRingBuffer, factor: int = 4, min_bins: int = 64
+    ):
+        """
+        Parameters
+        ----------
+        buffer : ColumnarRingBuffer
+            Buffer of the raw samples; write to it only through the pyramid.
+        factor : int
+            Number of bins of a level summarized by a bin of the level above.
+        min_bins : int
+            Levels are added while they keep at least this number of bins.
+
+        """
+        self.buffer = buffer
+        self.factor = factor
+        n_columns = len(buffer.columns)
+        columns = [f"{c}_min" for c in buffer.columns]
+        columns += [f"{c}_max" for c in buffer.columns]
+
+        self.levels = []
+        bin_size = factor
+        while buffer.capacity // bin_size >= min_bins:
+            self.levels.append(
+                ColumnarRingBuffer(columns, capacity=buffer.capacity // bin_size + 1)
+            )
+            bin_size *= factor
+
+        # Data of the incomplete bins, in the writing process only:
+        self._pending = [
+            (np.zeros(0, dtype=np.int64), np.zeros((2 * n_columns, 0)))
+            for _ in self.levels
+        ]
+
+    def bin_size(self, level: int) -> int:
+        """Number of raw samples in a bin of a level (0 for the raw samples)."""
+        return self.factor ** level
+
+    def extend(self, times: np.ndarray, values: np.ndarray) -> None:
+        """Write a batch of samples to the buffer, and update the levels."""
+        self.buffer.extend(times, values)
+        values = np.asarray(values, dtype=np.float64)
+        # Raw samples are bins of a single sample, with the same minimum and maximum:
+        times, min_max = np.asarray(times), np.concatenate([values, values])
+        for i, level in enumerate(self.levels):
+            times, min_max = self._summarize(i, times, min_max)
+            if len(times) == 0:
+                break
+            level.extend(times, min_max)
+
+    def extend_from(self, samples: Iterable) -> None:
+        """Write a batch of objects with the attributes of the buffer columns (see
+        `ColumnarRingBuffer.extend_from`).
+        """
+        samples = list(samples)
+        if len(samples) == 0:
+            return
+        self.extend(
+            np.array([s.t_ns for s in samples], dtype=np.int64),
+            np.array(
+                [[getattr(s, c, np.nan) for s in samples] for c in self.buffer.columns],
+                dtype=np.float64,
+            ),
+        )
+
+    def _summarize(self, i: int, times: np.ndarray, min_max: np.ndarray):
+        """Complete bins of level i from new bins of the level below."""
+        pending_times, pending_min_max = self._pending[i]
+        times = np.concatenate([pending_times, times])
+        min_max = np.concatenate([pending_min_max, min_max], axis=1)
+        n_complete = len(times) // self.factor * self.factor
+        self._pending[i] = times[n_complete:], min_max[:, n_complete:]
+
+        n_columns = min_max.shape[0] // 2
+        binned = min_max[:, :n_complete].reshape(min_max.shape[0], -1, self.factor)
+        return (
+            times[:n_complete : self.factor],
+            np.concatenate(
+                [binned[:n_columns].min(axis=2), binned[n_columns:].max(axis=2)]
+            ),
+        )
+
+    def level_for(self, n_samples: int, max_points: int) -> int:
+        """Coarsest level needed to draw `n_samples` raw samples with at most about
+        `max_points` points (one per raw sample, two per bin).
+        """
+        level, n_points = 0, n_samples
+        while level < len(self.levels) and n_points > max_points:
+            level += 1
+            n_points = 2 * n_samples / self.bin_size(level)
+        return level
+
+    def window(
+        self, t_from_ns: int = None, max_points: int = 2000
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Decimated copy of the samples from `t_from_ns` (all if None).
+
+        Parameters
+        ----------
+        t_from_ns : int
+            Start of the window.
+        max_points : int
+            Approximate maximum number of points, e.g. twice the width of the plot
+            in pixels.
+
+        Returns
+        -------
+        tuple
+            (n,) array of times and (n_columns, n) array of values, with the minimum
+            and the maximum of every bin as two points at the time of its first sample.
+
+        """
+        if t_from_ns is None:
+            n_samples = len(self.buffer)
+        else:
+            n_samples = self.buffer.count_since(t_from_ns)
+        top = self.level_for(n_samples, max_points)
+        if top == 0:
+            return self.buffer.window(t_from_ns)
+
+        # Coarsest level for the window, then the bins of the finer levels (and the
+        # raw samples) after the last complete bin of the level above. Counts are
+        # read before the data, so parts can overlap by a bin, but never leave gaps:
+        covered = self.levels[top - 1].n_written * self.bin_size(top)
+        parts = [_as_points(*self.levels[top - 1].window(t_from_ns))]
+        for level in range(top - 1, 0, -1):
+            first_bin = covered // self.bin_size(level)
+            covered = self.levels[level - 1].n_written * self.bin_size(level)
+            parts.append(_as_points(*self.levels[level - 1].read_from(first_bin)))
+        parts.append(self.buffer.read_from(covered))
+
+        return (
+            np.concatenate([times for times, _ in parts]),
+            np.concatenate([values for _, values in parts], axis=1),
+        )
+
+
+def _as_points(times: np.ndarray, min_max: np.ndarray):
+    """Interleave the minimum and maximum of every bin as two points."""
+    n_columns = min_max.shape[0] // 2
+    values = np.stack([min_max[:n_columns], min_max[n_columns:]], axis=2)
+    return np.repeat(times, 2), values.reshape(n_columns, -1)
@@ -0,0 +1,39 @@
+"""Lazy attributes of packages (PEP 562), to import subpackages and their
+dependencies only when they are used.
+"""
+import importlib
+from typing import Callable, Dict, Tuple
+
+
+def lazy_attributes(
+    package_globals: dict, attributes: Dict[str, str]
+) -> Tuple[Callable, Callable]:
+    """Module `__getattr__` and `__dir__` functions for a package.
+
+    Parameters
+    ----------
+    package_globals : dict
+        `globals()` of the package; imported attributes are cached there, so that
+        later accesses are as fast as for regular attributes.
+    attributes : dict
+        Name of the module defining each lazy attribute.
+
+    Returns
+    -------
+    tuple
+        The `__getattr__` and `__dir__` functions of the package.
+
+    """
+    package_name = package_globals["__name__"]
+
+    def __getattr__(name):
+        if name not in attributes:
+            raise AttributeError(f"module {package_name} has no attribute {name}")
+        value = getattr(importlib.import_module(attributes[name]), name)
+        package_globals[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(package_globals) | set(attributes))
+
+    return __getattr__, __dir__
@@ -0,0 +1,233 @@
+"""Live health metrics of the stages of a pipeline, in shared memory.
+
+A `MetricsRegistry` holds one row of metrics per stage in a RawArray, created in
+the main process before the stages start. Every stage writes its own row through
+a `StageMetrics` handle (see the `metrics` argument of `TerminableProcess`):
+
+- samples_total: samples produced (or consumed, for sinks);
+- drops_total: samples dropped because the output queue was full;
+- rate_hz: samples per second, since the previous publication;
+- interval_p50_s, interval_p99_s: percentiles of the intervals between samples,
+  over the last `n_intervals` samples;
+- queue_depth: items waiting in the input queues of the stage;
+- last_sample_age_s: time since the last sample (computed when read);
+- cpu_seconds_total: CPU time of the thread running the stage loop.
+
+Counters are updated at every sample; the other metrics are published at most
+every `publish_interval_s`, so that the cost for the stages is a few array writes.
+Metrics can be read from any process: as a dictionary or a DataFrame, in the
+Prometheus text format, or over HTTP (see `MetricsRegistry.serve`):
+
+    registry = MetricsRegistry(["reader", "streamer"], labels=dict(rig="rig1"))
+    server = registry.serve(port=9100)  # http://localhost:9100/metrics
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import RawArray
+from typing import Dict, Iterable, Sequence
+
+import numpy as np
+
+from sisyphy.utils.timebase import monotonic_ns
+
+# Name, Prometheus type and description of the metrics:
+METRICS = (
+    ("samples_total", "counter", "Samples produced by the stage."),
+    ("drops_total", "counter", "Samples dropped because the output queue was full."),
+    ("rate_hz", "gauge", "Samples per second."),
+    ("interval_p50_s", "gauge", "Median interval between samples."),
+    ("interval_p99_s", "gauge", "99th percentile of the intervals between samples."),
+    ("queue_depth", "gauge", "Items waiting in the input queues of the stage."),
+    ("last_sample_age_s", "gauge", "Time since the last sample."),
+    ("cpu_seconds_total", "counter", "CPU time of the stage loop."),
+)
+_FIELDS = [name for name, _, _ in METRICS]
+# Indices in the rows; the age of the last sample is stored as its time:
+_SAMPLES, _DROPS, _RATE, _P50, _P99, _DEPTH, _LAST_SAMPLE, _CPU = range(len(_FIELDS))
+
+
+class StageMetrics:
+    """Writer of the metrics of a stage, used from inside the stage."""
+
+    def __init__(
+        self,
+        values,
+        row: int,
+        publish_interval_s: float = 0.5,
+        n_intervals: int = 1000,
+    ):
+        self._values = values
+        self._offset = row * len(_FIELDS)
+        self.publish_interval_s = publish_interval_s
+        self._intervals = np.full(n_intervals, np.nan)
+        self._i_interval = 0
+        self._t_last_ns = None
+        self._t_published_ns = None
+        # The row keeps the counts of earlier runs of the stage (e.g. before a restart):
+        self._n_published = values[self._offset + _SAMPLES]
+
+    def count(self, n: int = 1, t_ns: int = None) -> None:
+        """Count `n` new samples."""
+        t_ns = monotonic_ns() if t_ns is None else t_ns
+        o = self._offset
+        self._values[o + _SAMPLES] += n
+        self._values[o + _LAST_SAMPLE] = t_ns
+        if self._t_last_ns is not None:
+            self._intervals[self._i_interval % len(self._intervals)] = (
+                t_ns - self._t_last_ns
+            ) / (n * 1e9)
+            self._i_interval += 1
+        self._t_last_ns = t_ns
+
+    def drop(self, n: int = 1) -> None:
+        """Count `n` dropped samples."""
+        self._values[self._offset + _DROPS] += n
+
+    def maybe_publish(self, queues: Iterable = (), force: bool = False) -> None:
+        """Publish rate, intervals, queue depth and CPU time, if it is time to (or
+        anyway if `force`, e.g. for the final values of a stage that is stopping).
+        """
+        now_ns = monotonic_ns()
+        if self._t_published_ns is None and not force:
+            self._t_published_ns = now_ns
+            return
+        elapsed_s = (now_ns - (self._t_published_ns or now_ns)) * 1e-9
+        if elapsed_s < self.publish_interval_s and not force:
+            return
+
+        o = self._offset
+        n_samples = self._values[o + _SAMPLES]
+        if elapsed_s > 0:
+            self._values[o + _RATE] = (n_samples - self._n_published) / elapsed_s
+        if self._i_interval > 0:
+            p50, p99 = np.nanpercentile(self._intervals, [50, 99])
+            self._values[o + _P50], self._values[o + _P99] = p50, p99
+        self._values[o + _DEPTH] = _queue_depth(queues)
+        self._values[o + _CPU] = time.thread_time()
+        self._t_published_ns, self._n_published = now_ns, n_samples
+
+
+def _queue_depth(queues: Iterable) -> float:
+    depth = np.nan
+    for queue in queues:
+        try:
+            depth = np.nansum([depth, queue.qsize()])
+        except (AttributeError, NotImplementedError):  # not a queue, or macOS
+            pass
+    return depth
+
+
+class MetricsRegistry:
+    """Shared-memory table of the metrics of the stages of a pipeline."""
+
+    def __init__(
+        self,
+        stages: Sequence[str],
+        labels: Dict[str, str] = None,
+        namespace: str = "sisyphy",
+    ):
+        """
+        Parameters
+        ----------
+        stages : list of str
+            Names of the stages.
+        labels : dict
+            Labels added to all the metrics in the Prometheus format (e.g. the rig,
+            to tell apart pipelines running on the same host).
+        namespace : str
+            Prefix of the names of the metrics in the Prometheus format.
+
+        """
+        self.stages = list(stages)
+        self.labels = labels if labels is not None else dict()
+        self.namespace = namespace
+        self._values = RawArray("d", len(self.stages) * len(_FIELDS))
+        for row in range(len(self.stages)):
+            for i in [_RATE, _P50, _P99, _DEPTH, _LAST_SAMPLE]:
+                self._values[row * len(_FIELDS) + i] = np.nan
+
+    def stage(self, name: str, **kwargs) -> StageMetrics:
+        """Writer of the metrics of a stage, to give to the stage (see StageMetrics
+        for the arguments).
+        """
+        return StageMetrics(self._values, self.stages.index(name), **kwargs)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Current metrics of every stage."""
+        now_ns = monotonic_ns()
+        n_fields = len(_FIELDS)
+        snapshot = dict()
+        for row, stage in enumerate(self.stages):
+            values = list(self._values[row * n_fields : (row + 1) * n_fields])
+            values[_LAST_SAMPLE] = (now_ns - values[_LAST_SAMPLE]) * 1e-9
+            snapshot[stage] = dict(zip(_FIELDS, values))
+        return snapshot
+
+    def as_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.snapshot()).T
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, metric_type, description in METRICS:
+            full_name = f"{self.namespace}_{name}"
+            lines.append(f"# HELP {full_name} {description}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for stage, values in snapshot.items():
+                labels = ",".join(
+                    f'{k}="{v}"' for k, v in dict(self.labels, stage=stage).items()
+                )
+                lines.append(f"{full_name}{{{labels}}} {_format_value(values[name])}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9100, host: str = "127.0.0.1") -> "MetricsServer":
+        """Serve the metrics over HTTP from a thread of the current process."""
+        return MetricsServer(self, port=port, host=host)
+
+
+def _format_value(value: float) -> str:
+    if np.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+class MetricsServer:
+    """HTTP endpoint with the metrics of a registry in the Prometheus text format,
+    running in a daemon thread.
+    """
+
+    def __init__(
+        self, registry: MetricsRegistry, port: int = 9100, host: str = "127.0.0.1"
+    ):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # do not print every scrape
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,457 @@
+"""Processes of a pipeline: scheduling of their loops, health monitoring and shutdown.
+
+- `TerminableProcess` calls `loop()` until its kill event is set, either back to
+  back or when woken by queues, events, sockets or periodic deadlines;
+- `WakeableEvent` is an event it can wait for together with queues and sockets;
+- `LoopStats` and `StageMonitor` keep the timing of the iterations and the
+  heartbeat and sample counts of a stage;
+- `stop_processes` and `join_or_kill` stop a pipeline with a shutdown handshake,
+  escalating for processes that do not exit in time.
+"""
+import time
+from dataclasses import dataclass, field
+from multiprocessing import Event, Pipe, Process, RawArray
+from multiprocessing.connection import wait
+from multiprocessing.queues import Queue
+from typing import Sequence
+
+import numpy as np
+
+from sisyphy.utils.custom_queue import DequeQueue
+from sisyphy.utils.metrics import StageMetrics
+from sisyphy.utils.realtime import ProcessTuning, format_report
+from sisyphy.utils.timebase import monotonic_ns
+
+
+class WakeableEvent:
+    """A multiprocessing.Event that a TerminableProcess can wait for together with
+    queues and sockets: setting it also writes to a pipe, that stays readable until
+    the event is cleared.
+    """
+
+    def __init__(self):
+        self._event = Event()
+        self._reader, self._writer = Pipe(duplex=False)
+
+    def set(self) -> None:
+        if not self._event.is_set():
+            self._event.set()
+            self._writer.send_bytes(b"")
+
+    def clear(self) -> None:
+        self._event.clear()
+        while self._reader.poll():
+            self._reader.recv_bytes()
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._event.wait(timeout)
+
+
+class LoopStats:
+    """Timing statistics of the iterations of a TerminableProcess loop.
+
+    Values are kept in shared memory, so they can be read from other processes while
+    the loop is running (without locks, so a reading can mix two iterations).
+    """
+
+    FIELDS = (
+        "n_iterations",
+        "sum_period_s",
+        "sumsq_period_s",
+        "max_period_s",
+        "busy_s",
+        "max_busy_s",
+        "wait_s",
+        "n_overruns",
+    )
+
+    def __init__(self):
+        self._values = RawArray("d", len(self.FIELDS))
+        self._last_start_ns = None
+
+    def record(self, t_start_ns: int, t_end_ns: int, wait_ns: int) -> None:
+        """Record an iteration, with the time spent waiting before it."""
+        v = self._values
+        busy_s = (t_end_ns - t_start_ns) * 1e-9
+        v[0] += 1
+        v[4] += busy_s
+        v[5] = max(v[5], busy_s)
+        v[6] += wait_ns * 1e-9
+        if self._last_start_ns is not None:
+            period_s = (t_start_ns - self._last_start_ns) * 1e-9
+            v[1] += period_s
+            v[2] += period_s * period_s
+            v[3] = max(v[3], period_s)
+        self._last_start_ns = t_start_ns
+
+    def add_overruns(self, n: int) -> None:
+        self._values[7] += n
+
+    @property
+    def n_iterations(self) -> int:
+        return int(self._values[0])
+
+    @property
+    def n_overruns(self) -> int:
+        return int(self._values[7])
+
+    @property
+    def mean_period_s(self) -> float:
+        n = self._values[0] - 1
+        return self._values[1] / n if n > 0 else np.nan
+
+    @property
+    def std_period_s(self) -> float:
+        n = self._values[0] - 1
+        if n < 2:
+            return np.nan
+        mean = self._values[1] / n
+        return np.sqrt(max(self._values[2] / n - mean * mean, 0.0))
+
+    @property
+    def max_period_s(self) -> float:
+        return self._values[3]
+
+    @property
+    def mean_busy_s(self) -> float:
+        n = self._values[0]
+        return self._values[4] / n if n > 0 else np.nan
+
+    @property
+    def duty_cycle(self) -> float:
+        """Fraction of the time spent in the loop rather than waiting."""
+        total = self._values[4] + self._values[6]
+        return self._values[4] / total if total > 0 else np.nan
+
+    def summary(self) -> dict:
+        return dict(
+            n_iterations=self.n_iterations,
+            mean_period_s=self.mean_period_s,
+            std_period_s=self.std_period_s,
+            max_period_s=self.max_period_s,
+            mean_busy_s=self.mean_busy_s,
+            max_busy_s=self._values[5],
+            duty_cycle=self.duty_cycle,
+            n_overruns=self.n_overruns,
+        )
+
+    def __repr__(self):
+        values = ", ".join(f"{k}={v:.4g}" for k, v in self.summary().items())
+        return f"LoopStats({values})"
+
+
+class StageMonitor:
+    """Heartbeat and sample counter of a process, in shared memory, to check from
+    other processes that it is running and producing data.
+    """
+
+    def __init__(self, metrics: StageMetrics = None):
+        # heartbeat, n samples, time of last sample, n dropped samples:
+        self._values = RawArray("q", 4)
+        self.metrics = metrics  # also count samples in a MetricsRegistry, if given
+        self.beat()
+
+    def beat(self) -> None:
+        self._values[0] = monotonic_ns()
+
+    def count(self, n: int = 1) -> None:
+        """Count produced samples."""
+        t_ns = monotonic_ns()
+        self._values[1] += n
+        self._values[2] = t_ns
+        if self.metrics is not None:
+            self.metrics.count(n, t_ns)
+
+    def drop(self, n: int = 1) -> None:
+        """Count samples dropped because the output queue was full."""
+        self._values[3] += n
+        if self.metrics is not None:
+            self.metrics.drop(n)
+
+    @property
+    def heartbeat_ns(self) -> int:
+        return self._values[0]
+
+    @property
+    def n_samples(self) -> int:
+        return self._values[1]
+
+    @property
+    def last_sample_ns(self) -> int:
+        return self._values[2]
+
+    @property
+    def n_dropped(self) -> int:
+        return self._values[3]
+
+
+def _waitable(source):
+    """Object to pass to `multiprocessing.connection.wait` for a wake source (None for
+    sources that can only be polled).
+    """
+    if isinstance(source, (WakeableEvent, Queue, DequeQueue)):
+        return source._reader
+    if hasattr(source, "fileno"):  # sockets and connections
+        return source
+    if hasattr(source, "is_set"):
+        return None
+    raise TypeError(f"{source} cannot be used as wake source.")
+
+
+class TerminableProcess(Process):
+    """A process calling `loop()` until `kill_event` is set.
+
+    By default `loop()` is called back to back. If wake sources or a rate are given,
+    the process instead blocks (with a single wait) until one of the sources is ready:
+
+    - a queue has data to read;
+    - a WakeableEvent is set (plain multiprocessing events are polled every
+      `max_wait_s`);
+    - a socket or a connection is readable;
+    - the next periodic deadline, at `rate_hz`, is reached. Deadlines are fixed
+      multiples of the period, so that errors of the wake-up times do not accumulate;
+      missed deadlines are skipped and counted as overruns.
+
+    Ready sources are level-triggered: they wake the process until they are read (or
+    cleared). The sources that caused the current iteration are in `self.woken_by`
+    ("deadline" for the periodic one), and timing statistics of the iterations in
+    `self.loop_stats`.
+
+    The loop can also be ended from inside the process with `request_stop()` (e.g.
+    when an input stream has ended). `done_event` is set once `after_loop()` has
+    returned, to acknowledge that the process has flushed its outputs.
+
+    `monitor` has a heartbeat, updated at every iteration and wake-up, and a sample
+    counter, that subclasses update with `self.monitor.count()`.
+    """
+
+    def __init__(
+        self,
+        kill_event: Event = None,
+        *args,
+        wake_sources: Sequence = (),
+        rate_hz: float = None,
+        max_wait_s: float = 0.05,
+        tuning: ProcessTuning = None,
+        metrics: StageMetrics = None,
+        **kwargs,
+    ):
+        """
+        Parameters
+        ----------
+        kill_event : Event
+            Termination event; a WakeableEvent (the default) also stops a waiting
+            process immediately.
+        wake_sources : list
+            Queues, events, sockets or connections that wake the process.
+        rate_hz : float
+            Rate of the periodic wake-up, if any.
+        max_wait_s : float
+            Maximum time between two checks of the kill event and of polled events.
+        tuning : ProcessTuning
+            CPU affinity, priority, memory locking and GC settings, applied (and
+            reported) at the beginning of `run()`.
+        metrics : StageMetrics
+            Row of a MetricsRegistry where the stage publishes its health metrics
+            (samples counted with `monitor`, depth of the wake source queues).
+
+        """
+        self.kill_event = kill_event if kill_event is not None else WakeableEvent()
+        self.wake_sources = []
+        self.rate_hz = rate_hz
+        self.max_wait_s = max_wait_s
+        self.tuning = tuning
+        self.loop_stats = LoopStats()
+        self.woken_by = []
+        self.done_event = Event()
+        self.metrics = metrics
+        self.monitor = StageMonitor(metrics)
+        self._stop_requested = False
+        for source in wake_sources:
+            self.add_wake_source(source)
+        super(TerminableProcess, self).__init__(*args, **kwargs)
+
+    def add_wake_source(self, source) -> None:
+        """Add a wake source (before starting the process)."""
+        _waitable(source)  # check the type early
+        self.wake_sources.append(source)
+
+    def request_stop(self) -> None:
+        """End the loop after the current iteration (from inside the process)."""
+        self._stop_requested = True
+
+    @property
+    def scheduled(self) -> bool:
+        return len(self.wake_sources) > 0 or self.rate_hz is not None
+
+    def _setup_wait(self) -> None:
+        self._waitables = dict()
+        self._polled = []
+        for source in self.wake_sources:
+            waitable = _waitable(source)
+            if waitable is None:
+                self._polled.append(source)
+            else:
+                self._waitables[waitable] = source
+        self._armed = [s for s in self.wake_sources if isinstance(s, DequeQueue)]
+        kill_waitable = _waitable(self.kill_event)
+        if kill_waitable is not None:
+            self._waitables.setdefault(kill_waitable, self.kill_event)
+
+        self._period_ns = None
+        if self.rate_hz is not None:
+            self._period_ns = int(1e9 / self.rate_hz)
+            self._next_deadline_ns = monotonic_ns()
+
+    def wait_for_wake(self) -> list:
+        """Block until a wake source is ready, or at most `max_wait_s`.
+
+        Returns
+        -------
+        list
+            Ready sources, empty if none.
+
+        """
+        timeout = self.max_wait_s
+        if self._period_ns is not None:
+            remaining_s = (self._next_deadline_ns - monotonic_ns()) * 1e-9
+            timeout = min(timeout, max(remaining_s, 0.0))
+
+        # In-process queues only write their pipe for a waiting consumer:
+        if any(source.arm() for source in self._armed):
+            timeout = 0
+        if self._waitables:
+            ready = [self._waitables[w] for w in wait(list(self._waitables), timeout)]
+            for source in self._armed:
+                source.disarm()
+                if source not in ready and not source.empty():
+                    ready.append(source)
+        else:
+            time.sleep(timeout)
+            ready = []
+        ready += [e for e in self._polled if e.is_set()]
+
+        if self._period_ns is not None:
+            late_ns = monotonic_ns() - self._next_deadline_ns
+            if late_ns >= 0:
+                n_missed = late_ns // self._period_ns
+                self.loop_stats.add_overruns(n_missed)
+                self._next_deadline_ns += (n_missed + 1) * self._period_ns
+                ready.append("deadline")
+        return ready
+
+    def run(self) -> None:
+        if self.tuning is not None:
+            print(f"{self.name} tuning: {format_report(self.tuning.apply())}")
+        self.before_loop()
+        self._setup_wait()
+
+        t_wait_ns = monotonic_ns()
+        while not (self._stop_requested or self.kill_event.is_set()):
+            self.monitor.beat()
+            if self.metrics is not None:
+                self.metrics.maybe_publish(self.wake_sources)
+            if self.scheduled:
+                self.woken_by = self.wait_for_wake()
+                if len(self.woken_by) == 0 or self.kill_event.is_set():
+                    continue
+            t_start_ns = monotonic_ns()
+            self.loop()
+            t_end_ns = monotonic_ns()
+            self.loop_stats.record(t_start_ns, t_end_ns, t_start_ns - t_wait_ns)
+            t_wait_ns = t_end_ns
+
+        self.after_loop()
+        if self.metrics is not None:
+            self.metrics.maybe_publish(self.wake_sources, force=True)
+        self.done_event.set()
+
+    def before_loop(self) -> None:
+        pass
+
+    def loop(self) -> None:
+        pass
+
+    def after_loop(self) -> None:
+        pass
+
+
+def join_or_kill(process: Process, timeout_s: float, grace_s: float = 1.0) -> str:
+    """Join a process, escalating to terminate() and then to kill() if it does not
+    exit in time.
+
+    Returns
+    -------
+    str
+        How the process ended: "joined", "terminated", "killed" or "not started"
+        ("left running" for stages run as threads, that cannot be killed).
+
+    """
+    if process.pid is None:
+        return "not started"
+    process.join(timeout_s)
+    if not process.is_alive():
+        return "joined"
+    process.terminate()
+    process.join(grace_s)
+    if not process.is_alive():
+        return "terminated"
+    process.kill()
+    process.join(grace_s)
+    return "killed" if not process.is_alive() else "left running"
+
+
+@dataclass
+class ShutdownReport:
+    """Outcome of the shutdown of a group of processes."""
+
+    stop_time_s: float = 0.0  # from the stop request to the exit of all processes
+    ack_times_s: dict = field(default_factory=dict)  # per process, None if missing
+    outcomes: dict = field(default_factory=dict)  # per process, see join_or_kill
+
+    @property
+    def clean(self) -> bool:
+        """True if all processes acknowledged the stop and exited by themselves."""
+        return all(t is not None for t in self.ack_times_s.values()) and all(
+            o == "joined" for o in self.outcomes.values()
+        )
+
+
+def stop_processes(
+    processes: Sequence[Process], kill_event=None, timeout_s: float = 5.0
+) -> ShutdownReport:
+    """Set the kill event of a pipeline of processes, wait for the acknowledgement
+    (`done_event`) of each one within an overall timeout, and join them, escalating
+    for those that do not exit in time.
+
+    Processes should be given from the source to the sink, so that every stage can
+    flush what it received from the previous one. If `kill_event` is None, the
+    `kill_event` of each process is set.
+    """
+    report = ShutdownReport()
+    t_stop_ns = monotonic_ns()
+    deadline_ns = t_stop_ns + int(timeout_s * 1e9)
+    if kill_event is not None:
+        kill_event.set()
+    else:
+        for process in processes:
+            process.kill_event.set()
+
+    def remaining_s():
+        return max((deadline_ns - monotonic_ns()) * 1e-9, 0.0)
+
+    for process in processes:
+        done_event = getattr(process, "done_event", None)
+        if done_event is not None and process.pid is not None:
+            acknowledged = done_event.wait(remaining_s())
+            report.ack_times_s[process.name] = (
+                (monotonic_ns() - t_stop_ns) * 1e-9 if acknowledged else None
+            )
+    for process in processes:
+        report.outcomes[process.name] = join_or_kill(process, remaining_s())
+
+    report.stop_time_s = (monotonic_ns() - t_stop_ns) * 1e-9
+    return report
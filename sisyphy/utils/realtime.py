@@ -0,0 +1,134 @@
+"""Settings to reduce the timing jitter of acquisition processes.
+
+A `ProcessTuning` is applied from inside a process (e.g. at the beginning of
+`TerminableProcess.run`), and can set:
+
+- CPU affinity, to keep a process on dedicated cores;
+- nice level or real-time scheduling (SCHED_FIFO, on Linux when permitted);
+- locking of the process memory in RAM (mlockall, on Linux and macOS);
+- garbage collection mode: "freeze" moves all the objects existing before the
+  acquisition out of the collector (so collections are shorter), "disable" stops
+  automatic collections altogether.
+
+Every setting falls back gracefully when it is not supported or not permitted,
+and the outcome is reported as a dictionary.
+
+Note that a process with real-time priority that busy-waits (like the mock reader)
+can starve its own threads, such as queue feeders, if it is bound to a single core.
+See benchmarks/reader_jitter.py to measure the effect of the settings.
+"""
+import ctypes
+import ctypes.util
+import gc
+import os
+import sys
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MCL_CURRENT, MCL_FUTURE = 1, 2  # from sys/mman.h
+
+
+@dataclass
+class ProcessTuning:
+    """Per-process settings for CPU affinity, priority, memory locking and GC."""
+
+    cpus: Optional[Sequence[int]] = None  # cores to run on
+    nice: Optional[int] = None  # nice level (lower is higher priority)
+    realtime_priority: Optional[int] = None  # SCHED_FIFO priority (1-99)
+    lock_memory: bool = False  # mlockall current and future memory
+    gc_mode: Optional[str] = None  # None, "freeze" or "disable"
+
+    def apply(self) -> dict:
+        """Apply the settings to the current process.
+
+        Returns
+        -------
+        dict
+            Outcome of every requested setting.
+
+        """
+        report = dict()
+        if self.cpus is not None:
+            report["cpus"] = _try(_set_affinity, list(self.cpus))
+        if self.realtime_priority is not None:
+            report["realtime_priority"] = _try(_set_realtime, self.realtime_priority)
+        if self.nice is not None:
+            report["nice"] = _try(_set_nice, self.nice)
+        if self.lock_memory:
+            report["lock_memory"] = _try(_lock_memory)
+        if self.gc_mode is not None:
+            report["gc_mode"] = _try(_set_gc_mode, self.gc_mode)
+        return report
+
+
+def format_report(report: dict) -> str:
+    return ", ".join(f"{k}: {v}" for k, v in report.items()) if report else "no tuning"
+
+
+def _try(function, *args) -> str:
+    try:
+        return function(*args)
+    except (OSError, AttributeError, NotImplementedError, ValueError) as e:
+        return f"not applied ({type(e).__name__}: {e})"
+
+
+def _set_affinity(cpus) -> str:
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    elif psutil is not None:
+        psutil.Process().cpu_affinity(cpus)
+    else:
+        raise NotImplementedError("requires Linux or psutil")
+    return f"applied {cpus}"
+
+
+def _set_realtime(priority) -> str:
+    if not hasattr(os, "sched_setscheduler"):
+        raise NotImplementedError("SCHED_FIFO requires Linux")
+    os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    return f"applied SCHED_FIFO {priority}"
+
+
+def _set_nice(nice) -> str:
+    if hasattr(os, "setpriority"):
+        os.setpriority(os.PRIO_PROCESS, 0, nice)
+    elif psutil is not None and sys.platform == "win32":
+        # Map nice levels to the Windows priority classes:
+        if nice <= -15:
+            priority_class = psutil.REALTIME_PRIORITY_CLASS
+        elif nice <= -5:
+            priority_class = psutil.HIGH_PRIORITY_CLASS
+        elif nice < 0:
+            priority_class = psutil.ABOVE_NORMAL_PRIORITY_CLASS
+        else:
+            priority_class = psutil.NORMAL_PRIORITY_CLASS
+        psutil.Process().nice(priority_class)
+    else:
+        raise NotImplementedError("requires Unix or psutil")
+    return f"applied {nice}"
+
+
+def _lock_memory() -> str:
+    if sys.platform == "win32":
+        raise NotImplementedError("mlockall is not available on Windows")
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return "applied"
+
+
+def _set_gc_mode(mode) -> str:
+    gc.collect()
+    if mode == "freeze":
+        gc.freeze()
+    elif mode == "disable":
+        gc.disable()
+    else:
+        raise ValueError(f"unknown GC mode {mode}")
+    return f"applied {mode}"
@@ -0,0 +1,207 @@
+"""Ring buffer of timestamped samples in shared memory, for live displays.
+
+A `ColumnarRingBuffer` keeps the last `capacity` samples as one int64 array of
+timestamps and one float64 array per column, preallocated in shared memory
+(RawArray), so that a process can write samples and others can read them without
+any queue or copy in between:
+
+- writing a batch is at most two slice assignments per column;
+- the start of a time window is found with a binary search on the timestamps;
+- a window is at most two contiguous segments of the arrays (before and after the
+  wrap-around), returned as views.
+
+There is a single writer. Readers never lock it: as in a seqlock, the writer
+announces how many samples will have been written before it overwrites any slot,
+and publishes the samples once written, so that readers can check, after reading,
+that the samples they read were not (being) overwritten in the meantime (see
+`window`).
+"""
+from multiprocessing import RawArray, RawValue
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+class ColumnarRingBuffer:
+    """Preallocated, shared ring buffer of timestamps and float columns."""
+
+    def __init__(self, columns: Sequence[str], capacity: int = 100000):
+        """
+        Parameters
+        ----------
+        columns : list of str
+            Names of the columns (e.g. fields of the sampled dataclass).
+        capacity : int
+            Number of samples kept.
+
+        """
+        self.columns = list(columns)
+        self.capacity = int(capacity)
+        self._raw_times = RawArray("q", self.capacity)
+        self._raw_values = RawArray("d", self.capacity * len(self.columns))
+        self._n_written = RawValue("q", 0)  # total number of samples ever written
+        self._n_writing = RawValue("q", 0)  # the same, once the current write ends
+        self._make_views()
+
+    def _make_views(self) -> None:
+        self.times = np.frombuffer(self._raw_times, dtype=np.int64)
+        # One contiguous array per column, so that column segments are contiguous:
+        self.values = np.frombuffer(self._raw_values, dtype=np.float64).reshape(
+            len(self.columns), self.capacity
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["times"], state["values"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_views()
+
+    @property
+    def n_written(self) -> int:
+        return self._n_written.value
+
+    def __len__(self) -> int:
+        return min(self.n_written, self.capacity)
+
+    def extend(self, times: np.ndarray, values: np.ndarray) -> None:
+        """Write a batch of samples.
+
+        Parameters
+        ----------
+        times : (n,) array
+            Timestamps (ns), increasing.
+        values : (n_columns, n) array
+            Values of the columns.
+
+        """
+        times = np.asarray(times)[-self.capacity :]
+        values = np.asarray(values)[:, -self.capacity :]
+        n = len(times)
+        if n == 0:
+            return
+        start = self.n_written % self.capacity
+        n_first = min(n, self.capacity - start)
+        # Announce the write before overwriting the oldest samples:
+        self._n_writing.value = self.n_written + n
+        self.times[start : start + n_first] = times[:n_first]
+        self.values[:, start : start + n_first] = values[:, :n_first]
+        if n_first < n:
+            self.times[: n - n_first] = times[n_first:]
+            self.values[:, : n - n_first] = values[:, n_first:]
+        # Publish the samples only once they are written:
+        self._n_written.value += n
+
+    def append(self, t_ns: int, values: Sequence[float]) -> None:
+        """Write a single sample (cheaper than `extend` for one sample at a time)."""
+        i = self.n_written % self.capacity
+        self._n_writing.value = self.n_written + 1
+        self.times[i] = t_ns
+        self.values[:, i] = values
+        self._n_written.value += 1
+
+    def extend_from(self, samples: Iterable) -> None:
+        """Write a batch of objects with a t_ns attribute and one attribute per column
+        (missing attributes are written as NaN).
+        """
+        samples = list(samples)
+        if len(samples) == 0:
+            return
+        self.extend(
+            np.array([s.t_ns for s in samples], dtype=np.int64),
+            np.array(
+                [[getattr(s, c, np.nan) for s in samples] for c in self.columns],
+                dtype=np.float64,
+            ),
+        )
+
+    def _segments(self, n_written: int, first: int) -> List[slice]:
+        """Slices of the arrays with the samples from the absolute index `first` to
+        `n_written`, oldest first.
+        """
+        start, stop = first % self.capacity, n_written % self.capacity
+        if n_written - first == 0:
+            return []
+        if start < stop:
+            return [slice(start, stop)]
+        segments = [slice(start, self.capacity)]
+        if stop > 0:
+            segments.append(slice(0, stop))
+        return segments
+
+    def _first_after(self, n_written: int, t_from_ns: int) -> int:
+        """Absolute index of the first sample at or after `t_from_ns`."""
+        oldest = max(n_written - self.capacity, 0)
+        for segment in self._segments(n_written, oldest):
+            segment_times = self.times[segment]
+            if segment_times[-1] >= t_from_ns:
+                return oldest + int(np.searchsorted(segment_times, t_from_ns))
+            oldest += len(segment_times)
+        return n_written
+
+    def segments(
+        self, t_from_ns: int = None
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Views of the samples from `t_from_ns` (all if None) as at most two
+        contiguous segments, without copies. The views are overwritten when the buffer
+        wraps around, use `window` to get a consistent copy.
+
+        Returns
+        -------
+        tuple
+            Lists of (n,) time segments, and of (n_columns, n) value segments.
+
+        """
+        n_written = self.n_written
+        first = max(n_written - self.capacity, 0)
+        if t_from_ns is not None:
+            first = self._first_after(n_written, t_from_ns)
+        slices = self._segments(n_written, first)
+        return [self.times[s] for s in slices], [self.values[:, s] for s in slices]
+
+    def window(
+        self, t_from_ns: int = None, retries: int = 3
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy of the samples from `t_from_ns` (all if None).
+
+        If the writer overwrote some of the samples while they were copied, they are
+        read again (or, after `retries` attempts, dropped).
+
+        Returns
+        -------
+        tuple
+            (n,) array of times and (n_columns, n) array of values.
+
+        """
+        if t_from_ns is None:
+            return self.read_from(0, retries)
+        return self._read(lambda n: self._first_after(n, t_from_ns), retries)
+
+    def read_from(self, index: int, retries: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy of the samples from the absolute index `index` (counting all the
+        samples ever written), or from the oldest one kept; see `window`.
+        """
+        return self._read(lambda n: max(index, n - self.capacity, 0), retries)
+
+    def _read(self, first_of, retries: int) -> Tuple[np.ndarray, np.ndarray]:
+        for _ in range(retries + 1):
+            n_written = self.n_written
+            first = first_of(n_written)
+            slices = self._segments(n_written, first) or [slice(0, 0)]
+            times = np.concatenate([self.times[s] for s in slices])
+            values = np.concatenate([self.values[:, s] for s in slices], axis=1)
+            # Samples that could have been overwritten while copying, including by
+            # a write still in progress:
+            n_overwritten = self._n_writing.value - self.capacity - first
+            if n_overwritten <= 0:
+                break
+        else:
+            times, values = times[n_overwritten:], values[:, n_overwritten:]
+        return times, values
+
+    def count_since(self, t_from_ns: int) -> int:
+        """Number of samples kept from `t_from_ns`."""
+        n_written = self.n_written
+        return n_written - self._first_after(n_written, t_from_ns)
@@ -0,0 +1,174 @@
+"""Shared timebase for all the timestamps produced by sisyphy.
+
+Samples are stamped with a monotonic, high-resolution clock (`monotonic_ns`), which
+is not affected by NTP or OS time synchronization jumps. To be able to go back to
+absolute (wall-clock) time, (monotonic, wall) anchor pairs are periodically recorded
+and saved together with the data of every session; `mono_to_wall` and `wall_to_mono`
+use them to convert between the two clocks.
+"""
+import platform
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+
+# time.perf_counter_ns is the highest resolution monotonic clock available on all
+# platforms (QueryPerformanceCounter on Windows, CLOCK_MONOTONIC on Linux,
+# mach_absolute_time on macOS), and it is system-wide, so timestamps taken in
+# different processes can be compared. time.monotonic_ns on Windows has a ~15 ms
+# resolution, so it is not used here.
+monotonic_ns = time.perf_counter_ns
+wall_ns = time.time_ns
+
+ANCHOR_PERIOD_S = 10.0  # default interval between recorded anchors
+
+
+@dataclass
+class ClockAnchor:
+    """Pair of simultaneous readings of the monotonic and the wall clock."""
+
+    mono_ns: int
+    wall_ns: int
+    uncertainty_ns: int  # duration of the monotonic bracket around the wall read
+
+
+def take_anchor(n_tries: int = 5) -> ClockAnchor:
+    """Read the wall clock between two monotonic reads, keeping the tightest bracket
+    over `n_tries` attempts. The monotonic time of the anchor is the bracket center.
+    """
+    best = None
+    for _ in range(n_tries):
+        t0 = monotonic_ns()
+        w = wall_ns()
+        t1 = monotonic_ns()
+        if best is None or (t1 - t0) < best.uncertainty_ns:
+            best = ClockAnchor(mono_ns=(t0 + t1) // 2, wall_ns=w, uncertainty_ns=t1 - t0)
+    return best
+
+
+class AnchorRecorder:
+    """Collects clock anchors over a session, at most one every `period_s` seconds.
+
+    Call `maybe_record` from inside an acquisition loop - it costs a single clock read
+    when no anchor is due - and `save` at the end of the session.
+    """
+
+    def __init__(self, period_s: float = ANCHOR_PERIOD_S):
+        self.period_ns = int(period_s * 1e9)
+        self.anchors: List[ClockAnchor] = []
+        self._next_ns = 0
+
+    def record(self) -> ClockAnchor:
+        anchor = take_anchor()
+        self.anchors.append(anchor)
+        self._next_ns = anchor.mono_ns + self.period_ns
+        return anchor
+
+    def maybe_record(self) -> None:
+        if monotonic_ns() >= self._next_ns:
+            self.record()
+
+    def save(self, filename: Union[str, Path]) -> None:
+        """Save anchors to a csv file with mono_ns, wall_ns, uncertainty_ns columns."""
+        save_anchors(self.anchors, filename)
+
+
+def save_anchors(anchors: List[ClockAnchor], filename: Union[str, Path]) -> None:
+    with open(filename, "w") as f:
+        f.write("mono_ns,wall_ns,uncertainty_ns\n")
+        for a in anchors:
+            f.write(f"{a.mono_ns},{a.wall_ns},{a.uncertainty_ns}\n")
+
+
+def load_anchors(filename: Union[str, Path]) -> List[ClockAnchor]:
+    values = np.loadtxt(filename, delimiter=",", skiprows=1, dtype=np.int64, ndmin=2)
+    return [ClockAnchor(*(int(v) for v in row)) for row in values]
+
+
+def _anchor_arrays(anchors):
+    if len(anchors) == 0:
+        raise ValueError("At least one clock anchor is required for conversion.")
+    mono = np.array([a.mono_ns for a in anchors], dtype=np.int64)
+    offsets = np.array([a.wall_ns - a.mono_ns for a in anchors], dtype=np.int64)
+    order = np.argsort(mono)
+    return mono[order], offsets[order]
+
+
+def _convert(t_ns, ref_ns, offsets, sign):
+    t_ns = np.asarray(t_ns, dtype=np.int64)
+    # Work on differences from the first anchor so that float interpolation
+    # does not lose nanosecond precision on large absolute times:
+    ref0, off0 = ref_ns[0], offsets[0]
+    delta_offset = np.interp(
+        (t_ns - ref0).astype(np.float64),
+        (ref_ns - ref0).astype(np.float64),
+        (offsets - off0).astype(np.float64),
+    )
+    converted = t_ns + sign * (off0 + np.round(delta_offset).astype(np.int64))
+    return converted if converted.ndim > 0 else int(converted)
+
+
+def mono_to_wall(mono_ns, anchors: List[ClockAnchor]):
+    """Convert monotonic timestamps (scalar or array, ns) to wall-clock ns.
+
+    The clock offset is interpolated linearly between anchors, and kept constant
+    before the first and after the last anchor.
+    """
+    mono, offsets = _anchor_arrays(anchors)
+    return _convert(mono_ns, mono, offsets, 1)
+
+
+def wall_to_mono(wall_ns, anchors: List[ClockAnchor]):
+    """Convert wall-clock timestamps (scalar or array, ns) to monotonic ns."""
+    mono, offsets = _anchor_arrays(anchors)
+    return _convert(wall_ns, mono + offsets, offsets, -1)
+
+
+@dataclass
+class ClockBenchmark:
+    name: str
+    cost_ns: float  # average cost of a single call
+    measured_resolution_ns: int  # smallest non-zero difference between reads
+    reported_resolution_ns: float
+    monotonic: bool
+    implementation: str = field(default="")
+
+
+def benchmark_clocks(n_reads: int = 100000) -> List[ClockBenchmark]:
+    """Measure call cost and effective resolution of the available clocks."""
+    results = []
+    for name in ["time_ns", "monotonic_ns", "perf_counter_ns"]:
+        clock = getattr(time, name)
+        info = time.get_clock_info(name.replace("_ns", ""))
+
+        t0 = time.perf_counter_ns()
+        for _ in range(n_reads):
+            clock()
+        cost = (time.perf_counter_ns() - t0) / n_reads
+
+        reads = np.array([clock() for _ in range(n_reads)], dtype=np.int64)
+        steps = np.diff(reads)
+        steps = steps[steps > 0]
+        results.append(
+            ClockBenchmark(
+                name=name,
+                cost_ns=cost,
+                measured_resolution_ns=int(steps.min()) if len(steps) > 0 else -1,
+                reported_resolution_ns=info.resolution * 1e9,
+                monotonic=info.monotonic,
+                implementation=info.implementation,
+            )
+        )
+    return results
+
+
+if __name__ == "__main__":
+    print(f"Platform: {platform.platform()}, Python {platform.python_version()}")
+    for res in benchmark_clocks():
+        print(
+            f"{res.name:>16}: {res.cost_ns:7.1f} ns/call, resolution "
+            f"{res.measured_resolution_ns} ns measured / {res.reported_resolution_ns:g} ns "
+            f"reported, monotonic={res.monotonic} ({res.implementation})"
+        )
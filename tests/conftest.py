@@ -0,0 +1,120 @@
+import struct
+
+import numpy as np
+import pytest
+
+@pytest.fixture(autouse=True)
+def analysis_cache_dir(tmp_path, monkeypatch):
+    """Keep the analysis cache of each test in its temporary directory."""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("SISYPHY_CACHE_DIR", str(cache_dir))
+    return cache_dir
+
+
+RHD_SIGNAL_TYPES = dict(
+    amplifier=0, aux_input=1, supply_voltage=2, board_adc=3, board_dig_in=4, board_dig_out=5
+)
+
+
+def _qstring(string):
+    encoded = string.encode("utf-16-le")
+    return struct.pack("<I", len(encoded)) + encoded
+
+
+def write_rhd(
+    path,
+    n_blocks=10,
+    n_amplifier=4,
+    n_aux_input=3,
+    n_supply_voltage=1,
+    n_temp_sensor=0,
+    n_board_adc=2,
+    dig_in_orders=(0, 3),
+    dig_out_orders=(1,),
+    version=(3, 0),
+    sample_rate=20000.0,
+    eval_board_mode=0,
+    first_timestamp=0,
+    dig_in_words=None,
+    seed=0,
+):
+    """Write a synthetic Intan .rhd file with random data.
+
+    If given, `dig_in_words` (one uint16 word per sample) are written as digital
+    inputs instead of random values.
+
+    Returns
+    -------
+    dict
+        Raw values of all the signals as (n_channels, n_samples) uint16 arrays
+        (plain arrays for timestamps and digital words).
+
+    """
+    rng = np.random.default_rng(seed)
+    n_per_block = 128 if version[0] > 1 else 60
+    n = n_blocks * n_per_block
+    raw = dict(
+        timestamps=np.arange(first_timestamp, first_timestamp + n, dtype=np.int32),
+        amplifier=rng.integers(0, 2 ** 16, (n_amplifier, n), dtype=np.uint16),
+        aux_input=rng.integers(0, 2 ** 16, (n_aux_input, n // 4), dtype=np.uint16),
+        supply_voltage=rng.integers(0, 2 ** 16, (n_supply_voltage, n_blocks), dtype=np.uint16),
+        temp_sensor=rng.integers(0, 2 ** 16, (n_temp_sensor, n_blocks), dtype=np.uint16),
+        board_adc=rng.integers(0, 2 ** 16, (n_board_adc, n), dtype=np.uint16),
+        board_dig_in=rng.integers(0, 2 ** 16, n, dtype=np.uint16)
+        if len(dig_in_orders)
+        else np.zeros(0, dtype=np.uint16),
+        board_dig_out=rng.integers(0, 2 ** 16, n, dtype=np.uint16)
+        if len(dig_out_orders)
+        else np.zeros(0, dtype=np.uint16),
+    )
+    if dig_in_words is not None:
+        raw["board_dig_in"] = np.asarray(dig_in_words, dtype=np.uint16)
+
+    header = struct.pack("<I", 0xC6912702) + struct.pack("<hh", *version)
+    header += struct.pack("<f", sample_rate)
+    header += struct.pack("<hffffff", 0, 1.0, 0.1, 7500.0, 1.0, 0.1, 7500.0)
+    header += struct.pack("<h", 0) + struct.pack("<ff", 1000.0, 1000.0)
+    header += _qstring("") + _qstring("note") + _qstring("")
+    if version >= (1, 1):
+        header += struct.pack("<h", n_temp_sensor)
+    if version >= (1, 3):
+        header += struct.pack("<h", eval_board_mode)
+    if version[0] > 1:
+        header += _qstring("Hardware")
+
+    channel_orders = dict(
+        amplifier=range(n_amplifier),
+        aux_input=range(n_aux_input),
+        supply_voltage=range(n_supply_voltage),
+        board_adc=range(n_board_adc),
+        board_dig_in=dig_in_orders,
+        board_dig_out=dig_out_orders,
+    )
+    header += struct.pack("<h", len(channel_orders))
+    for name, orders in channel_orders.items():
+        header += _qstring(name) + _qstring(name[:3].upper())
+        header += struct.pack("<hhh", 1, len(orders), n_amplifier if name == "amplifier" else 0)
+        for order in orders:
+            header += _qstring(f"{name}-{order}") + _qstring(f"{name}-{order}")
+            header += struct.pack("<hhhhhh", order, order, RHD_SIGNAL_TYPES[name], 1, order, 0)
+            header += struct.pack("<hhhh", 0, 0, 0, 0) + struct.pack("<ff", 0.0, 0.0)
+
+    with open(path, "wb") as f:
+        f.write(header)
+        for b in range(n_blocks):
+            samples = slice(b * n_per_block, (b + 1) * n_per_block)
+            f.write(raw["timestamps"][samples].tobytes())
+            f.write(raw["amplifier"][:, samples].tobytes())
+            f.write(raw["aux_input"][:, b * n_per_block // 4 : (b + 1) * n_per_block // 4].tobytes())
+            f.write(raw["supply_voltage"][:, b].tobytes())
+            f.write(raw["temp_sensor"][:, b].tobytes())
+            f.write(raw["board_adc"][:, samples].tobytes())
+            f.write(raw["board_dig_in"][samples].tobytes())
+            f.write(raw["board_dig_out"][samples].tobytes())
+    return raw
+
+
+@pytest.fixture
+def rhd_writer():
+    """Function to write synthetic .rhd files, see `write_rhd`."""
+    return write_rhd
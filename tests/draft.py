@@ -1,6 +1,7 @@
 from multiprocessing import Event
 
-from sisyphy.process_logger import LoggingProcess, TerminableProcess
+from sisyphy.process_logger import LoggingProcess
+from sisyphy.utils.process import TerminableProcess
 
 
 class ReceivingProcess(LoggingProcess, TerminableProcess):
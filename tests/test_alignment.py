@@ -0,0 +1,60 @@
+import time
+
+import numpy as np
+
+from sisyphy.barcode_synch.analysis.alignment import (
+    ClockModel,
+    align_barcodes,
+    match_barcodes,
+)
+
+FS = 20000
+
+
+def _drifting_clocks(n_barcodes=2000, jitter_s=0.0005, seed=0):
+    """Host ns timestamps and ephys sample indexes of barcodes every 5 s, with the
+    ephys clock drift changing halfway through the session."""
+    rng = np.random.default_rng(seed)
+    t_true = np.arange(n_barcodes) * 5.0
+    drift = np.where(t_true < t_true[n_barcodes // 2], 30e-6, -20e-6)
+    t_ephys = np.cumsum(np.r_[0, np.diff(t_true) * (1 + drift[1:])])
+    host_ns = (1.7e18 + (t_true + rng.normal(0, jitter_s, n_barcodes)) * 1e9).astype(np.int64)
+    return host_ns, 12345 + t_ephys * FS
+
+
+def test_match_barcodes():
+    times_a, times_b, codes = match_barcodes(
+        [5, 3, 9, 9, 1], [50, 30, 90, 91, 10], [1, 9, 3, 7], [0.1, 0.9, 0.3, 0.7]
+    )
+    assert codes.tolist() == [1, 3]
+    assert times_a.tolist() == [10, 30]
+    assert times_b.tolist() == [0.1, 0.3]
+
+
+def test_clock_model_fit():
+    host_ns, ephys_idx = _drifting_clocks()
+    codes = np.arange(len(host_ns))
+    # corrupt some barcodes on the host side:
+    host_ns_corrupted = host_ns.copy()
+    host_ns_corrupted[::97] += 10 ** 8
+
+    model = align_barcodes(codes, host_ns_corrupted, codes[::-1], ephys_idx[::-1])
+
+    assert model.n_outliers == len(host_ns[::97])
+    assert model.residual_std < 0.001 * FS  # jitter is 0.5 ms
+    assert np.abs(model.forward(host_ns) - ephys_idx).max() < 0.003 * FS
+    assert np.abs(model.inverse(ephys_idx) - host_ns).max() < 3e6
+
+    restored = ClockModel.from_dict(model.to_dict())
+    assert np.array_equal(restored.forward(host_ns), model.forward(host_ns))
+
+
+def test_clock_model_conversion_speed():
+    host_ns, ephys_idx = _drifting_clocks()
+    model = align_barcodes(np.arange(len(host_ns)), host_ns, np.arange(len(host_ns)), ephys_idx)
+
+    samples = np.linspace(host_ns[0], host_ns[-1], 10_000_000).astype(np.int64)
+    t0 = time.perf_counter()
+    converted = model.forward(samples)
+    assert time.perf_counter() - t0 < 5
+    assert np.all(np.diff(converted) >= 0)
@@ -0,0 +1,71 @@
+import pickle
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from sisyphy.core import SphereDataStreamer
+from sisyphy.hardware_readers import MockSphereReaderProcess
+from sisyphy.streamers import FileDataStreamer
+from sisyphy.utils.backends import StageThread
+from sisyphy.utils.custom_queue import DequeQueue
+from sisyphy.utils.process import TerminableProcess
+
+
+def test_deque_queue():
+    queue = DequeQueue(maxsize=3)
+    data = [1.0, 2.0]
+    for i in range(5):
+        queue.put(data if i == 0 else i)
+    assert queue.qsize() == 3  # items beyond maxsize are dropped
+    assert queue.get() is data  # passed by reference
+
+    threading.Timer(0.1, queue.end_stream).start()
+    t_start = time.perf_counter()
+    assert queue.get_until_end(timeout=2) == ([1, 2], True)
+    assert time.perf_counter() - t_start < 1
+    with pytest.raises(TypeError):
+        pickle.dumps(queue)
+
+
+class _Consumer(TerminableProcess):
+    def __init__(self, queue, **kwargs):
+        super().__init__(wake_sources=[queue], max_wait_s=5.0, **kwargs)
+        self.queue = queue
+        self.received = []
+
+    def loop(self):
+        self.received += self.queue.get_all()
+
+
+def test_thread_stage_wakes_on_deque_queue():
+    queue = DequeQueue()
+    stage = StageThread(_Consumer(queue))
+    stage.start()
+    time.sleep(0.1)
+    for i in range(3):
+        queue.put(i)
+        time.sleep(0.05)
+    stage.kill_event.set()
+    stage.join(2)
+
+    assert not stage.is_alive() and stage.exitcode == 0
+    assert stage.received == [0, 1, 2]
+    # Woken by the queue, not by the timeout:
+    assert stage.loop_stats.n_iterations == 3
+
+
+def test_thread_backend_pipeline(tmp_path):
+    streamer = SphereDataStreamer(
+        mouse_reader_process_class=MockSphereReaderProcess,
+        data_streamer_class=FileDataStreamer,
+        data_path=tmp_path,
+        backend="thread",
+    )
+    streamer.start()
+    time.sleep(1.0)
+    report = streamer.stop(timeout_s=5)
+
+    assert report.clean
+    assert len(pd.read_csv(next(tmp_path.glob("*_data.csv")))) >= 5
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from sisyphy.barcode_synch.barcode_reading import (
+    BarcodeStreamDecoder,
+    find_single_barcode,
+)
+from sisyphy.barcode_synch.bcode_dataclasses import BarcodeSpec
+
+FS = 2000
+
+
+def _barcode_signal(codes, fs, spec, gap_s=0.1, v_high=5.0):
+    """Concatenate Arduino-style barcodes separated by gap_s of low signal."""
+    wrap = int(spec.wrapper_width_s * fs)
+    bit = int(spec.bit_width_s * fs)
+    wrapper = np.r_[np.zeros(wrap), np.ones(wrap), np.zeros(wrap)]
+    signal, starts = [np.zeros(int(gap_s * fs))], []
+    for code in codes:
+        starts.append(sum(len(s) for s in signal) + wrap)
+        bits = (code >> np.arange(spec.n_bits)) & 1
+        signal += [wrapper, np.repeat(bits, bit), wrapper, np.zeros(int(gap_s * fs))]
+    return np.concatenate(signal) * v_high, np.array(starts)
+
+
+@pytest.mark.parametrize("chunk_size", [50, 333, 2500, 100000])
+def test_stream_decoder_chunking(chunk_size):
+    spec = BarcodeSpec()
+    codes = [1, 2 ** 31 + 5, 123456789, 0xFFFFFFFF, 42]
+    signal, starts = _barcode_signal(codes, FS, spec, gap_s=0.02)
+
+    decoder = BarcodeStreamDecoder(FS, spec=spec)
+    found = []
+    for i in range(0, len(signal), chunk_size):
+        found.extend(decoder.process(signal[i : i + chunk_size]))
+
+    assert [c for _, c in found] == codes
+    assert np.array_equal([i for i, _ in found], starts)
+
+
+def test_stream_decoder_matches_single_barcode():
+    signal, starts = _barcode_signal([987654], FS, BarcodeSpec())
+
+    idx, code = find_single_barcode(signal, FS)
+    (stream_idx, stream_code), = BarcodeStreamDecoder(FS).process(signal)
+
+    assert code == stream_code == 987654
+    assert stream_idx == idx + 1 == starts[0]
+
+
+def test_stream_decoder_skips_incomplete():
+    signal, _ = _barcode_signal([7, 8], FS, BarcodeSpec())
+    # cut the first barcode in half:
+    found = BarcodeStreamDecoder(FS).process(signal[len(signal) // 4 :])
+
+    assert [c for _, c in found] == [8]
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from sisyphy.barcode_synch.analysis.extraction_barcodes import extract_barcodes, main
+from sisyphy.barcode_synch.bcode_dataclasses import BarcodeSpec
+from sisyphy.barcode_synch.daq_backends import barcode_waveform
+
+FS = 8000
+
+
+def _reference_extraction(indexed_times, fs, nbits=32, inter_barcode_interval=5000,
+                          ind_wrap_duration=10, ind_bar_duration=30, global_tolerance=0.2):
+    """Loop implementation of the original ONE Core extraction_barcodes.py script."""
+    wrap_duration = 3 * ind_wrap_duration
+    total_barcode_duration = nbits * ind_bar_duration + 2 * wrap_duration
+    min_wrap_duration = ind_wrap_duration - ind_wrap_duration * global_tolerance
+    max_wrap_duration = ind_wrap_duration + ind_wrap_duration * global_tolerance
+    sample_conversion = 1000 / fs
+
+    events_time_diff = np.diff(indexed_times) * sample_conversion
+    wrapper_array = indexed_times[np.where(np.logical_and(
+        min_wrap_duration < events_time_diff, events_time_diff < max_wrap_duration))[0]]
+    false_wrappers = np.where(np.diff(wrapper_array) * sample_conversion < max_wrap_duration)[0]
+    wrapper_array = np.delete(wrapper_array, false_wrappers + 1)
+    wrapper_time_diff = np.diff(wrapper_array) * sample_conversion
+    wrapper_start_times = wrapper_array[np.where(wrapper_time_diff < total_barcode_duration)[0]]
+    signals_barcode_start_times = wrapper_start_times - ind_wrap_duration / sample_conversion
+
+    for idx, ts in enumerate(indexed_times):
+        if ts == wrapper_start_times[0]:
+            on_times = indexed_times[idx::2]
+            off_times = indexed_times[idx + 1:: 2]
+    wrapper_start_times = wrapper_start_times * sample_conversion
+    on_times = on_times * sample_conversion
+    off_times = off_times * sample_conversion
+
+    signals_barcodes = []
+    for start_time in wrapper_start_times:
+        oncode = on_times[np.where(np.logical_and(
+            on_times > start_time, on_times < start_time + total_barcode_duration))[0]]
+        offcode = off_times[np.where(np.logical_and(
+            off_times > start_time, off_times < start_time + total_barcode_duration))[0]]
+        curr_time = offcode[0] + ind_wrap_duration
+        bits = np.zeros((nbits,))
+        interbit_ON = False
+        for bit in range(0, nbits):
+            next_on = np.where(oncode >= (curr_time - ind_bar_duration * global_tolerance))[0]
+            next_off = np.where(offcode >= (curr_time - ind_bar_duration * global_tolerance))[0]
+            next_on = oncode[next_on[0]] if next_on.size > 1 else start_time + inter_barcode_interval
+            next_off = offcode[next_off[0]] if next_off.size > 1 else start_time + inter_barcode_interval
+            min_bar_duration = curr_time - ind_bar_duration * global_tolerance
+            max_bar_duration = curr_time + ind_bar_duration * global_tolerance
+            if min_bar_duration <= next_on <= max_bar_duration:
+                bits[bit] = 1
+                interbit_ON = True
+            elif min_bar_duration <= next_off <= max_bar_duration:
+                interbit_ON = False
+            elif interbit_ON == True:
+                bits[bit] = 1
+            curr_time += ind_bar_duration
+        signals_barcodes.append(sum(bits[bit] * pow(2, bit) for bit in range(nbits)))
+
+    return signals_barcode_start_times, np.array(signals_barcodes)
+
+
+@pytest.fixture
+def barcode_signal():
+    rng = np.random.default_rng(0)
+    n_barcodes = 30
+    onsets = 0.5 + np.arange(n_barcodes) * 5.0 + rng.normal(0, 0.0005, n_barcodes)
+    codes = rng.integers(0, 2 ** 32, n_barcodes)
+    t = np.arange(int((onsets[-1] + 2) * FS)) / FS * (1 + 50e-6)  # drifting clocks
+    return barcode_waveform(t, onsets, codes, BarcodeSpec()) / 5, codes
+
+
+def test_extraction_matches_script(barcode_signal):
+    signal, codes = barcode_signal
+    edges = np.flatnonzero(np.abs(np.diff(signal)) > 0.9)
+
+    ref_starts, ref_codes = _reference_extraction(edges, FS)
+    starts, found_codes = extract_barcodes(edges, FS)
+    raw_starts, raw_codes = extract_barcodes(signal, FS, raw_data_format=True)
+
+    assert np.array_equal(found_codes, codes[: len(found_codes)])
+    assert np.array_equal(found_codes, ref_codes.astype(np.int64))
+    assert np.array_equal(starts, ref_starts)
+    assert np.array_equal(raw_codes, found_codes) and np.array_equal(raw_starts, starts)
+
+
+def test_extraction_cli(barcode_signal, tmp_path):
+    signal, codes = barcode_signal
+    for i in range(3):
+        np.save(tmp_path / f"signal{i}.npy", signal[:, None])
+
+    main([str(f) for f in sorted(tmp_path.glob("*.npy"))] + ["--fs", str(FS), "--raw", "--workers", "2"])
+
+    for i in range(3):
+        result = np.load(tmp_path / f"signal{i}_barcodes.npy")
+        assert np.array_equal(result[1].astype(np.int64), codes[: result.shape[1]])
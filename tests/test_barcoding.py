@@ -1,12 +1,20 @@
 from multiprocessing import Event
 
 import numpy as np
+import pytest
 
+from sisyphy.barcode_synch.barcode_reading import BarcodeStreamDecoder
+from sisyphy.barcode_synch.bcode_dataclasses import BarcodeSpec
+from sisyphy.barcode_synch.daq_backends import SimulatedDaqBackend
 from sisyphy.barcode_synch.timestamping_process import NiTimeStampProcess
 
+# Short barcodes to keep simulated tests fast:
+FAST_SPEC = BarcodeSpec(bit_width_s=0.003, wrapper_width_s=0.001, duration_thr_s=0.0015)
+
 
-# TODO mark this as hardware specific!
 def test_barcoding_process():
+    pytest.importorskip("nidaqmx")  # hardware specific, needs a NI board
+
     dev_name = "Dev6"  # < remember to change to your device name, and channel input names below.
     ai0 = "/ai0"
 
@@ -37,3 +45,56 @@ def test_barcoding_process():
     assert type(timestamps[0].code) == np.int64
     sleep(0.5)
     p_tstamp.join()
+
+
+def test_simulated_backend_detection():
+    fs = 10000
+    backend = SimulatedDaqBackend(
+        fs,
+        samples_per_frame=700,
+        spec=FAST_SPEC,
+        barcode_interval_s=0.15,
+        first_code=2 ** 20,
+        noise_std=0.3,
+        jitter_s=0.0002,
+        drift_ppm=200,
+        realtime=False,
+        seed=1,
+    )
+    decoder = BarcodeStreamDecoder(fs, spec=FAST_SPEC)
+    frames = backend.frames()
+    detected = []
+    for _ in range(100):
+        detected.extend(decoder.process(next(frames)))
+
+    # all barcodes completed within the 7 s of signal are detected, at the right sample:
+    generated = [g for g in backend.generated_barcodes if g[0] < 100 * 700 - 0.11 * fs]
+    assert detected == generated
+
+
+def test_simulated_barcoding_process():
+    from time import sleep
+
+    fs = 10000
+    kill_evt = Event()
+    backend = SimulatedDaqBackend(
+        fs, samples_per_frame=500, spec=FAST_SPEC, barcode_interval_s=0.2
+    )
+    p_tstamp = NiTimeStampProcess(
+        kill_event=kill_evt,
+        frame_duration=0.05,
+        fs=fs,
+        backend=backend,
+        barcode_spec=FAST_SPEC,
+    )
+
+    p_tstamp.start()
+    sleep(1.5)
+    kill_evt.set()
+    p_tstamp.join()
+    timestamps = p_tstamp.data_queue.get_all()
+
+    assert [t.code for t in timestamps] == list(range(len(timestamps)))
+    assert len(timestamps) >= 5
+    intervals_s = np.diff([t.t_ns_code for t in timestamps]) / 1e9
+    assert np.allclose(intervals_s, 0.2, atol=0.01)
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+
+from sisyphy.barcode_synch.analysis.cache import DiskCache, cached
+from sisyphy.barcode_synch.analysis.digital_edges import rhd_edges
+from sisyphy.barcode_synch.analysis.rhd_file import RhdFile
+
+
+def test_cached_function(tmp_path):
+    cache = DiskCache(tmp_path / "cache")
+    calls = []
+
+    @cached(cache=cache, ignore=("verbose",))
+    def load_sum(filename, scale=1, verbose=False):
+        calls.append(filename)
+        return np.loadtxt(filename).sum() * scale
+
+    data_file = tmp_path / "data.txt"
+    np.savetxt(data_file, np.arange(10))
+
+    assert load_sum(data_file) == 45
+    assert load_sum(data_file, verbose=True) == 45
+    assert len(calls) == 1
+    assert load_sum(data_file, scale=2) == 90
+    assert len(calls) == 2
+
+    # A modified input file is a cache miss:
+    np.savetxt(data_file, np.arange(11))
+    os.utime(data_file, ns=(0, 10 ** 9))
+    assert load_sum(data_file) == 55
+    assert len(calls) == 3
+
+    load_sum.invalidate(data_file)
+    assert load_sum(data_file) == 55
+    assert len(calls) == 4
+    assert cache.invalidate() == 3  # also the outdated result of the first call
+
+
+def test_strings_are_not_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = DiskCache(tmp_path / "cache")
+    (tmp_path / "x").write_text("a file named like an argument")
+    keys = [cache.key("f", dict(name=name)) for name in ["x", ".", ""]]
+    (tmp_path / "x").write_text("changed")
+    (tmp_path / "other").write_text("new file in the directory")
+    assert [cache.key("f", dict(name=name)) for name in ["x", ".", ""]] == keys
+
+
+def test_lru_eviction(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=3500)
+    for i in range(3):
+        cache.put(f"f-{i}", np.zeros(100))  # ~1 kB each
+        os.utime(cache._path(f"f-{i}"), ns=(i * 10 ** 9, i * 10 ** 9))
+    cache.get("f-0")  # mark as most recently used
+    cache.put("f-3", np.zeros(100))
+
+    assert [cache.get(f"f-{i}")[0] for i in range(4)] == [True, False, True, True]
+    assert cache.size <= 3500
+
+
+def test_cached_rhd_edges(tmp_path, rhd_writer, analysis_cache_dir):
+    rhd_writer(tmp_path / "test.rhd", n_blocks=5)
+    events = rhd_edges(RhdFile(tmp_path / "test.rhd"))
+    assert len(list(analysis_cache_dir.glob("rhd_edges-*.pkl"))) == 1
+
+    # Same result from the cache, also with a different chunk size:
+    assert np.array_equal(rhd_edges(RhdFile(tmp_path / "test.rhd"), chunk_size=100), events)
+    assert len(list(analysis_cache_dir.glob("*.pkl"))) == 1
@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+from multiprocessing import Event
+
+import numpy as np
+
+from sisyphy.barcode_synch.bcode_dataclasses import TimeStampData
+from sisyphy.barcode_synch.clock_sync import ClockSyncProcess, SlidingClockRegression
+from sisyphy.utils.custom_queue import SaturatingQueue
+from sisyphy.utils.dataclasses import TimestampedDataClass
+
+
+def _clock_pairs(n, drift_ppm, offset_s, jitter_s=0.0, t0_ns=10 ** 15, seed=0):
+    rng = np.random.default_rng(seed)
+    x_ns = t0_ns + np.arange(n, dtype=np.int64) * 5 * 10 ** 9
+    y_s = (x_ns - t0_ns) * 1e-9 * (1 + drift_ppm * 1e-6) + offset_s
+    return x_ns, y_s + rng.normal(0, jitter_s, n)
+
+
+def test_sliding_regression_tracks_drift():
+    x_ns, y_s = _clock_pairs(500, drift_ppm=80, offset_s=12.3, jitter_s=0.0005)
+    regression = SlidingClockRegression(window=60)
+    assert np.isnan(regression.predict(x_ns[0])[0])
+
+    for x, y in zip(x_ns, y_s):
+        regression.update(x, y)
+    assert regression.n == 60
+    assert abs(regression.drift_ppm - 80) < 5
+    assert abs(regression.residual_std_s - 0.0005) < 0.0002
+
+    # predict 1 s after the last barcode:
+    t_ns = x_ns[-1] + 10 ** 9
+    y_true = (t_ns - x_ns[0]) * 1e-9 * (1 + 80e-6) + 12.3
+    y_est, err = regression.predict(t_ns)
+    assert abs(y_est - y_true) < 4 * err
+    assert err < 0.0005
+
+
+def test_sliding_regression_forgets_old_pairs():
+    x_ns, y_s = _clock_pairs(200, drift_ppm=0, offset_s=1.0)
+    y_s[100:] += 0.5  # clock jump
+    regression = SlidingClockRegression(window=20)
+    for x, y in zip(x_ns, y_s):
+        regression.update(x, y)
+    y_est, err = regression.predict(x_ns[-1])
+    assert abs(y_est - y_s[-1]) < 1e-9
+    assert abs(regression.drift_ppm) < 1e-3
+
+
+@dataclass
+class _Sample(TimestampedDataClass):
+    value: int
+
+
+def test_clock_sync_process():
+    fs = 10000
+    kill_evt = Event()
+    sample_queue, tstamp_queue = SaturatingQueue(), SaturatingQueue()
+    p_sync = ClockSyncProcess(
+        kill_event=kill_evt, sphere_data_queue=sample_queue, tstamp_queue=tstamp_queue, fs=fs
+    )
+
+    x_ns, y_s = _clock_pairs(10, drift_ppm=50, offset_s=3.0)
+    for i, (x, y) in enumerate(zip(x_ns, y_s)):
+        tstamp_queue.put(
+            TimeStampData(
+                t_ns_buffer_stream=x, t_ns_code=x, code=i, sample_index=int(round(y * fs))
+            )
+        )
+    kill_evt.wait(0.2)  # let the queue feeder flush the barcodes before the sample
+    p_sync.start()
+
+    sample = _Sample(value=1)
+    sample.t_ns = int(x_ns[-1])
+    sample_queue.put(sample)
+
+    synced = []
+    for _ in range(100):
+        synced.extend(p_sync.data_queue.get_all())
+        if len(synced) > 0:
+            break
+        kill_evt.wait(0.05)
+    kill_evt.set()
+    p_sync.join()
+
+    assert len(synced) == 1
+    assert synced[0].sample == sample
+    assert abs(synced[0].t_daq_s - y_s[-1]) < 1 / fs
+    assert synced[0].t_daq_err_s < 1 / fs
@@ -0,0 +1,58 @@
+import numpy as np
+
+from sisyphy.barcode_synch.analysis.digital_edges import (
+    channel_edges,
+    channel_states,
+    iter_edges,
+    rhd_edges,
+    word_edges,
+)
+from sisyphy.barcode_synch.analysis.rhd_file import RhdFile
+from sisyphy.barcode_synch.analysis.rhd_session import RhdSession
+
+
+def _reference_edges(words):
+    """Edges from the unpacked boolean channels, as done in the analysis notebook."""
+    bits = (words[None, :] >> np.arange(16)[:, None]) & 1
+    channels, idx = np.nonzero(np.diff(bits, axis=1))
+    idx = idx + 1
+    order = np.lexsort((channels, idx))
+    return idx[order], channels[order], bits[channels, idx][order].astype(bool)
+
+
+def test_word_edges_match_unpacked_diff():
+    rng = np.random.default_rng(0)
+    # sparse transitions on a few bits:
+    words = np.cumsum(rng.random(5000) < 0.01).astype(np.uint16) & 0b1010_0110
+    words ^= (rng.random(5000) < 0.001).astype(np.uint16) << 15
+
+    events = word_edges(words)
+    idx, channels, rising = _reference_edges(words)
+    assert np.array_equal(events["sample_index"], idx)
+    assert np.array_equal(events["channel"], channels)
+    assert np.array_equal(events["rising"], rising)
+
+    # Streaming over chunks gives the same events:
+    chunks = [(start, words[start : start + 777]) for start in range(0, len(words), 777)]
+    streamed = np.concatenate(list(iter_edges(chunks)))
+    assert np.array_equal(streamed, events)
+
+    states = channel_states(events, 2, np.arange(len(words)), initial=bool(words[0] & 4))
+    assert np.array_equal(states, (words & 4) != 0)
+
+
+def test_rhd_edges(tmp_path, rhd_writer):
+    raw = []
+    for i in range(2):
+        raw.append(rhd_writer(tmp_path / f"s_{i}.rhd", n_blocks=6, first_timestamp=i * 768, seed=i))
+    words = np.concatenate([r["board_dig_in"] for r in raw])
+
+    events = rhd_edges(RhdSession(tmp_path), chunk_size=100)
+    assert np.array_equal(events, word_edges(words))
+
+    file_events = rhd_edges(RhdFile(tmp_path / "s_0.rhd"))
+    assert np.array_equal(file_events, word_edges(raw[0]["board_dig_in"]))
+
+    idx, rising = channel_edges(events, 3)
+    assert np.all(np.diff(idx) > 0)
+    assert np.all(rising[1:] != rising[:-1])
@@ -0,0 +1,55 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+IMPORT_BUDGET_S = 0.25  # for `import sisyphy`, generous for slow CI machines
+HEAVY_MODULES = ["numpy", "pandas", "usb1", "zmq", "matplotlib", "pyqtgraph"]
+
+
+def _import_in_subprocess(statement):
+    """Time of an import statement in a fresh interpreter, and heavy modules loaded."""
+    code = (
+        "import json, sys, time\n"
+        "t_start = time.perf_counter()\n"
+        f"{statement}\n"
+        "t_import = time.perf_counter() - t_start\n"
+        f"loaded = [m for m in {HEAVY_MODULES} if m in sys.modules]\n"
+        "print(json.dumps(dict(t_import=t_import, loaded=loaded)))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_import_sisyphy_is_fast():
+    result = _import_in_subprocess("import sisyphy")
+    assert result["loaded"] == []
+    assert result["t_import"] < IMPORT_BUDGET_S
+
+
+@pytest.mark.parametrize(
+    "statement, allowed",
+    [
+        ("from sisyphy.streamers import FileDataStreamer", ["numpy", "pandas"]),
+        (
+            "from sisyphy.hardware_readers import MockSphereReaderProcess",
+            ["numpy", "pandas"],
+        ),
+        ("from sisyphy.barcode_synch.analysis import rhd_file, rhd_reading", ["numpy"]),
+    ],
+)
+def test_optional_dependencies_are_not_imported(statement, allowed):
+    assert set(_import_in_subprocess(statement)["loaded"]) <= set(allowed)
+
+
+def test_lazy_attributes():
+    import sisyphy
+    from sisyphy.core import SphereDataStreamer
+
+    assert sisyphy.SphereDataStreamer is SphereDataStreamer
+    assert "MockDataStreamer" in dir(sisyphy)
+    with pytest.raises(AttributeError):
+        sisyphy.NotAStreamer
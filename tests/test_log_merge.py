@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from sisyphy.log_merge import iter_latencies, iter_log, latency_table, main, merge_logs
+from sisyphy.process_logger import ConcurrenceLogger
+
+
+def _write_logs(tmp_path):
+    sender = ConcurrenceLogger("reader", directory=tmp_path)
+    receiver = ConcurrenceLogger("gui", directory=tmp_path)
+    for _ in range(3):
+        sender.log_queue("data", True)
+    for _ in range(3):
+        receiver.log_queue("data", False)
+    sender.log_event("kill", True, True)
+    receiver.log_event("kill", False, True)
+    receiver.log_message("done")
+    sender.close()
+    receiver.close()
+    return [tmp_path / "reader.bin", tmp_path / "gui.bin"]
+
+
+def test_merge_and_latencies(tmp_path):
+    filenames = _write_logs(tmp_path)
+    entries = list(merge_logs(filenames, chunk_records=2))
+    assert len(entries) == 9
+    assert np.all(np.diff([e.t_ns for e in entries]) >= 0)
+    assert [e.process for e in entries[:6]] == ["reader"] * 3 + ["gui"] * 3
+
+    latencies = latency_table(iter_latencies(merge_logs(filenames)))
+    assert list(latencies["kind"]) == ["QUEUE"] * 3 + ["EVENT"]
+    # first in, first out:
+    queue = latencies[latencies["kind"] == "QUEUE"]
+    assert list(queue["t_sent_ns"]) == [e.t_ns for e in entries[:3]]
+    assert np.all(latencies["latency_us"] > 0)
+
+
+def test_chrome_trace(tmp_path):
+    _write_logs(tmp_path)
+    main([str(tmp_path), "--trace", str(tmp_path / "trace.json")])
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert sum(e["ph"] == "X" for e in events) == 4
+    assert {e["args"]["name"] for e in events if e["ph"] == "M"} == {"reader", "gui"}
+    assert (tmp_path / "trace_latencies.csv").exists()
+
+
+def test_messages_and_quoted_names(tmp_path):
+    sender = ConcurrenceLogger("reader", directory=tmp_path)
+    receiver = ConcurrenceLogger("gui", directory=tmp_path)
+    name = 'data, "raw"'
+    for i in range(5):
+        sender.log_message(f"sent {i}")
+        sender.log_queue(name, True)
+        receiver.log_queue(name, False)
+    sender.close()
+    receiver.close()
+
+    entries = list(iter_log(tmp_path / "reader.bin", chunk_records=3))
+    assert [e.name for e in entries if e.event_type == "LOG"] == [
+        f"sent {i}" for i in range(5)
+    ]
+
+    main([str(tmp_path), "--trace", str(tmp_path / "trace.json")])
+    latencies = pd.read_csv(tmp_path / "trace_latencies.csv")
+    assert len(latencies) == 5
+    assert set(latencies["name"]) == {name}
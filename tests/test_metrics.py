@@ -0,0 +1,94 @@
+import time
+import urllib.request
+
+import numpy as np
+
+from sisyphy.core import MockDataStreamer, SphereDataStreamer
+from sisyphy.hardware_readers import MockSphereReaderProcess
+from sisyphy.streamers import FileDataStreamer
+from sisyphy.utils.custom_queue import SaturatingQueue
+from sisyphy.utils.metrics import MetricsRegistry
+
+
+def test_stage_metrics():
+    registry = MetricsRegistry(["reader"])
+    metrics = registry.stage("reader", publish_interval_s=0)
+    metrics.maybe_publish()
+    for i in range(1, 101):
+        metrics.count(t_ns=i * 10 ** 7)  # every 10 ms
+    metrics.drop(2)
+    queue = SaturatingQueue()
+    metrics.maybe_publish([queue])
+
+    values = registry.snapshot()["reader"]
+    assert values["samples_total"] == 100 and values["drops_total"] == 2
+    assert np.isclose(values["interval_p50_s"], 0.01)
+    assert values["queue_depth"] == 0 or np.isnan(values["queue_depth"])  # macOS
+    assert values["cpu_seconds_total"] > 0
+
+
+def test_final_publication_is_forced():
+    registry = MetricsRegistry(["reader"])
+    metrics = registry.stage("reader", publish_interval_s=60)
+    metrics.count(3)
+    metrics.maybe_publish()
+    assert np.isnan(registry.snapshot()["reader"]["rate_hz"])
+    metrics.maybe_publish(force=True)
+    values = registry.snapshot()["reader"]
+    assert values["rate_hz"] > 0 and values["cpu_seconds_total"] > 0
+
+
+def test_saturating_queue_reports_drops():
+    queue = SaturatingQueue(maxsize=1)
+    assert queue.put(1)
+    time.sleep(0.1)
+    assert not queue.put(2)
+
+
+def test_pipeline_metrics_endpoint(tmp_path):
+    registry = MetricsRegistry(["reader", "streamer"], labels=dict(rig="test"))
+    streamer = SphereDataStreamer(
+        mouse_reader_process_class=MockSphereReaderProcess,
+        data_streamer_class=FileDataStreamer,
+        data_path=tmp_path,
+        metrics=registry,
+    )
+    server = registry.serve(port=0)
+    streamer.start()
+    time.sleep(1.5)
+
+    snapshot = registry.snapshot()
+    assert 10 < snapshot["reader"]["rate_hz"] < 40  # mock reader at 20 Hz
+    assert np.isclose(snapshot["reader"]["interval_p50_s"], 0.05, atol=0.01)
+    assert snapshot["streamer"]["samples_total"] > 0
+    assert snapshot["streamer"]["last_sample_age_s"] < 0.5
+
+    with urllib.request.urlopen(server.url) as response:
+        text = response.read().decode()
+    server.close()
+    streamer.stop()
+    assert "# TYPE sisyphy_samples_total counter" in text
+    assert 'sisyphy_rate_hz{rig="test",stage="reader"}' in text
+
+
+def test_data_streamer_metrics():
+    streamer = MockDataStreamer()
+    streamer.start()
+    time.sleep(1.5)
+    streamer.stop()
+
+    snapshot = streamer.metrics.snapshot()
+    assert snapshot["streamer"]["samples_total"] > 0
+    assert snapshot["streamer"]["samples_total"] <= snapshot["reader"]["samples_total"]
+    assert snapshot["streamer"]["cpu_seconds_total"] > 0
+
+
+def test_rate_after_restart():
+    registry = MetricsRegistry(["reader"])
+    registry.stage("reader").count(10 ** 6)  # a previous run of the stage
+    metrics = registry.stage("reader", publish_interval_s=0)
+    metrics.maybe_publish()
+    time.sleep(0.1)
+    metrics.count(10)
+    metrics.maybe_publish()
+    assert registry.snapshot()["reader"]["rate_hz"] < 1000
@@ -0,0 +1,39 @@
+import numpy as np
+
+from sisyphy.app.orientation import OrientationIntegrator
+from sisyphy.hardware_readers.sphere_process import EstimatedVelSphereData
+
+
+def test_integration_around_axis():
+    integrator = OrientationIntegrator(gain=np.deg2rad(0.1))
+    for _ in range(100):  # 100 batches of 10 samples, 1 degree per batch
+        integrator.update(pitch=np.zeros(10), roll=np.zeros(10), yaw=np.ones(10))
+    angle, axis = integrator.as_axis_angle()
+    assert np.isclose(angle, 100) and np.allclose(axis, [0, 0, 1])
+    assert integrator.n_samples == 1000
+
+    # A full turn goes back to the start:
+    integrator.update(0, 0, 2600)
+    assert np.allclose(integrator.as_matrix(), np.eye(3))
+
+
+def test_stays_normalized():
+    rng = np.random.default_rng(0)
+    integrator = OrientationIntegrator()
+    for _ in range(10000):
+        integrator.update(*rng.normal(size=(3, 20)) * 100)
+    assert np.isclose(np.linalg.norm(integrator.quaternion), 1, atol=1e-12)
+    matrix = integrator.as_matrix()
+    assert np.allclose(matrix @ matrix.T, np.eye(3))
+
+
+def test_update_from_samples():
+    integrator = OrientationIntegrator(gain=np.deg2rad(1))
+    samples = [
+        EstimatedVelSphereData(pitch=45.0, roll=0.0, yaw=0.0, x0=0, y0=0, x1=0, y1=0)
+        for _ in range(2)
+    ]
+    integrator.update_from(samples)
+    integrator.update_from([])
+    angle, axis = integrator.as_axis_angle()
+    assert np.isclose(angle, 90) and np.allclose(axis, [1, 0, 0])
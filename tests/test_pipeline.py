@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from sisyphy.barcode_synch.analysis.pipeline import load_alignment, main, run_alignment
+from sisyphy.barcode_synch.bcode_dataclasses import BarcodeSpec
+from sisyphy.barcode_synch.daq_backends import barcode_waveform
+
+FAST_SPEC = BarcodeSpec(
+    n_bits=16, bit_width_s=0.003, wrapper_width_s=0.001, duration_thr_s=0.0015
+)
+FS = 20000
+CHANNEL = 2
+
+
+def _write_session(path, rhd_writer, n_files=3, blocks_per_file=400):
+    n_samples = n_files * blocks_per_file * 128
+    onsets_s = np.arange(0.05, n_samples / FS, 0.1)
+    codes = np.arange(len(onsets_s)) + 1000
+    t_s = np.arange(n_samples) / FS
+    signal = barcode_waveform(t_s, onsets_s, codes, FAST_SPEC)
+    words = (signal > 2.5).astype(np.uint16) << CHANNEL
+
+    for i in range(n_files):
+        samples = slice(i * blocks_per_file * 128, (i + 1) * blocks_per_file * 128)
+        rhd_writer(
+            path / f"intan_{i:02d}.rhd",
+            n_blocks=blocks_per_file,
+            n_amplifier=0,
+            n_aux_input=0,
+            n_board_adc=0,
+            dig_in_orders=(CHANNEL,),
+            first_timestamp=samples.start,
+            dig_in_words=words[samples],
+        )
+    # index of the first high sample of each barcode:
+    return np.searchsorted(t_s, onsets_s), codes
+
+
+def test_run_alignment(tmp_path, rhd_writer):
+    rhd_path = tmp_path / "intan"
+    rhd_path.mkdir()
+    onsets, codes = _write_session(rhd_path, rhd_writer)
+
+    # sisyphy clock: offset and 100 ppm drift with respect to the Intan one, and
+    # the first barcodes missing:
+    t_ns = (10 ** 12 + onsets / FS * (1 + 100e-6) * 1e9).astype(np.int64)
+    timestamps_file = tmp_path / "session_timestamps.txt"
+    pd.DataFrame(dict(t_ns_buffer_stream=t_ns, t_ns_code=t_ns, code=codes, sample_index=0))[
+        3:
+    ].to_csv(timestamps_file)
+
+    model = run_alignment(
+        rhd_path, timestamps_file, CHANNEL, output_dir=tmp_path / "out", spec=FAST_SPEC, chunk_size=5000
+    )
+    n_complete = int(np.sum(onsets + FAST_SPEC.duration_s * FS < 3 * 400 * 128))
+    assert model.n_pairs == n_complete - 3
+    assert model.residual_max < 0.5
+    assert np.allclose(model.forward(t_ns[3:n_complete]), onsets[3:n_complete], atol=0.5)
+
+    saved = np.load(tmp_path / "out" / "alignment_barcodes.npz")
+    assert np.array_equal(saved["rhd_sample_index"], onsets[:n_complete])
+    assert load_alignment(tmp_path / "out" / "alignment.json").to_dict() == model.to_dict()
+
+
+def test_cli(tmp_path, rhd_writer):
+    onsets, codes = _write_session(tmp_path, rhd_writer, n_files=1)
+    pd.DataFrame(dict(t_ns_code=onsets * 50000, code=codes)).to_csv(tmp_path / "ts.txt")
+    main(
+        [
+            str(tmp_path),
+            str(tmp_path / "ts.txt"),
+            "--channel",
+            str(CHANNEL),
+            "--n-bits",
+            "16",
+            "--bit-width-s",
+            "0.003",
+            "--wrapper-width-s",
+            "0.001",
+        ]
+    )
+    assert (tmp_path / "alignment.json").exists()
@@ -0,0 +1,77 @@
+import threading
+from enum import Enum
+
+import numpy as np
+
+from sisyphy.process_logger import ConcurrenceLogger, LoggingProcess, read_log
+
+
+class Events(Enum):
+    START = 1
+
+
+class _MessageProcess(LoggingProcess):
+    def run(self):
+        for i in range(10):
+            self.logger.log_message(f"message {i % 2}")
+        self.close_log()
+
+
+def test_logger_roundtrip(tmp_path):
+    # A small buffer, to also fill it up before the background writes:
+    logger = ConcurrenceLogger("proc", directory=tmp_path, buffer_records=16)
+    logger.log_message("hello")
+    logger.log_event(Events.START, True, True)
+    for _ in range(100):
+        logger.log_queue("data", False)
+    logger.close()
+
+    log = read_log(tmp_path / "proc.bin")
+    assert len(log) == 102
+    assert list(log["event_type"][:3]) == ["LOG", "EVENT", "QUEUE"]
+    assert list(log["name"][:3]) == ["hello", "START", "data"]
+    assert list(log["is_sender"][:3]) == [False, True, False]
+    assert np.all(np.diff(log["t_ns"]) >= 0)
+
+
+def test_logging_process(tmp_path):
+    process = _MessageProcess(name="child", log_dir=tmp_path)
+    process.start()
+    process.join()
+    log = read_log(tmp_path / "child.bin")
+    assert list(log["name"]) == [f"message {i % 2}" for i in range(10)]
+
+
+def test_unique_messages_and_restart(tmp_path):
+    logger = ConcurrenceLogger("proc", directory=tmp_path)
+    n_messages = 2 ** 16 + 10  # more than the name ids of events and queues
+    for i in range(n_messages):
+        logger.log_message(f"message {i}")
+    logger.close()
+    # Logging after close() appends to the same files:
+    logger.log_event("kill", True, True)
+    logger.log_message("after close")
+    logger.close()
+
+    log = read_log(tmp_path / "proc.bin")
+    assert len(log) == n_messages + 2
+    assert log["name"].iloc[n_messages - 1] == f"message {n_messages - 1}"
+    assert list(log["name"].iloc[-2:]) == ["kill", "after close"]
+
+
+def test_logging_from_threads(tmp_path):
+    logger = ConcurrenceLogger("proc", directory=tmp_path, buffer_records=64)
+
+    def log(name):
+        for _ in range(1000):
+            logger.log_queue(name, True)
+
+    threads = [threading.Thread(target=log, args=(f"queue {i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.close()
+
+    log = read_log(tmp_path / "proc.bin")
+    assert log["name"].value_counts().to_dict() == {f"queue {i}": 1000 for i in range(4)}
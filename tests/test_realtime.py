@@ -0,0 +1,67 @@
+import gc
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sisyphy.hardware_readers import MockSphereReaderProcess, ReplaySphereReaderProcess
+from sisyphy.utils.realtime import ProcessTuning
+
+
+def test_tuning_report():
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else [0]
+    report = ProcessTuning(cpus=cpus, gc_mode="freeze").apply()
+    try:
+        assert report["gc_mode"] == "applied freeze"
+        assert gc.get_freeze_count() > 0
+        assert set(report) == {"cpus", "gc_mode"}
+    finally:
+        gc.unfreeze()
+
+    # Invalid settings are reported, not raised:
+    assert (
+        ProcessTuning(gc_mode="sometimes").apply()["gc_mode"].startswith("not applied")
+    )
+
+
+@pytest.mark.parametrize("rate_hz", [None, 200.0])
+def test_replay_reader(tmp_path, rate_hz):
+    n = 20
+    data = pd.DataFrame(
+        dict(
+            t_ns=np.arange(n) * 10 ** 7 + 10 ** 12,  # 100 Hz
+            x0=np.arange(n),
+            y0=0,
+            x1=0,
+            y1=np.arange(n),
+        )
+    )
+    data.to_csv(tmp_path / "data.csv", index=False)
+
+    reader = ReplaySphereReaderProcess(
+        filename=tmp_path / "data.csv", sample_rate_hz=rate_hz, loop_data=False
+    )
+    reader.start()
+    samples, ended = reader.data_queue.get_until_end(timeout=5)
+    reader.join()
+
+    assert ended
+    assert [s.x0 for s in samples] == list(range(n))
+    period_s = np.median(np.diff([s.t_ns for s in samples])) / 1e9
+    assert period_s == pytest.approx(1 / (rate_hz or 100), rel=0.1)
+
+
+def test_readers_are_not_scheduled(tmp_path):
+    # The readers pace their samples themselves, not with periodic wake-ups:
+    assert not MockSphereReaderProcess(sample_rate_hz=100).scheduled
+    assert not ReplaySphereReaderProcess(sample_rate_hz=100).scheduled
+
+    pd.DataFrame(dict(t_ns=[10 ** 12], x0=[1], y0=0, x1=0, y1=0)).to_csv(
+        tmp_path / "data.csv", index=False
+    )
+    reader = ReplaySphereReaderProcess(filename=tmp_path / "data.csv", loop_data=False)
+    reader.start()
+    samples, ended = reader.data_queue.get_until_end(timeout=5)
+    reader.join()
+    assert ended and [s.x0 for s in samples] == [1]
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from sisyphy.barcode_synch.analysis.rhd_file import RhdFile
+from sisyphy.barcode_synch.analysis.rhd_reading import load_file
+
+
+@pytest.fixture
+def rhd_path(tmp_path, rhd_writer):
+    rhd_writer(tmp_path / "test.rhd", n_blocks=20, n_temp_sensor=1)
+    return tmp_path / "test.rhd"
+
+
+def test_selective_access_matches_load_file(rhd_path):
+    full = load_file(rhd_path)
+    rhd = RhdFile(rhd_path)
+
+    assert len(rhd) == rhd.amplifier.shape[1] == full["amplifier_data"].shape[1]
+    assert np.array_equal(rhd["board_dig_in", 100:1000], full["board_dig_in_data"][:, 100:1000])
+    assert np.array_equal(rhd["board_dig_in", 1, 5:300:7], full["board_dig_in_data"][1, 5:300:7])
+    assert np.array_equal(rhd.amplifier[[0, 3], 250:260], full["amplifier_data"][[0, 3], 250:260])
+    assert np.array_equal(rhd.amplifier[2, -5:], full["amplifier_data"][2, -5:])
+    assert rhd.amplifier[1, 130] == full["amplifier_data"][1, 130]
+    assert np.array_equal(rhd.aux_input[:, 33:97], full["aux_input_data"][:, 33:97])
+    assert np.array_equal(rhd["supply_voltage", 0, 3:7], full["supply_voltage_data"][0, 3:7])
+    assert np.array_equal(rhd["timestamps", 10:20], full["t_amplifier"][10:20])
+    assert np.array_equal(rhd["board_dig_in_raw", 10:20], full["board_dig_in_raw"][10:20])
+    assert np.array_equal(rhd["board_adc"], full["board_adc_data"])
+
+
+def test_chunk_iteration(rhd_path):
+    rhd = RhdFile(rhd_path, scale=False)
+    full = load_file(rhd_path, scale=False)
+
+    chunks = list(rhd.iter_chunks("amplifier", chunk_size=1000, channels=[1, 2]))
+    assert [start for start, _ in chunks] == list(range(0, len(rhd), 1000))
+    assert max(c.shape[1] for _, c in chunks) == 1000
+    assert np.array_equal(np.concatenate([c for _, c in chunks], 1), full["amplifier_data"][1:3])
+
+    words = np.concatenate([c for _, c in rhd.board_dig_in_raw.iter_chunks(chunk_size=999)])
+    assert words.dtype == np.uint16
+    assert np.array_equal(words, full["board_dig_in_raw"])
+
+
+def test_missing_signal(tmp_path, rhd_writer):
+    rhd_writer(tmp_path / "test.rhd", n_blocks=2, dig_out_orders=())
+    rhd = RhdFile(tmp_path / "test.rhd")
+    with pytest.raises(AttributeError):
+        rhd.board_dig_out
+    with pytest.raises(KeyError):
+        rhd["board_dig_out_raw", 0:10]
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from sisyphy.barcode_synch.analysis.rhd_reading import load_file, read_data_blocks
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        dict(),
+        dict(version=(1, 3), n_temp_sensor=2, eval_board_mode=1),
+        dict(n_aux_input=0, n_board_adc=0, dig_out_orders=()),
+    ],
+)
+def test_load_file(tmp_path, rhd_writer, kwargs):
+    raw = rhd_writer(tmp_path / "test.rhd", **kwargs)
+    result = load_file(tmp_path / "test.rhd")
+    sample_rate = 20000.0
+
+    assert np.array_equal(result["t_amplifier"], raw["timestamps"] / sample_rate)
+    assert np.allclose(
+        result["amplifier_data"], 0.195 * (raw["amplifier"].astype(np.int32) - 32768)
+    )
+    assert np.allclose(result["supply_voltage_data"], 74.8e-6 * raw["supply_voltage"])
+    assert len(result["t_supply_voltage"]) == raw["supply_voltage"].shape[1]
+
+    if raw["aux_input"].shape[0] > 0:
+        assert np.allclose(result["aux_input_data"], 37.4e-6 * raw["aux_input"])
+    else:
+        assert "aux_input_data" not in result
+    if raw["temp_sensor"].shape[0] > 0:
+        assert np.allclose(result["temp_sensor_data"], 0.01 * raw["temp_sensor"])
+    if raw["board_adc"].shape[0] > 0 and kwargs.get("eval_board_mode", 0) == 1:
+        expected = 152.59e-6 * (raw["board_adc"].astype(np.int32) - 32768)
+        assert np.allclose(result["board_adc_data"], expected)
+
+    for ch_i, ch in enumerate(result["board_dig_in_channels"]):
+        expected = (raw["board_dig_in"] >> ch["native_order"]) & 1
+        assert np.array_equal(result["board_dig_in_data"][ch_i], expected.astype(bool))
+    assert ("board_dig_out_data" in result) == (len(raw["board_dig_out"]) > 0)
+
+
+def test_memmapped_raw_blocks(tmp_path, rhd_writer):
+    raw = rhd_writer(tmp_path / "test.rhd", n_blocks=5)
+    header, blocks = read_data_blocks(tmp_path / "test.rhd")
+
+    assert isinstance(blocks, np.memmap)
+    assert header["num_data_blocks"] == len(blocks) == 5
+    assert np.array_equal(blocks["amplifier"][2, 1], raw["amplifier"][1, 256:384])
+
+    unscaled = load_file(tmp_path / "test.rhd", scale=False)
+    assert unscaled["amplifier_data"].dtype == np.uint16
+    assert np.array_equal(unscaled["amplifier_data"], raw["amplifier"])
+    assert np.array_equal(unscaled["board_dig_in_raw"], raw["board_dig_in"])
+
+
+def test_empty_file(tmp_path, rhd_writer):
+    rhd_writer(tmp_path / "test.rhd", n_blocks=0)
+    assert load_file(tmp_path / "test.rhd") is None
@@ -0,0 +1,93 @@
+import gc
+import mmap
+
+import numpy as np
+import pytest
+
+from sisyphy.barcode_synch.analysis import rhd_session
+from sisyphy.barcode_synch.analysis.rhd_reading import load_file
+from sisyphy.barcode_synch.analysis.rhd_session import RhdSession
+
+
+def _write_session(path, rhd_writer, n_files=3, n_blocks=8, gap=0, **kwargs):
+    first_timestamp = 0
+    for i in range(n_files):
+        rhd_writer(
+            path / f"session_{i:03d}.rhd",
+            n_blocks=n_blocks,
+            first_timestamp=first_timestamp,
+            seed=i,
+            **kwargs,
+        )
+        first_timestamp += n_blocks * 128 + (gap if i == 0 else 0)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_session_load(tmp_path, rhd_writer, n_workers):
+    _write_session(tmp_path, rhd_writer)
+    files = [load_file(f) for f in sorted(tmp_path.glob("*.rhd"))]
+    session = RhdSession(tmp_path)
+
+    assert session.discontinuities == []
+    assert len(session) == sum(f["amplifier_data"].shape[1] for f in files)
+
+    amplifier = session.load("amplifier", channels=[0, 2], n_workers=n_workers)
+    expected = np.concatenate([f["amplifier_data"][[0, 2]] for f in files], 1)
+    assert np.array_equal(amplifier, expected)
+
+    dig_in = session.load("board_dig_in", channels=1, n_workers=n_workers)
+    assert np.array_equal(dig_in, np.concatenate([f["board_dig_in_data"][1] for f in files]))
+
+    aux = session.load("aux_input", out_path=tmp_path / "aux.npy", n_workers=n_workers)
+    assert isinstance(aux, np.memmap)
+    assert np.array_equal(aux, np.concatenate([f["aux_input_data"] for f in files], 1))
+
+
+def test_session_discontinuities(tmp_path, rhd_writer):
+    _write_session(tmp_path, rhd_writer, gap=-10)
+    with pytest.warns(UserWarning, match="overlap of 10 samples"):
+        session = RhdSession(tmp_path)
+    assert len(session.discontinuities) == 1
+    assert session.discontinuities[0].file_index == 1
+    assert session.discontinuities[0].sample_index == 8 * 128
+    assert session.discontinuities[0].n_samples == -10
+
+
+def test_incompatible_headers(tmp_path, rhd_writer):
+    rhd_writer(tmp_path / "a.rhd", n_amplifier=4)
+    rhd_writer(tmp_path / "b.rhd", n_amplifier=5, first_timestamp=10 * 128)
+    with pytest.raises(ValueError, match="channels"):
+        RhdSession(tmp_path)
+
+
+def test_different_channel_order(tmp_path, rhd_writer):
+    rhd_writer(tmp_path / "a.rhd", dig_in_orders=(0, 3))
+    rhd_writer(tmp_path / "b.rhd", dig_in_orders=(3, 0), first_timestamp=10 * 128)
+    with pytest.raises(ValueError, match="board_dig_in_channels"):
+        RhdSession(tmp_path)
+
+
+def test_session_load_in_chunks(tmp_path, rhd_writer, monkeypatch):
+    monkeypatch.setattr(rhd_session, "LOAD_CHUNK_SIZE", 100)
+    _write_session(tmp_path, rhd_writer)
+    files = [load_file(f) for f in sorted(tmp_path.glob("*.rhd"))]
+    session = RhdSession(tmp_path)
+
+    amplifier = session.load("amplifier", channels=[1, 3], n_workers=1)
+    assert np.array_equal(amplifier, np.concatenate([f["amplifier_data"][[1, 3]] for f in files], 1))
+
+
+def test_session_load_is_not_copied(tmp_path, rhd_writer):
+    _write_session(tmp_path, rhd_writer)
+    files = [load_file(f) for f in sorted(tmp_path.glob("*.rhd"))]
+    session = RhdSession(tmp_path)
+
+    amplifier = session.load("amplifier", n_workers=2)
+    # Backed by the block the workers wrote to, not by a copy of it:
+    assert not amplifier.flags.owndata
+    assert isinstance(amplifier.base, mmap.mmap)
+
+    first_channel = amplifier[0]
+    del amplifier
+    gc.collect()
+    assert np.array_equal(first_channel, np.concatenate([f["amplifier_data"][0] for f in files]))
@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+from multiprocessing import Process
+
+import numpy as np
+
+from sisyphy.utils.decimation import MinMaxPyramid
+from sisyphy.utils.ring_buffer import ColumnarRingBuffer
+
+
+@dataclass
+class _Sample:
+    t_ns: int
+    x: float
+
+
+def test_wrap_around_and_time_window():
+    buffer = ColumnarRingBuffer(["x", "y"], capacity=10)
+    for start in range(0, 25, 5):  # 25 samples in batches of 5
+        t = np.arange(start, start + 5)
+        buffer.extend(t * 100, np.stack([t, -t]))
+    assert len(buffer) == 10 and buffer.n_written == 25
+
+    times, values = buffer.window()
+    assert np.array_equal(times, np.arange(15, 25) * 100)
+    assert np.array_equal(values[1], -np.arange(15, 25))
+
+    times, values = buffer.window(t_from_ns=1750)
+    assert np.array_equal(values[0], np.arange(18, 25))
+    # The same samples, as views on the two sides of the wrap-around:
+    time_segments, value_segments = buffer.segments(t_from_ns=1750)
+    assert [len(t) for t in time_segments] == [2, 5]
+    assert np.shares_memory(value_segments[0], buffer.values)
+    assert len(buffer.window(t_from_ns=10 ** 6)[0]) == 0
+
+    buffer.append(2500, [25, -25])
+    times, values = buffer.read_from(24)
+    assert np.array_equal(times, [2400, 2500]) and np.array_equal(values[1], [-24, -25])
+
+
+def test_full_at_a_multiple_of_the_capacity():
+    buffer = ColumnarRingBuffer(["a"], capacity=4)
+    buffer.extend(np.arange(4), np.arange(4)[None, :])
+    assert len(buffer.window(100)[0]) == 0 and buffer.count_since(100) == 0
+    assert np.array_equal(buffer.window(2)[0], [2, 3]) and buffer.count_since(2) == 2
+    buffer.extend(np.arange(4, 8), np.arange(4, 8)[None, :])
+    assert np.array_equal(buffer.window()[0], [4, 5, 6, 7])
+
+
+def test_write_in_progress_is_not_read():
+    buffer = ColumnarRingBuffer(["a"], capacity=4)
+    buffer.extend(np.arange(4), np.arange(4)[None, :])
+    # A writer that announced a sample, and is overwriting the oldest one:
+    buffer._n_writing.value = 5
+    assert np.array_equal(buffer.window(retries=0)[0], [1, 2, 3])
+
+
+def _write_samples(buffer):
+    buffer.extend_from([_Sample(t_ns=i, x=i / 2) for i in range(6)])
+
+
+def test_shared_between_processes():
+    buffer = ColumnarRingBuffer(["x"], capacity=4)
+    writer = Process(target=_write_samples, args=(buffer,))
+    writer.start()
+    writer.join()
+
+    times, values = buffer.window()
+    assert np.array_equal(times, [2, 3, 4, 5])
+    assert np.array_equal(values[0], [1, 1.5, 2, 2.5])
+
+
+def test_min_max_pyramid():
+    rng = np.random.default_rng(0)
+    n = 10 ** 5 + 123
+    values = rng.normal(size=(1, n))
+    values[0, 54321] = 100  # a spike
+    pyramid = MinMaxPyramid(ColumnarRingBuffer(["x"], capacity=n), factor=4)
+    for start in range(0, n, 997):  # in batches not aligned with the bins
+        stop = min(start + 997, n)
+        pyramid.extend(np.arange(start, stop), values[:, start:stop])
+
+    times, decimated = pyramid.window(max_points=1000)
+    assert 500 < len(times) <= 1000 + 2 * 4 * len(pyramid.levels)
+    assert np.all(np.diff(times) >= 0) and times[-1] == n - 1
+    assert decimated.max() == 100 and decimated.min() == values.min()
+
+    # Short windows are raw data:
+    times, decimated = pyramid.window(t_from_ns=n - 100, max_points=1000)
+    assert np.array_equal(decimated, values[:, -100:])
+    # Longer windows are decimated, with the extremes of the window kept (but for
+    # the first, partial bin):
+    times, decimated = pyramid.window(t_from_ns=n - 40000, max_points=1000)
+    assert len(times) <= 1000 + 2 * 4 * len(pyramid.levels)
+    assert times[0] >= n - 40000
+    assert values[0, -40000:].max() >= decimated.max() >= values[0, -39900:].max()
@@ -0,0 +1,62 @@
+import time
+
+import pandas as pd
+import pytest
+
+from sisyphy.core import SphereDataStreamer
+from sisyphy.hardware_readers import MockSphereReaderProcess
+from sisyphy.streamers import FileDataStreamer
+from sisyphy.utils.custom_queue import SaturatingQueue
+from sisyphy.utils.process import TerminableProcess, join_or_kill
+from sisyphy.utils.timebase import monotonic_ns
+
+
+class _StuckProcess(TerminableProcess):
+    def loop(self):
+        time.sleep(100)
+
+
+def test_stop_flushes_all_data(tmp_path):
+    streamer = SphereDataStreamer(
+        mouse_reader_process_class=MockSphereReaderProcess,
+        data_streamer_class=FileDataStreamer,
+        data_path=tmp_path,
+    )
+    streamer.start()
+    time.sleep(1.0)
+    t_stop_ns = monotonic_ns()
+    report = streamer.stop(timeout_s=5)
+
+    assert report.clean
+    assert report.stop_time_s < 2
+    data = pd.read_csv(next(tmp_path.glob("*_data.csv")))
+    # samples are read every 0.1 s, the last ones before the stop are in the file:
+    assert len(data) >= 5
+    assert data["t_ns"].iloc[-1] > t_stop_ns - 2e8
+
+
+def test_join_escalation():
+    process = _StuckProcess()
+    process.start()
+    time.sleep(0.2)
+    process.kill_event.set()
+    assert join_or_kill(process, timeout_s=0.2) == "terminated"
+
+
+def test_end_stream_on_full_queue():
+    queue = SaturatingQueue(maxsize=1)
+    queue.put(0)
+    time.sleep(0.1)
+    with pytest.warns(UserWarning, match="end of stream"):
+        assert not queue.end_stream(sender="reader", timeout=0.1)
+
+
+def test_reader_stops_without_consumer():
+    reader = MockSphereReaderProcess(
+        data_queue=SaturatingQueue(maxsize=1), sample_rate_hz=100
+    )
+    reader.start()
+    time.sleep(0.5)
+    reader.kill_event.set()
+    reader.join(timeout=5)
+    assert reader.exitcode == 0
@@ -0,0 +1,71 @@
+import time
+
+import pandas as pd
+import pytest
+
+from sisyphy.hardware_readers import MockSphereReaderProcess
+from sisyphy.streamers import FileDataStreamer
+from sisyphy.supervisor import Stage, Supervisor
+from sisyphy.utils.custom_queue import SaturatingQueue
+
+
+class _FaultyReader(MockSphereReaderProcess):
+    """Reader crashing or hanging after a few samples."""
+
+    def __init__(self, *args, fault=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fault = fault
+
+    def loop(self):
+        super().loop()
+        if self.fault is not None and self.monitor.n_samples >= 3:
+            if self.fault == "crash":
+                raise RuntimeError("Simulated USB error")
+            time.sleep(100)
+
+
+@pytest.mark.parametrize(
+    "fault, reason", [("crash", "exited"), ("hang", "no heartbeat")]
+)
+def test_restart_faulty_reader(tmp_path, fault, reason):
+    data_queue = SaturatingQueue()
+    n_readers = []
+
+    def make_reader(kill_event):
+        n_readers.append(1)
+        return _FaultyReader(
+            kill_event,
+            data_queue=data_queue,
+            fault=fault if len(n_readers) == 1 else None,
+        )
+
+    supervisor = Supervisor(
+        [
+            Stage("reader", make_reader, stall_timeout_s=0.5, expects_samples=True),
+            Stage(
+                "streamer",
+                lambda kill_event: FileDataStreamer(
+                    kill_event=kill_event,
+                    sphere_data_queue=data_queue,
+                    data_path=tmp_path,
+                ),
+            ),
+        ],
+        check_interval_s=0.1,
+    )
+    with pytest.warns(UserWarning, match="Restarted reader"):
+        supervisor.start()
+        time.sleep(2.0)
+    status = supervisor.status()
+    report = supervisor.stop()
+
+    assert len(supervisor.gaps) == 1
+    assert supervisor.gaps[0].reason.startswith(reason)
+    assert supervisor.gaps[0].n_samples_before == 3
+    assert status.loc["reader", "n_restarts"] == 1
+    assert report.outcomes == dict.fromkeys(report.outcomes, "joined")
+
+    # Data of both readers are in the file, with a gap in between:
+    data = pd.read_csv(next(tmp_path.glob("*_data.csv")))
+    assert len(data) > 6
+    assert data["t_ns"].diff().max() >= supervisor.gaps[0].duration_s * 1e9 * 0.5
@@ -0,0 +1,51 @@
+import time
+
+from sisyphy.utils.custom_queue import SaturatingQueue
+from sisyphy.utils.process import TerminableProcess
+
+
+class _EchoProcess(TerminableProcess):
+    def __init__(self, *args, in_queue=None, **kwargs):
+        super().__init__(*args, wake_sources=[in_queue], **kwargs)
+        self.in_queue = in_queue
+        self.out_queue = SaturatingQueue()
+
+    def loop(self):
+        for item in self.in_queue.get_all():
+            self.out_queue.put(item)
+
+
+def test_periodic_rate():
+    process = TerminableProcess(rate_hz=200)
+    process.start()
+    time.sleep(0.5)
+    process.kill_event.set()
+    process.join(timeout=1)
+
+    stats = process.loop_stats
+    assert 80 <= stats.n_iterations <= 110
+    assert abs(stats.mean_period_s - 0.005) < 0.001
+    assert stats.duty_cycle < 0.5
+
+
+def test_queue_wake_and_stop():
+    in_queue = SaturatingQueue()
+    process = _EchoProcess(in_queue=in_queue, max_wait_s=10)
+    process.start()
+    time.sleep(0.2)
+    assert process.loop_stats.n_iterations == 0  # no busy looping while idle
+
+    for i in range(5):
+        in_queue.put(i)
+        time.sleep(0.02)
+    received = []
+    while len(received) < 5:
+        received.append(process.out_queue.get(timeout=1))
+    assert received == list(range(5))
+
+    # A WakeableEvent stops the process without waiting for max_wait_s:
+    t_stop = time.monotonic()
+    process.kill_event.set()
+    process.join(timeout=2)
+    assert time.monotonic() - t_stop < 1
+    assert 1 <= process.loop_stats.n_iterations <= 5
@@ -0,0 +1,44 @@
+import numpy as np
+
+from sisyphy.utils.timebase import (
+    AnchorRecorder,
+    ClockAnchor,
+    load_anchors,
+    mono_to_wall,
+    monotonic_ns,
+    take_anchor,
+    wall_to_mono,
+)
+
+
+def test_anchor_bracket():
+    t0 = monotonic_ns()
+    anchor = take_anchor()
+    assert anchor.mono_ns >= t0
+    assert anchor.uncertainty_ns >= 0
+
+
+def test_conversion_roundtrip():
+    # Wall clock drifting by 100 ppm and jumping between the second and third anchor:
+    anchors = [
+        ClockAnchor(mono_ns=0, wall_ns=10 ** 18, uncertainty_ns=0),
+        ClockAnchor(mono_ns=10 ** 10, wall_ns=10 ** 18 + 10 ** 10 + 10 ** 6, uncertainty_ns=0),
+        ClockAnchor(mono_ns=2 * 10 ** 10, wall_ns=10 ** 18 + 2 * 10 ** 10 + 5 * 10 ** 6, uncertainty_ns=0),
+    ]
+    mono = np.arange(-10 ** 9, 3 * 10 ** 10, 10 ** 7, dtype=np.int64)
+    wall = mono_to_wall(mono, anchors)
+
+    assert wall.dtype == np.int64
+    assert wall[0] == 10 ** 18 - 10 ** 9  # constant offset before first anchor
+    assert mono_to_wall(5 * 10 ** 9, anchors) == 10 ** 18 + 5 * 10 ** 9 + 5 * 10 ** 5
+    assert np.all(np.diff(wall) > 0)
+    assert np.abs(wall_to_mono(wall, anchors) - mono).max() <= 1
+
+
+def test_recorder_save_load(tmp_path):
+    recorder = AnchorRecorder(period_s=0)
+    for _ in range(3):
+        recorder.maybe_record()
+    recorder.save(tmp_path / "anchors.csv")
+
+    assert load_anchors(tmp_path / "anchors.csv") == recorder.anchors